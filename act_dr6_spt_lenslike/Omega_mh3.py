@@ -1,22 +1,17 @@
 import numpy as np
-import warnings
-from scipy.interpolate import interp1d
-import os
-file_dir = os.path.abspath(os.path.dirname(__file__))
 from cobaya.likelihood import Likelihood
-import healpy as hp
-from scipy.stats import norm
 
 
 
 
 class Omega_mh3(Likelihood):
-    # Data type for aggregated chi2 (case sensitive)
-
-
+    # Gaussian prior on Omega_m h^3
+    mean = 0.09635
+    sigma = 0.000001
 
     def initialize(self):
-        self.norm = norm(loc=0.09635, scale=0.000001)
+        # Normalization of the Gaussian log-density
+        self.lognorm = -np.log(self.sigma) - 0.5*np.log(2.*np.pi)
 
 
     def get_requirements(self):
@@ -25,5 +20,5 @@ class Omega_mh3(Likelihood):
     def logp(self, **params_values):
         h = self.provider.get_param("h")
         omegam = self.provider.get_param("omegam")
-        return self.norm.logpdf(omegam*h**3)
- 
\ No newline at end of file
+        x = (omegam*h**3 - self.mean) / self.sigma
+        return self.lognorm - 0.5*x*x
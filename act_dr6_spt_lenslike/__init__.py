@@ -3,3 +3,12 @@ __author__ = ["Mathew Madhavacheril", "Ian Harrison"]
 __version__ = "1.2.0"
 
 from .act_dr6_spt_lenslike import *
+from .scalecuts import BinMaskScanner, bin_mask, bin_segments
+from .multivariant import MultiVariantLike, default_variants
+
+def __getattr__(name):
+    # Importing the Cobaya likelihood imports cobaya, so it is deferred to its first use
+    if name=='ACTDR6LensLike':
+        from .cobaya_likelihood import ACTDR6LensLike
+        return ACTDR6LensLike
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
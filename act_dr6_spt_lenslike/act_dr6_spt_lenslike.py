@@ -1,10 +1,8 @@
 import numpy as np
 import warnings
-from scipy.interpolate import interp1d
-try:
-    from cobaya.likelihoods.base_classes import InstallableLikelihood
-except:
-    InstallableLikelihood = object
+import contextlib
+import itertools
+import time
 import os
 default_version = "v1.2"
 
@@ -85,47 +83,632 @@ def get_data(data_url="https://lambda.gsfc.nasa.gov/data/suborbital/ACT/ACT_dr6/
 def pp_to_kk(clpp,ell):
     return clpp * (ell*(ell+1.))**2. / 4.
     
+def _calibration_selection(nell):
+    # Multipoles over which the act_calib factor is averaged
+    ols = np.arange(nell)
+    cal_ell_min = 1000
+    cal_ell_max = 2000
+    return np.logical_and(ols>cal_ell_min,ols<cal_ell_max)
+
+def _calibration_factor(data_dict,cltt,act_calib=False,suff=''):
+    # cltt may have leading (sample) dimensions; the returned factor broadcasts against it
+    if act_calib and not('planck' in suff):
+        fcl = data_dict[f'fiducial_cl_tt']
+        sel = _calibration_selection(cltt.shape[-1])
+        return (cltt[...,sel]/fcl[sel]).mean(axis=-1,keepdims=True)
+    else:
+        return 1.0
+
 def get_corrected_clkk(data_dict,clkk,cltt,clte,clee,clbb,suff='',
                        do_norm_corr=True, do_N1kk_corr=True, do_N1cmb_corr=True,
-                       act_calib=False, no_like_cmb_corrections=False):
+                       act_calib=False, no_like_cmb_corrections=False, cache=None):
+    # The spectra can be 1d, or 2d (nsamples x nlen) to correct many at once
     if no_like_cmb_corrections:
         do_norm_corr = False
         do_N1cmb_corr = False
     clkk_fid = data_dict['fiducial_cl_kk']
     cl_dict = {'tt':cltt,'te':clte,'ee':clee,'bb':clbb}
-    if do_N1kk_corr:
-        N1_kk_corr = data_dict[f'dN1_kk{suff}'] @ (clkk-clkk_fid)
-    else:
-        N1_kk_corr = 0
-    dNorm = data_dict[f'dAL_dC{suff}']
-    fid_norm = data_dict[f'fAL{suff}']
-    N1_cmb_corr = 0.
-    norm_corr = 0.
-    
-    if act_calib and not('planck' in suff):
-        ocl = cl_dict['tt']
-        fcl = data_dict[f'fiducial_cl_tt']
-        ols = np.arange(ocl.size)
-        cal_ell_min = 1000
-        cal_ell_max = 2000
-        sel = np.s_[np.logical_and(ols>cal_ell_min,ols<cal_ell_max)]
-        cal_fact = (ocl[sel]/fcl[sel]).mean()
-    else:
-        cal_fact = 1.0
 
-    for i,s in enumerate(['tt','ee','bb','te']):
-        icl = cl_dict[s]
-        cldiff = ((icl/cal_fact)-data_dict[f'fiducial_cl_{s}'])
-        if do_N1cmb_corr:
-            N1_cmb_corr = N1_cmb_corr + (data_dict[f'dN1_{s}{suff}']@cldiff)
-        if do_norm_corr:
-            c = - 2. * (dNorm[i] @ cldiff)
-            if i==0:
-                ls = np.arange(c.size)
-            c[ls>=2] = c[ls>=2] / fid_norm[ls>=2]
-            norm_corr = norm_corr + c
-    nclkk = clkk + norm_corr*clkk_fid + N1_kk_corr + N1_cmb_corr
-    return nclkk
+    def kk_corr():
+        if do_N1kk_corr:
+            return _apply_correction(data_dict,f'dN1_kk{suff}',clkk-clkk_fid)
+        return 0.
+
+    def cmb_corr():
+        fid_norm = data_dict[f'fAL{suff}']
+        N1_cmb_corr = 0.
+        norm_corr = 0.
+        cal_fact = _calibration_factor(data_dict,cl_dict['tt'],act_calib,suff)
+        for i,s in enumerate(['tt','ee','bb','te']):
+            icl = cl_dict[s]
+            cldiff = ((icl/cal_fact)-data_dict[f'fiducial_cl_{s}'])
+            if do_N1cmb_corr:
+                N1_cmb_corr = N1_cmb_corr + _apply_correction(data_dict,f'dN1_{s}{suff}',cldiff)
+            if do_norm_corr:
+                c = - 2. * _apply_correction(data_dict,f'dAL_dC{suff}',cldiff,i)
+                if i==0:
+                    ls = np.arange(c.shape[-1])
+                c[...,ls>=2] = c[...,ls>=2] / fid_norm[ls>=2]
+                norm_corr = norm_corr + c
+        return norm_corr*clkk_fid + N1_cmb_corr
+
+    if cache is None:
+        return clkk + cmb_corr() + kk_corr()
+    key = (_data_token(data_dict),suff,False)
+    cmb = cache.lookup(key+('cmb',do_norm_corr,do_N1cmb_corr,act_calib),(cltt,clee,clbb,clte),cmb_corr)
+    kk = cache.lookup(key+('kk',do_N1kk_corr),(clkk,),kk_corr)
+    return clkk + cmb + kk
+
+def bin_correction_operators(data_dict,binmat,suff=''):
+    """
+    Fold a binning matrix into the likelihood-correction matrices used by
+    get_corrected_clkk, so that the corrections can be applied directly
+    in bandpower space. Returns a dictionary of (nbins x nlen) operators
+    (and a (4 x nbins x nlen) operator for the normalization correction)
+    that get_binned_corrected_clkk uses in place of the full matrices.
+    """
+    d = data_dict
+    ops = {}
+    # Only the rows of the correction matrices within the band of binmat contribute
+    band = slice(*matrix_band(binmat))
+    for s in ['kk','tt','ee','bb','te']:
+        ops[f'binned_dN1_{s}{suff}'] = _bin_correction(d,f'dN1_{s}{suff}',binmat[:,band],band)
+    # The normalization correction is divided by the fiducial N0 for L>=2
+    # and multiplied by the fiducial clkk before binning
+    fid_norm = d[f'fAL{suff}']
+    ls = np.arange(fid_norm.size)
+    nscale = d['fiducial_cl_kk'].copy()
+    nscale[ls>=2] = nscale[ls>=2] / fid_norm[ls>=2]
+    ops[f'binned_dAL_dC{suff}'] = -2. * _bin_correction(d,f'dAL_dC{suff}',(binmat * nscale)[:,band],band)
+    return ops
+
+# The correction matrices can be stored in full (data_dict[name]) or, after
+# compress_corrections, as low-rank factors M = U @ Vt (data_dict[name+'_u']
+# and data_dict[name+'_vt'], stacked along a first axis for dAL_dC)
+
+def _apply_correction(data_dict,name,x,i=None):
+    # x @ M.T for the correction matrix M = data_dict[name] (or its i-th entry)
+    if name in data_dict:
+        m = data_dict[name] if i is None else data_dict[name][i]
+        return _as_operator_dtype(x,m) @ m.T
+    u, vt = data_dict[f'{name}_u'], data_dict[f'{name}_vt']
+    if i is not None: u, vt = u[i], vt[i]
+    return (_as_operator_dtype(x,vt) @ vt.T) @ u.T
+
+def _as_operator_dtype(x,m):
+    # Products with reduced-precision operators are evaluated in that precision,
+    # rather than promoting the (large) operator to the precision of x
+    x = np.asarray(x)
+    if m.dtype.itemsize<x.dtype.itemsize:
+        return x.astype(m.dtype)
+    return x
+
+# Entries of the data dictionary that set_operator_dtype converts
+_operator_prefixes = ('binmat_','binned_','dN1_','dAL_dC')
+
+def set_operator_dtype(data_dict,dtype):
+    """
+    Convert the binning matrices, the likelihood-correction matrices (or
+    their low-rank factors) and the binned correction operators in
+    data_dict to dtype (e.g. np.float32), in place, as done by
+    load_data(...,dtype=dtype). Products with these operators are then
+    evaluated in that precision, which halves the memory traffic of the
+    matrix-vector products in float32. The spectra, data vector, covariance
+    and the quadratic form of the likelihood are not affected.
+    """
+    d = data_dict
+    for name,v in d.items():
+        if name.startswith(_operator_prefixes) and isinstance(v,np.ndarray) and v.ndim>=2 \
+           and np.issubdtype(v.dtype,np.floating):
+            d[name] = v.astype(dtype)
+    return d
+
+def _bin_correction(data_dict,name,binmat,rows=slice(None)):
+    # binmat @ M[rows] for the correction matrix M = data_dict[name]
+    if name in data_dict:
+        return binmat @ data_dict[name][...,rows,:]
+    return (binmat @ data_dict[f'{name}_u'][...,rows,:]) @ data_dict[f'{name}_vt']
+
+def low_rank_factors(mat,error,tol,block=32,seed=0):
+    """
+    Low-rank factors (U,Vt) of a square matrix mat, with mat ~ U @ Vt and
+    U orthonormal, of the smallest rank for which error(U,Vt) <= tol. The
+    rank is grown in blocks with a randomized range finder and then
+    trimmed along the singular vectors of the approximation. error must
+    return the size of the approximation error for given factors. Returns
+    (None,None) if the factors would not be smaller than mat.
+    """
+    n = mat.shape[0]
+    rng = np.random.default_rng(seed)
+    u = np.zeros((n,0))
+    vt = np.zeros((0,n))
+    while error(u,vt)>tol:
+        if 2*(u.shape[1]+block)>=n:
+            return None, None
+        y = mat @ rng.standard_normal((n,block))
+        for _ in range(2):
+            y = y - u @ (u.T @ y)
+        q, _ = np.linalg.qr(y)
+        u = np.hstack([u,q])
+        vt = np.vstack([vt,q.T @ mat])
+    if u.shape[1]==0:
+        return u, vt
+    # Rotate to the singular vectors of U @ Vt, and keep the fewest of them
+    ub, sv, vbt = np.linalg.svd(vt,full_matrices=False)
+    u = u @ ub
+    vt = sv[:,None] * vbt
+    lo, hi = 0, u.shape[1]
+    while lo<hi:
+        mid = (lo+hi)//2
+        if error(u[:,:mid],vt[:mid])<=tol:
+            hi = mid
+        else:
+            lo = mid+1
+    return np.ascontiguousarray(u[:,:hi]), np.ascontiguousarray(vt[:hi])
+
+def compress_corrections(data_dict,tol,nshapes=8):
+    """
+    Replace the likelihood-correction matrices (dN1_* and dAL_dC, and their
+    Planck counterparts) in data_dict by low-rank factors (see
+    low_rank_factors), in place, as done by load_data(...,compress_tol=tol).
+
+    The rank of each matrix is chosen so that the change it causes in the
+    whitened residual L^-1 (data - theory) is at most tol divided by the
+    number of matrices, for reference spectra that differ from the
+    fiducial ones by fractional changes cos(pi k L/trim_lmax) for
+    k < nshapes (of 100% amplitude). The change in the whitened residual is
+    then at most tol, and chi^2 changes by at most about 2 sqrt(chi^2) tol.
+
+    The binned correction operators, if already built, are unaffected: they
+    are (nbins x nlen), so of rank at most nbins, and applying them costs
+    fewer FLOPs than applying any factors of the larger ranks needed here.
+    With binned_corrections (the default), compression therefore only
+    reduces the memory and cache size of the data; the per-call cost only
+    drops with binned_corrections=False, in get_corrected_clkk.
+
+    Returns (and stores as data_dict['compression']) a report giving for
+    each matrix the rank used (None if kept in full) and the resulting
+    error.
+    """
+    d = data_dict
+    blocks = [('',slice(0,d['binmat_act'].shape[0]))]
+    if d['include_planck']:
+        n = blocks[0][1].stop
+        blocks.append(('_planck',slice(n,n+d['binmat_planck'].shape[0])))
+    names = [(f'dN1_{s}{suff}',s,None,suff,seg) for suff,seg in blocks for s in ['kk','tt','ee','bb','te']] + \
+            [(f'dAL_dC{suff}',s,i,suff,seg) for suff,seg in blocks for i,s in enumerate(['tt','ee','bb','te'])]
+    mtol = tol / len(names)
+    nlen = d['fiducial_cl_kk'].size
+    shapes = np.cos(np.pi*np.arange(nshapes)[:,None]*np.arange(nlen)/(nlen-2.))
+    report = {}
+    factors = {}
+    for name,s,i,suff,seg in names:
+        binmat = d['binmat_planck'] if 'planck' in suff else d['binmat_act']
+        if i is None:
+            left = binmat
+            mat = d[name]
+        else:
+            # As in bin_correction_operators
+            fid_norm = d[f'fAL{suff}']
+            ls = np.arange(fid_norm.size)
+            nscale = d['fiducial_cl_kk'].copy()
+            nscale[ls>=2] = nscale[ls>=2] / fid_norm[ls>=2]
+            left = -2. * (binmat * nscale)
+            mat = d[name][i]
+        left = d['whitening'][:,seg] @ left
+        ref = (shapes * d[f'fiducial_cl_{s}']).T
+        exact = left @ (mat @ ref)
+
+        def error(u,vt):
+            return float(np.max(np.linalg.norm(exact - (left @ u) @ (vt @ ref),axis=0)))
+
+        u, vt = low_rank_factors(mat,error,mtol)
+        key = name if i is None else f'{name}[{i}]'
+        if u is None:
+            report[key] = {'rank':None,'error':0.}
+        else:
+            report[key] = {'rank':int(u.shape[1]),'error':error(u,vt)}
+        factors.setdefault(name,[]).append((u,vt))
+
+    for name,fs in factors.items():
+        keys = [name] if len(fs)==1 else [f'{name}[{j}]' for j in range(len(fs))]
+        if any(u is None for u,vt in fs):
+            report.update({k:{'rank':None,'error':0.} for k in keys})
+            continue
+        if len(fs)==1:
+            u, vt = fs[0]
+        else:
+            # Stack the factors of dAL_dC, padding them to a common rank
+            rank = max(u.shape[1] for u,vt in fs)
+            u = np.zeros((len(fs),nlen,rank))
+            vt = np.zeros((len(fs),rank,nlen))
+            for i,(ui,vti) in enumerate(fs):
+                u[i,:,:ui.shape[1]] = ui
+                vt[i,:vti.shape[0]] = vti
+        if u.nbytes+vt.nbytes>=d[name].nbytes:
+            report.update({k:{'rank':None,'error':0.} for k in keys})
+            continue
+        del d[name]
+        d[f'{name}_u'] = u
+        d[f'{name}_vt'] = vt
+    d['compression'] = report
+    return report
+
+def compression_summary(report):
+    """
+    Human-readable summary of the report returned by compress_corrections.
+    """
+    lines = [f"{'matrix':22s} {'rank':>6s} {'error':>10s}"]
+    for key,r in report.items():
+        rank = 'full' if r['rank'] is None else str(r['rank'])
+        lines.append(f"{key:22s} {rank:>6s} {r['error']:10.3g}")
+    return "\n".join(lines)
+
+def get_binned_corrected_clkk(data_dict,clkk,cltt,clte,clee,clbb,suff='',
+                              do_norm_corr=True, do_N1kk_corr=True, do_N1cmb_corr=True,
+                              act_calib=False, no_like_cmb_corrections=False, cache=None, stats=None):
+    """
+    Binned equivalent of binmat @ get_corrected_clkk(...), where binmat
+    is binmat_act (or binmat_planck if suff is '_planck'). If load_data
+    built the binned correction operators, the corrections are applied
+    in bandpower space; otherwise this falls back to the full correction.
+    As for get_corrected_clkk, the spectra can be 2d (nsamples x nlen).
+
+    If a CorrectionCache is passed as cache, the CMB-dependent and the
+    clkk-dependent contributions are each reused from the previous call
+    when their input spectra are unchanged. stats is an optional
+    LikelihoodStats.
+    """
+    stage = _stage_timer(stats)
+    binmat = 'binmat_planck' if 'planck' in suff else 'binmat_act'
+    if f'binned_dN1_kk{suff}' not in data_dict:
+        with stage('corrections'):
+            nclkk = get_corrected_clkk(data_dict,clkk,cltt,clte,clee,clbb,suff=suff,
+                                       do_norm_corr=do_norm_corr,do_N1kk_corr=do_N1kk_corr,
+                                       do_N1cmb_corr=do_N1cmb_corr,act_calib=act_calib,
+                                       no_like_cmb_corrections=no_like_cmb_corrections,
+                                       cache=cache)
+        with stage('binning'):
+            bclkk = banded_product(data_dict,binmat,nclkk)
+        if stats is not None: stats.add_bytes('corrections',nclkk)
+        return bclkk
+    if no_like_cmb_corrections:
+        do_norm_corr = False
+        do_N1cmb_corr = False
+    d = data_dict
+
+    def kk_corr():
+        if do_N1kk_corr:
+            return banded_product(d,f'binned_dN1_kk{suff}',clkk-d['fiducial_cl_kk'])
+        return 0.
+
+    def cmb_corr():
+        bcorr = 0.
+        if not(do_N1cmb_corr or do_norm_corr):
+            return bcorr
+        cl_dict = {'tt':cltt,'te':clte,'ee':clee,'bb':clbb}
+        cal_fact = _calibration_factor(d,cl_dict['tt'],act_calib,suff)
+        for i,s in enumerate(['tt','ee','bb','te']):
+            cldiff = ((cl_dict[s]/cal_fact)-d[f'fiducial_cl_{s}'])
+            if do_N1cmb_corr:
+                bcorr = bcorr + banded_product(d,f'binned_dN1_{s}{suff}',cldiff)
+            if do_norm_corr:
+                bcorr = bcorr + banded_product(d,f'binned_dAL_dC{suff}',cldiff,i)
+        return bcorr
+
+    with stage('binning'):
+        bclkk = banded_product(d,binmat,clkk)
+    with stage('corrections'):
+        if cache is None:
+            bclkk = bclkk + kk_corr() + cmb_corr()
+        else:
+            key = (_data_token(data_dict),suff,True)
+            kk = cache.lookup(key+('kk',do_N1kk_corr),(clkk,),kk_corr)
+            cmb = cache.lookup(key+('cmb',do_norm_corr,do_N1cmb_corr,act_calib),(cltt,clee,clbb,clte),cmb_corr)
+            bclkk = bclkk + kk + cmb
+    return bclkk
+
+_data_tokens = itertools.count()
+
+def _data_token(data_dict):
+    # Identifies data_dict in CorrectionCache keys. It is stored in the
+    # dictionary on first use so that, unlike id(), it is never reused by a
+    # later dictionary.
+    token = data_dict.get('cache_token')
+    if token is None:
+        token = data_dict['cache_token'] = next(_data_tokens)
+    return token
+
+class CorrectionCache(object):
+    """
+    Incremental evaluation cache for the likelihood corrections, for use
+    when only some of the theory spectra change between calls (e.g. when
+    a sampler varies fast parameters such as Alens that only rescale the
+    lensing spectrum). Pass the same instance as the cache argument of
+    generic_lnlike (or get_binned_corrected_clkk) on every call.
+
+    The contributions that depend only on the CMB spectra (the N1 and
+    normalization corrections) and those that depend only on clkk are
+    stored separately along with a copy of their inputs, and reused when
+    the new inputs are bit-identical to the stored ones. Only the most
+    recent value of each contribution is kept. Returned arrays are shared
+    with the cache and must not be modified in place. Data dictionaries are
+    told apart by their cache_token entry, so a copy of one whose
+    correction operators are then changed should not keep it.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self,key,inputs,compute):
+        """
+        Return the value stored under key if it was computed from inputs
+        identical to the given ones; otherwise call compute() and store it.
+        """
+        entry = self.entries.get(key)
+        if entry is not None and all(np.array_equal(a,b) for a,b in zip(entry[0],inputs)):
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        value = compute()
+        self.entries[key] = ([np.array(a,copy=True) for a in inputs],value)
+        return value
+
+    def clear(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+class LikelihoodStats(object):
+    """
+    Opt-in instrumentation of the likelihood evaluation. Pass the same
+    instance as the stats argument of generic_lnlike (or set instrument
+    to True in ACTDR6LensLike) to accumulate, for each stage, the wall
+    time spent in it (times), the number of times it ran (counts) and
+    the size in bytes of the arrays it produced (nbytes). The stages are
+    'standardize', 'corrections', 'binning', 'quadratic_form' and 'total'
+    (and 'inputs', the preparation of the theory spectra, in
+    ACTDR6LensLike). ncalls is the number of likelihood evaluations, and
+    cache_hits / cache_misses count the CorrectionCache lookups made
+    during them.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.times = {}
+        self.counts = {}
+        self.nbytes = {}
+        self.ncalls = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def record(self,name,dt):
+        self.times[name] = self.times.get(name,0.) + dt
+        self.counts[name] = self.counts.get(name,0) + 1
+
+    @contextlib.contextmanager
+    def stage(self,name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name,time.perf_counter()-t0)
+
+    def add_bytes(self,name,*arrays):
+        self.nbytes[name] = self.nbytes.get(name,0) + sum(int(getattr(a,'nbytes',0)) for a in arrays)
+
+    @property
+    def cache_hit_rate(self):
+        nlookups = self.cache_hits + self.cache_misses
+        return self.cache_hits/nlookups if nlookups else None
+
+    def as_dict(self):
+        return {'ncalls':self.ncalls,'times':dict(self.times),'counts':dict(self.counts),
+                'nbytes':dict(self.nbytes),'cache_hits':self.cache_hits,
+                'cache_misses':self.cache_misses,'cache_hit_rate':self.cache_hit_rate}
+
+    def summary(self):
+        """
+        Human-readable table of the accumulated statistics.
+        """
+        lines = [f"{self.ncalls} likelihood evaluations"]
+        for name in sorted(self.times,key=lambda n: -self.times[n]):
+            t = self.times[name]
+            per_call = t/self.ncalls*1e3 if self.ncalls else float('nan')
+            lines.append(f"  {name:15s} {t:10.4f} s  {per_call:9.4f} ms/call  "
+                         f"{self.counts[name]:8d} runs  {self.nbytes.get(name,0)/2**20:10.2f} MB")
+        if self.cache_hit_rate is not None:
+            lines.append(f"  correction cache: {self.cache_hits} hits, {self.cache_misses} misses "
+                         f"({self.cache_hit_rate:.1%} hit rate)")
+        return "\n".join(lines)
+
+_no_stage = contextlib.nullcontext()
+
+def _stage_timer(stats):
+    # Context manager factory timing a named stage, or doing nothing without stats
+    if stats is None:
+        return lambda name: _no_stage
+    return stats.stage
+
+def _binned_operators(data_dict,suff=''):
+    # Binned correction operators, from load_data if it built them
+    if f'binned_dN1_kk{suff}' in data_dict:
+        return data_dict
+    binmat = data_dict['binmat_planck'] if 'planck' in suff else data_dict['binmat_act']
+    return bin_correction_operators(data_dict,binmat,suff)
+
+def _support_lmax(mat):
+    # Largest multipole (last axis index) at which mat has a non-zero entry
+    nonzero = np.nonzero(np.any(np.asarray(mat)!=0,axis=tuple(range(np.ndim(mat)-1))))[0]
+    return int(nonzero[-1]) if nonzero.size else -1
+
+def bin_ranges(binmat):
+    """
+    The multipole range [start,stop) outside which each row (bandpower
+    window) of binmat is zero, as an (nbins x 2) integer array. Rows that
+    are zero everywhere have start==stop.
+    """
+    nonzero = np.asarray(binmat)!=0
+    anyrow = nonzero.any(axis=-1)
+    start = np.where(anyrow,np.argmax(nonzero,axis=-1),0)
+    stop = np.where(anyrow,nonzero.shape[-1]-np.argmax(nonzero[...,::-1],axis=-1),0)
+    return np.stack([start,stop],axis=-1)
+
+def matrix_band(mat):
+    """
+    The column (multipole) range [lo,hi) outside which mat, of any number
+    of dimensions, is zero.
+    """
+    r = bin_ranges(np.reshape(mat,(-1,np.shape(mat)[-1])))
+    r = r[r[:,1]>r[:,0]]
+    if r.size==0:
+        return np.array([0,0])
+    return np.array([r[:,0].min(),r[:,1].max()])
+
+def add_bands(data_dict):
+    """
+    Record the multipole support of the binning matrices and binned
+    correction operators, as a [lo,hi) range in *_band (see matrix_band),
+    which banded_product then uses. Returns the new entries.
+
+    A single band, common to all the bins, is used: the per-bin ranges (see
+    bin_ranges) would skip more zeros, but gathering them is slower than
+    one dense product over the band for windows of these widths.
+    """
+    d = data_dict
+    out = {}
+    for name in list(d.keys()):
+        if name.startswith('binmat_') or name.startswith('binned_'):
+            if isinstance(d[name],np.ndarray) and d[name].ndim>=2:
+                out[f'{name}_band'] = matrix_band(d[name])
+    d.update(out)
+    return out
+
+def banded_product(data_dict,name,x,i=None):
+    """
+    x @ M.T for the matrix M = data_dict[name] (or its i-th entry), only
+    touching the multipoles in the band of M recorded by add_bands. x can
+    be 1d or 2d (nsamples x nell).
+    """
+    m = data_dict[name] if i is None else data_dict[name][i]
+    band = data_dict.get(f'{name}_band')
+    if band is not None:
+        lo, hi = band
+        x, m = x[...,lo:hi], m[...,lo:hi]
+    return _as_operator_dtype(x,m) @ m.T
+
+def get_theory_requirements(data_dict,do_norm_corr=True,act_calib=False,no_actlike_cmb_corrections=False):
+    """
+    The spectra, and the maximum multipole of each, that generic_lnlike
+    actually uses for this data_dict and these options, derived from the
+    support of the binning matrices and of the (binned) likelihood-correction
+    operators. Returns a dictionary like {'kk': lmax_kk, 'tt': lmax_tt, ...};
+    spectra that do not enter the likelihood are omitted. Theory spectra
+    can safely be zero above these multipoles.
+    """
+    def support(name,suff,i=None):
+        op = _binned_operators(data_dict,suff)[f'binned_{name}{suff}']
+        return _support_lmax(op if i is None else op[i])
+    return _theory_requirements(data_dict,support,do_norm_corr,act_calib,no_actlike_cmb_corrections)
+
+def _theory_requirements(d,support,do_norm_corr,act_calib,no_actlike_cmb_corrections):
+    # get_theory_requirements for a data_dict holding at least the binning
+    # matrices, with support(name,suff,i) the largest multipole used by the
+    # binned correction operator of name ('dN1_kk', ..., or entry i of 'dAL_dC')
+    lmaxs = {'kk':_support_lmax(d['binmat_act'])}
+    if d['include_planck']:
+        lmaxs['kk'] = max(lmaxs['kk'],_support_lmax(d['binmat_planck']))
+    if d['include_spt'] or d['include_spt_no_planck']:
+        lmaxs['kk'] = max(lmaxs['kk'],_support_lmax(d['binmat_spt']))
+    if d['likelihood_corrections']:
+        blocks = [('',do_norm_corr,not(no_actlike_cmb_corrections))]
+        if d['include_planck']: blocks.append(('_planck',True,True))
+        for suff,norm_corr,cmb_corr in blocks:
+            lmaxs['kk'] = max(lmaxs['kk'],support('dN1_kk',suff))
+            if not(cmb_corr): continue
+            for i,s in enumerate(['tt','ee','bb','te']):
+                lmax = support(f'dN1_{s}',suff)
+                if norm_corr:
+                    lmax = max(lmax,support('dAL_dC',suff,i))
+                lmaxs[s] = max(lmaxs.get(s,-1),lmax)
+        if act_calib and ('tt' in lmaxs):
+            # Multipoles used for the calibration factor in get_corrected_clkk
+            lmaxs['tt'] = max(lmaxs['tt'],1999)
+    return {s:lmax for s,lmax in lmaxs.items() if lmax>=2}
+
+def file_theory_requirements(variant,ddir=None,version=None,lens_only=False,like_corrections=True,
+                             trim_lmax=2998,act_cmb_rescale=False,spt_start=0,spt_end=None,act_bins=None,
+                             do_norm_corr=True,act_calib=False,no_actlike_cmb_corrections=False):
+    """
+    get_theory_requirements for the data that load_data would return with
+    these options, without loading them: only the binning matrices are
+    read, and the correction matrices are scanned, from their largest
+    multipole down, for the largest one at which the rows used by the
+    binning are non-zero (which is usually found at once). Barring exact
+    cancellations in the binning, the result is the same.
+    """
+    ddir, version = _data_dir(ddir,version)
+    files = data_manifest(variant,lens_only=lens_only,like_corrections=like_corrections,
+                          act_cmb_rescale=act_cmb_rescale)
+    _,_,include_planck,include_spt,include_spt_no_planck,only_spt = parse_variant(variant)
+    store = DataStore(ddir)
+    try:
+        d = _load_binning(store,files,variant,trim_lmax,spt_start,spt_end,act_bins)
+        d.update(include_planck=include_planck,include_spt=include_spt,
+                 include_spt_no_planck=include_spt_no_planck,likelihood_corrections=like_corrections)
+        if like_corrections:
+            # load_data standardizes all the dN1 matrices with the multipoles
+            # of the last normalization read
+            fAL_ls = store.loadtxt(files['fAL_planck' if include_planck else 'fAL'])[0]
+        nlen = trim_lmax + 2
+        def support(name,suff,i=None):
+            rows = matrix_band(d['binmat_planck'] if 'planck' in suff else d['binmat_act'])
+            fname = store.path(files[f'{name}{suff}'])
+            if name=='dAL_dC':
+                # Standardized from multipole 0
+                return _array_support(np.load(fname,mmap_mode='r')[i],rows,nlen)
+            return _text_support(fname,rows,nlen,int(fAL_ls[0]))
+        return _theory_requirements(d,support,do_norm_corr,act_calib,no_actlike_cmb_corrections)
+    finally:
+        store.close()
+
+def _array_support(mat,rows,nlen,cstart=0):
+    # Largest standardized multipole (column) at which the standardized rows
+    # [lo,hi) of mat, whose first row and column are multipole cstart, are
+    # non-zero, or -1
+    lo, hi = max(rows[0]-cstart,0), max(min(rows[1],nlen)-cstart,0)
+    block = mat[lo:hi,:nlen-cstart]
+    for j in range(block.shape[1]-1,-1,-1):
+        if np.any(block[:,j]!=0): return j + cstart
+    return -1
+
+def _text_support(fname,rows,nlen,cstart):
+    # _array_support for a text file, reading only the rows in the range and
+    # stopping as soon as the largest possible multipole is found
+    lo, hi = max(rows[0]-cstart,0), max(min(rows[1],nlen)-cstart,0)
+    ncols = nlen - cstart
+    best = -1
+    with open(fname) as f:
+        for r,line in enumerate(f):
+            if r>=hi or best==ncols-1: break
+            if r<lo: continue
+            vals = line.split()
+            for j in range(min(len(vals),ncols)-1,best,-1):
+                if float(vals[j])!=0:
+                    best = j
+                    break
+    return best + cstart if best>=0 else -1
+
+def _pad_cl(ell,cl,nell):
+    # Zero-pad a spectrum starting at multipole ell[0] so that it extends
+    # up to multipole nell-1, as needed by standardize
+    nmin = nell - int(ell[0])
+    if cl.size>=nmin: return cl
+    out = np.zeros(nmin)
+    out[:cl.size] = cl
+    return out
 
 def standardize(ls,cls,trim_lmax,lbuffer=2,extra_dims="y"):
     cstart = int(ls[0])
@@ -150,30 +733,38 @@ def standardize(ls,cls,trim_lmax,lbuffer=2,extra_dims="y"):
         raise ValueError
     return out
 
-def get_limber_clkk_flat_universe(results,Pfunc,lmax,kmax,nz,zsrc=None):
+def get_limber_clkk_flat_universe(results,Pfunc,lmax,kmax,nz,zsrc=None,quadrature='trapezoid'):
     # Adapting code from Antony Lewis' CAMB notebook
+    # The Weyl power spectrum is evaluated on the full (ell, chi) grid at once
+    # and the chi integral is done with a single matrix-vector product.
+    # quadrature='gauss-legendre' uses nz Gauss-Legendre nodes in chi instead
+    # of nz equally spaced points, which converges with a much smaller nz.
     if zsrc is None:
         chistar = results.conformal_time(0)- results.tau_maxvis
     else:
         chistar = results.comoving_radial_distance(zsrc)
-    chis = np.linspace(0,chistar,nz)
+    if quadrature=='trapezoid':
+        chis = np.linspace(0,chistar,nz)
+        dchis = (chis[2:]-chis[:-2])/2
+        chis = chis[1:-1]
+    elif quadrature=='gauss-legendre':
+        x, wts = np.polynomial.legendre.leggauss(nz)
+        chis = chistar*(x+1.)/2.
+        dchis = wts*chistar/2.
+    else:
+        raise ValueError(f"Unknown quadrature {quadrature}")
     zs=results.redshift_at_comoving_radial_distance(chis)
-    dchis = (chis[2:]-chis[:-2])/2
-    chis = chis[1:-1]
-    zs = zs[1:-1]
     
     #Get lensing window function (flat universe)
     win = ((chistar-chis)/(chis**2*chistar))**2
     #Do integral over chi
     ls = np.arange(0,lmax+2, dtype=np.float64)
     cl_kappa=np.zeros(ls.shape)
-    w = np.ones(chis.shape) #this is just used to set to zero k values out of range of interpolation
-    for i, l in enumerate(ls[2:]):
-        k=(l+0.5)/chis
-        w[:]=1
-        w[k<1e-4]=0
-        w[k>=kmax]=0
-        cl_kappa[i+2] = np.dot(dchis, w*Pfunc.P(zs, k, grid=False)*win/k**4)
+    k = (ls[2:,None]+0.5)/chis[None,:]
+    #this is used to set to zero k values out of range of interpolation
+    w = np.logical_and(k>=1e-4,k<kmax)
+    P = Pfunc.P(np.broadcast_to(zs,k.shape).ravel(), k.ravel(), grid=False).reshape(k.shape)
+    cl_kappa[2:] = (w*P*win/k**4) @ dchis
     cl_kappa*= (ls*(ls+1))**2
     return cl_kappa
 
@@ -237,11 +828,28 @@ so for example,
 chi_square = -2 lnlike
 """
 
+def _data_dir(ddir=None,version=None):
+    if version is None:
+        version = default_version
+
+    if ddir is None:
+        file_dir = os.path.abspath(os.path.dirname(__file__))
+        ddir = f"{file_dir}/data/{version}/"
+
+    if not os.path.exists(ddir):
+        raise FileNotFoundError("Requested data directory {} does not exist.\
+                                Please place the data there. Default data can \
+                                be downloaded to the default location \
+                                with the act_dr6_lenslike.get_data() function.".format(ddir))
+    return ddir, version
+
 def load_data(variant, indep=False, ddir=None,
               lens_only=False,
               apply_hartlap=True,like_corrections=True,mock=False,
               nsims_act=796,nsims_planck=400,trim_lmax=2998,scale_cov=None,
-              version=None, act_cmb_rescale=False, act_calib=False,spt_start=0,spt_end=None):
+              version=None, act_cmb_rescale=False, act_calib=False,spt_start=0,spt_end=None,
+              binned_corrections=True,cache_dir=None,memmap=False,act_bins=None,compress_tol=None,
+              dtype=None):
     """
     Given a data directory path, this function loads into a dictionary
     the data products necessary for evaluating the DR6 lensing likelihood.
@@ -253,25 +861,294 @@ def load_data(variant, indep=False, ddir=None,
     4. data products associated with applying likelihood corrections
 
     All these products will be standardized so that they apply
-    to theory curves specified from L=0 to trim_lmax.
+    to theory curves specified from L=0 to trim_lmax. Only the files
+    listed by data_manifest for the variant and options are read.
+
+    If binned_corrections is True, the binning matrices are also folded
+    into the likelihood-correction matrices (see bin_correction_operators)
+    so that generic_lnlike applies the corrections in bandpower space.
+    The multipole support of the binning matrices and of these operators
+    is recorded (see add_bands), and all binning only touches the
+    multipoles within it.
 
     A Hartlap correction will be applied to the covariance matrix
     corresponding to the lower of the number of simulations involved.
+
+    act_bins can be given as (start,end) to keep the ACT bandpowers
+    start:end instead of those of the baseline (act_baseline_bins) or
+    extended (act_extended_bins) range, e.g. (0,None) for all of them
+    (see BinMaskScanner). It does not apply to the SPT-only variant.
+
+    If mock is True, the data bandpowers are replaced by the binned
+    fiducial lensing spectrum of the likelihood corrections (a noiseless
+    mock); see the mocks module for noisy realizations.
+
+    If compress_tol is given, the likelihood-correction matrices are
+    stored as low-rank factors whose rank is chosen so that the whitened
+    residual changes by at most compress_tol for a set of reference
+    spectra (see compress_corrections). The ranks and errors are printed
+    and kept in data_dict['compression']. The binned correction operators
+    are built from the full matrices, so with binned_corrections this only
+    saves memory and cache size, without changing the likelihood or its
+    cost; with binned_corrections=False it also speeds up get_corrected_clkk.
+
+    If dtype is given (e.g. np.float32), the binning matrices and the
+    likelihood-correction matrices and operators are stored with that
+    precision, and the products with them are evaluated in it (see
+    set_operator_dtype). The data, covariance and the final quadratic form
+    stay in float64.
+
+    If cache_dir is given, the processed dictionary is stored there in
+    binary form (see the cache module), keyed by the arguments of this
+    function, and later calls with the same arguments load it directly.
+    A cache entry is rebuilt automatically if any of the data files it
+    was built from (see data_manifest) change.
+
+    If memmap is also True, the large arrays are returned as read-only
+    memory maps of the cache files instead of being read into memory, so
+    that all processes on a node (e.g. MPI ranks) that load the same
+    variant share the same physical pages. The returned dictionary can be
+    used with generic_lnlike as usual.
     
     """
-    if version is None:
-        version = default_version
+    ddir, version = _data_dir(ddir,version)
+    kwargs = dict(indep=indep,ddir=ddir,lens_only=lens_only,
+                  apply_hartlap=apply_hartlap,like_corrections=like_corrections,mock=mock,
+                  nsims_act=nsims_act,nsims_planck=nsims_planck,trim_lmax=trim_lmax,
+                  scale_cov=scale_cov,version=version,act_cmb_rescale=act_cmb_rescale,
+                  act_calib=act_calib,spt_start=spt_start,spt_end=spt_end,
+                  binned_corrections=binned_corrections,act_bins=act_bins,
+                  compress_tol=compress_tol,dtype=dtype)
+    if cache_dir is None:
+        if memmap: raise ValueError("memmap=True requires a cache_dir to map the data from.")
+        return _load_data(variant,**kwargs)
+
+    from . import cache
+    cache_args = dict(kwargs,variant=variant,ddir=os.path.abspath(ddir))
+    cache_key = cache.cache_key(cache_args)
+    mmap_mode = 'r' if memmap else None
+    # Only one process builds a missing entry; the others wait and then read it
+    with cache.entry_lock(cache_dir,cache_key):
+        d = cache.load_entry(cache_dir,cache_key,mmap_mode=mmap_mode)
+        if d is not None:
+            print(f"Loaded processed likelihood data from cache {cache.entry_path(cache_dir,cache_key)}")
+            return d
+        d = _load_data(variant,**kwargs)
+        files = data_manifest(variant,lens_only=lens_only,like_corrections=like_corrections,
+                              act_cmb_rescale=act_cmb_rescale,mock=mock)
+        sources = cache.describe_sources([os.path.abspath(os.path.join(ddir,f)) for f in sorted(set(files.values()))])
+        cache.save_entry(cache_dir,cache_key,d,cache_args,sources)
+    if memmap:
+        d = cache.load_entry(cache_dir,cache_key,mmap_mode=mmap_mode)
+    return d
 
-    if ddir is None:
-        file_dir = os.path.abspath(os.path.dirname(__file__))
-        ddir = f"{file_dir}/data/{version}/"
+# Data products (relative to the data directory) of the ACT-only bandpowers
+act_bandpower_files = {None:'clkk_bandpowers_act.txt',
+                       'cinpaint':'clkk_bandpowers_act_cinpaint.txt',
+                       'polonly':'clkk_bandpowers_act_polonly.txt',
+                       'cibdeproj':'clkk_bandpowers_act_cibdeproj.txt'}
+spt_file = 'muse_likelihood.npz'
+# Range (start,end) of the ACT bandpowers used for the baseline and extended
+# multipole ranges
+act_baseline_bins = (2,-6)
+act_extended_bins = (2,-3)
+
+def data_manifest(variant,lens_only=False,like_corrections=True,act_cmb_rescale=False,mock=False):
+    """
+    The data products that load_data reads for a variant and these options,
+    as a dictionary mapping each role (e.g. 'act_bandpowers', 'cov',
+    'dN1_kk_planck') to a file name relative to the data directory. Files
+    that are not listed are never opened.
+    """
+    v,baseline,include_planck,include_spt,include_spt_no_planck,only_spt = parse_variant(variant)
+    m = {}
+    if like_corrections:
+        m['fiducial_cmb'] = 'like_corrs/cosmo2017_10K_acc3_lensedCls.dat'
+        m['fiducial_kk'] = 'like_corrs/cosmo2017_10K_acc3_lenspotentialCls.dat'
+    if mock:
+        m['mock_kk'] = 'like_corrs/cosmo2017_10K_acc3_lenspotentialCls.dat'
 
-    if not os.path.exists(ddir):
-        raise FileNotFoundError("Requested data directory {} does not exist.\
-                                Please place the data there. Default data can \
-                                be downloaded to the default location \
-                                with the act_dr6_lenslike.get_data() function.".format(ddir))
+    if only_spt:
+        m['act_bandpowers'] = spt_file
+        m['act_binmat'] = spt_file
+    else:
+        m['act_bandpowers'] = act_bandpower_files[v]
+        m['act_binmat'] = 'binning_matrix_act.txt'
+    if act_cmb_rescale:
+        # This one is read from the working directory
+        m['act_cmb_rescale'] = os.path.abspath("ratio_fid_over_act_wmap.txt")
+
+    if lens_only:
+        if include_planck:
+            if v not in [None,'cinpaint']: raise ValueError(f"Combination of {v} with Planck is not available")
+            m['cov'] = 'covmat_actplanck_cmbmarg.txt'
+        if include_spt:
+            m['cov'] = 'covmat_actplanckspt3g_analytic_offdiagonal.txt'
+        elif include_spt_no_planck:
+            m['cov'] = 'covmat_actspt3g.txt'
+        else:
+            if v=='cibdeproj':
+                m['cov'] = 'covmat_act_cibdeproj_cmbmarg.txt'
+            elif v=='pol':
+                m['cov'] = 'covmat_act_polonly_cmbmarg.txt'
+            elif v=='spt3g':
+                m['cov'] = spt_file
+            else:
+                if not include_planck:
+                    m['cov'] = 'covmat_act_cmbmarg.txt'
+    else:
+        if v not in [None,'cinpaint']: raise ValueError(f"Covmat for {v} without CMB marginalization is not available")
+        if include_planck and include_spt:
+            # When both Planck and SPT are enabled
+            m['cov'] = 'covmat_actplanckspt3g_analytic_offdiagonal_no_cmbmarg.txt'
+        elif include_planck:
+            # When only Planck is enabled
+            m['cov'] = 'covmat_actplanck.txt'
+        elif include_spt_no_planck:
+            # When only SPT (no Planck) is enabled
+            m['cov'] = 'covmat_actspt3g_no_cmbmarg.txt'
+        else:
+            # Default option
+            m['cov'] = 'covmat_act.txt'
+    if 'act' in variant:
+        # The ACT block of the covariance is checked against this one
+        m['act_cov_check'] = 'covmat_act.txt'
+
+    if include_planck:
+        m['planck_bandpowers'] = 'clkk_bandpowers_planck.txt'
+        m['planck_binmat'] = 'binning_matrix_planck.txt'
+    if include_spt or include_spt_no_planck:
+        m['spt'] = spt_file
+
+    if like_corrections:
+        m['dAL_dC'] = 'like_corrs/norm_correction_matrix_Lmin0_Lmax4000.npy'
+        m['fAL'] = 'like_corrs/n0mv_fiducial_lmin600_lmax3000_Lmin0_Lmax4000.txt'
+        for spec in ['kk','tt','ee','bb','te']:
+            m[f'dN1_{spec}'] = f'like_corrs/N1der_{spec.upper()}_lmin600_lmax3000_full.txt'
+        if include_planck:
+            m['dAL_dC_planck'] = 'like_corrs/P18_norm_correction_matrix_Lmin0_Lmax3000.npy'
+            m['fAL_planck'] = 'like_corrs/PLANCK_n0mv_fiducial_lmin600_lmax3000_Lmin0_Lmax3000.txt'
+            for spec in ['kk','tt','ee','bb','te']:
+                m[f'dN1_{spec}_planck'] = f'like_corrs/N1_planck_der_{spec.upper()}_lmin100_lmax2048.txt'
+    return m
+
+class DataStore(object):
+    """
+    Lazy reader for the files in a data directory. Each file (or member of
+    an .npz file) is read on first access only and then reused, so that a
+    file needed for several products is read once. Text files can be read
+    up to max_rows rows, and .npy files are memory-mapped so that only the
+    parts that are used are read from disk.
+    """
+    def __init__(self,ddir):
+        self.ddir = ddir
+        self._arrays = {}
+        self._npz = {}
+
+    def path(self,fname):
+        return os.path.join(self.ddir,fname)
+
+    def loadtxt(self,fname,max_rows=None,**kwargs):
+        key = (fname,max_rows,tuple(sorted(kwargs.items())))
+        if key not in self._arrays:
+            self._arrays[key] = np.loadtxt(self.path(fname),max_rows=max_rows,**kwargs)
+        return self._arrays[key]
+
+    def npy(self,fname):
+        key = (fname,)
+        if key not in self._arrays:
+            self._arrays[key] = np.load(self.path(fname),mmap_mode='r')
+        return self._arrays[key]
+
+    def npz(self,fname,member):
+        key = (fname,member)
+        if key not in self._arrays:
+            if fname not in self._npz:
+                self._npz[fname] = np.load(self.path(fname))
+            self._arrays[key] = self._npz[fname][member]
+        return self._arrays[key]
+
+    def close(self):
+        for f in self._npz.values():
+            f.close()
+        self._npz = {}
+        self._arrays = {}
+
+# Consistency checks of the data files that have passed in this process,
+# keyed by the files (and their sizes and modification times) involved
+_validated = set()
+
+def _file_id(path):
+    st = os.stat(path)
+    return (os.path.abspath(path),st.st_size,st.st_mtime_ns)
+
+def _load_data(variant, indep=False, ddir=None,
+               lens_only=False,
+               apply_hartlap=True,like_corrections=True,mock=False,
+               nsims_act=796,nsims_planck=400,trim_lmax=2998,scale_cov=None,
+               version=None, act_cmb_rescale=False, act_calib=False,spt_start=0,spt_end=None,
+               binned_corrections=True, act_bins=None, compress_tol=None, dtype=None,
+               store=None):
+    # Does the actual work for load_data, without caching. Files are read
+    # through store if one (for the same ddir) is given, e.g. to share them
+    # between variants, and otherwise through a new DataStore.
+    ddir, version = _data_dir(ddir,version)
+    own_store = store is None
+    if own_store:
+        store = DataStore(ddir)
+    try:
+        return _load_products(store, variant, indep=indep, lens_only=lens_only,
+                              apply_hartlap=apply_hartlap, like_corrections=like_corrections, mock=mock,
+                              nsims_act=nsims_act, nsims_planck=nsims_planck, trim_lmax=trim_lmax,
+                              scale_cov=scale_cov, version=version, act_cmb_rescale=act_cmb_rescale,
+                              act_calib=act_calib, spt_start=spt_start, spt_end=spt_end,
+                              binned_corrections=binned_corrections, act_bins=act_bins,
+                              compress_tol=compress_tol, dtype=dtype)
+    finally:
+        if own_store:
+            store.close()
+
+def _act_bin_range(baseline,act_bins=None):
+    # The (start,end) range of the ACT bandpowers that are used
+    if act_bins is not None:
+        return act_bins
+    return act_baseline_bins if baseline else act_extended_bins
+
+def _load_binning(store,files,variant,trim_lmax=2998,spt_start=0,spt_end=None,act_bins=None):
+    # The standardized binning matrices (binmat_act, and binmat_planck and
+    # binmat_spt if included) of a variant and their bin centres
+    v,baseline,include_planck,include_spt,include_spt_no_planck,only_spt = parse_variant(variant)
+    d = {}
+    if v=='spt3g':
+        binmat = store.npz(files['act_binmat'],'bpwf')[spt_start:spt_end,:]
+        d['full_binmat_act'] = binmat.copy()
+        ls = np.arange(1, binmat.shape[1]+1)
+        d['binmat_act'] = standardize(ls,binmat,3100,extra_dims="xy")
+        d['bcents_act'] = binmat@ls
+    else:
+        start, end = _act_bin_range(baseline,act_bins)
+        binmat = store.loadtxt(files['act_binmat'])
+        d['full_binmat_act'] = binmat.copy()
+        ls = np.arange(binmat.shape[1])
+        d['binmat_act'] = standardize(ls,binmat[start:end,:],trim_lmax,extra_dims="xy")
+        d['bcents_act'] = (binmat@ls)[start:end]
 
+    if include_planck:
+        binmat = store.loadtxt(files['planck_binmat'])
+        ls = np.arange(binmat.shape[1])
+        d['binmat_planck'] = standardize(ls,binmat,trim_lmax,extra_dims="xy")
+        d['bcents_planck'] = binmat@ls
+
+    if include_spt or include_spt_no_planck:
+        binmat = store.npz(files['spt'],'bpwf')
+        d['binmat_spt'] = standardize(np.arange(1, binmat.shape[1]+1),binmat,3100,extra_dims="xy")
+        d['bcents_spt'] = binmat@np.arange(binmat.shape[1])
+    return d
+
+def _load_products(store, variant, indep, lens_only, apply_hartlap, like_corrections, mock,
+                   nsims_act, nsims_planck, trim_lmax, scale_cov, version, act_cmb_rescale,
+                   act_calib, spt_start, spt_end, binned_corrections, act_bins, compress_tol,
+                   dtype):
 
     print(f"Loading ACT DR6 lensing likelihood {version}...")
     v,baseline,include_planck,include_spt,include_spt_no_planck, only_spt= parse_variant(variant)
@@ -284,6 +1161,11 @@ def load_data(variant, indep=False, ddir=None,
     if lens_only and like_corrections: raise ValueError("Likelihood corrections should not be used in lens_only runs.")
     if not(lens_only) and not(like_corrections):
         warnings.warn("Neither using CMB-marginalized covariance matrix nor including likelihood corrections. Effective covariance may be underestimated.")
+    if lens_only:
+        if act_cmb_rescale: raise ValueError
+        if act_calib: raise ValueError
+    files = data_manifest(variant,lens_only=lens_only,like_corrections=like_corrections,
+                          act_cmb_rescale=act_cmb_rescale,mock=mock)
 
     d['include_planck'] = include_planck
     d['include_spt'] = include_spt
@@ -291,15 +1173,15 @@ def load_data(variant, indep=False, ddir=None,
     d['likelihood_corrections'] = like_corrections
     d['only_spt'] = only_spt
 
-    # Fiducial spectra
+    # Fiducial spectra; standardize only uses the first trim_lmax+2 multipoles
     if like_corrections:
-        f_ls, f_tt, f_ee, f_bb, f_te = np.loadtxt(f"{ddir}/like_corrs/cosmo2017_10K_acc3_lensedCls.dat",unpack=True)
+        f_ls, f_tt, f_ee, f_bb, f_te = store.loadtxt(files['fiducial_cmb'],unpack=True,max_rows=trim_lmax+2)
         f_tt = f_tt / (f_ls * (f_ls+1.)) * 2. * np.pi
         f_ee = f_ee / (f_ls * (f_ls+1.)) * 2. * np.pi
         f_bb = f_bb / (f_ls * (f_ls+1.)) * 2. * np.pi
         f_te = f_te / (f_ls * (f_ls+1.)) * 2. * np.pi
 
-        fd_ls, f_dd = np.loadtxt(f"{ddir}/like_corrs/cosmo2017_10K_acc3_lenspotentialCls.dat",unpack=True,usecols=[0,5])
+        fd_ls, f_dd = store.loadtxt(files['fiducial_kk'],unpack=True,usecols=(0,5),max_rows=trim_lmax+2)
         f_kk = f_dd * 2. * np.pi / 4.
         d['fiducial_cl_tt'] = standardize(f_ls,f_tt,trim_lmax)
         d['fiducial_cl_te'] = standardize(f_ls,f_te,trim_lmax)
@@ -309,33 +1191,24 @@ def load_data(variant, indep=False, ddir=None,
 
         
     # Return data bandpowers, covariance matrix and binning matrix
-    if baseline:
-        start = 2
-        end = -6
-    else:
-        start = 2
-        end = -3
-
-    if v is None:
-        y = np.loadtxt(f'{ddir}/clkk_bandpowers_act.txt')
-    elif v=='cinpaint':
-        y = np.loadtxt(f'{ddir}/clkk_bandpowers_act_cinpaint.txt')
-    elif v=='polonly':
-        y = np.loadtxt(f'{ddir}/clkk_bandpowers_act_polonly.txt')
-    elif v=='cibdeproj':
-        y = np.loadtxt(f'{ddir}/clkk_bandpowers_act_cibdeproj.txt')
-
-    elif v=='spt3g':  
-        spt_data = np.load(f'{ddir}/muse_likelihood.npz')
-        y=spt_data['d_kk'][spt_start:spt_end]
+    start, end = _act_bin_range(baseline,act_bins)
+
+    if v=='spt3g':  
+        y = store.npz(files['act_bandpowers'],'d_kk')[spt_start:spt_end]
         start = 0
         end = None
-        ell=spt_data['bpwf'][spt_start:spt_end,:]@np.arange(1,5001)
+    else:
+        y = store.loadtxt(files['act_bandpowers'])
 
 
 
     nbins_tot_act = y.size
+    if end is not None and end>=0:
+        # The bins are removed counting from the end
+        end = (end - nbins_tot_act) or None
     d['full_data_binned_clkk_act'] = y.copy()
+    d['act_bin_start'] = start
+    d['act_bin_end'] = nbins_tot_act if end is None else nbins_tot_act + end
     if v=='spt3g': 
         data_act = y.copy() 
     else:
@@ -345,29 +1218,11 @@ def load_data(variant, indep=False, ddir=None,
     nbins_act = data_act.size
         
 
-    binmat = np.loadtxt(f'{ddir}/binning_matrix_act.txt')
-
-    if v=='spt3g':
-        #binmat = spt_data['bpwf']
-        binmat = spt_data['bpwf'][spt_start:spt_end,:]
-        d['full_binmat_act'] = binmat.copy()
-        pells = np.arange(1, binmat.shape[1]+1)
-        bcents = binmat@pells
-        ls = np.arange(1, binmat.shape[1]+1)
-        d['binmat_act'] = standardize(ls,binmat[:,:],3100,extra_dims="xy")
-        d['bcents_act'] = bcents[:].copy()
-
-    else:
-        d['full_binmat_act'] = binmat.copy()
-        pells = np.arange(binmat.shape[1])
-        bcents = binmat@pells
-        ls = np.arange(binmat.shape[1])
-        d['binmat_act'] = standardize(ls,binmat[start:end,:],trim_lmax,extra_dims="xy")
-        d['bcents_act'] = bcents[start:end].copy()
+    d.update(_load_binning(store,files,variant,trim_lmax,spt_start,spt_end,act_bins))
 
     if act_cmb_rescale:
         # load A_L_fid / A_L_ACT and standardize it
-        r = np.loadtxt("ratio_fid_over_act_wmap.txt")
+        r = store.loadtxt(files['act_cmb_rescale']).copy()
         rls = np.arange(r.size)
         r[rls<2] = 0
         rs = standardize(rls,r,trim_lmax)
@@ -378,52 +1233,14 @@ def load_data(variant, indep=False, ddir=None,
         d['data_binned_clkk'] = d['data_binned_clkk'] / rb**2
         
 
-    if lens_only:
-        if act_cmb_rescale: raise ValueError
-        if act_calib: raise ValueError
-        if include_planck:
-            if v not in [None,'cinpaint']: raise ValueError(f"Combination of {v} with Planck is not available")
-            fcov = np.loadtxt(f'{ddir}/covmat_actplanck_cmbmarg.txt')
-        if include_spt:  
-            fcov = np.loadtxt(f'{ddir}/covmat_actplanckspt3g_analytic_offdiagonal.txt')
-            if indep:
-                fcov[:-16, -16:] = 0 # others_x_spt block
-                fcov[-16:, :-16] = 0 # spt_x_others block
-        elif include_spt_no_planck:
-            fcov = np.loadtxt(f'{ddir}/covmat_actspt3g.txt')
-            if indep:
-                fcov[:-16, -16:] = 0 # others_x_spt block
-                fcov[-16:, :-16] = 0 # spt_x_others block
-
-        else:
-            if v=='cibdeproj':
-                fcov = np.loadtxt(f"{ddir}/covmat_act_cibdeproj_cmbmarg.txt")
-            elif v=='pol':
-                fcov = np.loadtxt(f"{ddir}/covmat_act_polonly_cmbmarg.txt")
-            elif v=='spt3g':
-                fcov=spt_data['cov_kk']
-                fcov=fcov[spt_start:spt_end,spt_start:spt_end]
-         
-            
-            else:
-                if not include_planck:
-                    fcov = np.loadtxt(f"{ddir}/covmat_act_cmbmarg.txt")
-
+    if files['cov']==spt_file:
+        fcov = store.npz(files['cov'],'cov_kk')[spt_start:spt_end,spt_start:spt_end]
     else:
-        if v not in [None,'cinpaint']: raise ValueError(f"Covmat for {v} without CMB marginalization is not available")
-      
-        if include_planck and include_spt:
-            # When both Planck and SPT are enabled
-            fcov = np.loadtxt(f'{ddir}/covmat_actplanckspt3g_analytic_offdiagonal_no_cmbmarg.txt')
-        elif include_planck:
-            # When only Planck is enabled
-            fcov = np.loadtxt(f'{ddir}/covmat_actplanck.txt')
-        elif include_spt_no_planck:
-            # When only SPT (no Planck) is enabled
-            fcov = np.loadtxt(f'{ddir}/covmat_actspt3g_no_cmbmarg.txt')
-        else:
-            # Default option
-            fcov = np.loadtxt(f'{ddir}/covmat_act.txt')
+        fcov = store.loadtxt(files['cov'])
+    if lens_only and indep and (include_spt or include_spt_no_planck):
+        fcov = fcov.copy()
+        fcov[:-16, -16:] = 0 # others_x_spt block
+        fcov[-16:, :-16] = 0 # spt_x_others block
 
     d['full_act_cov'] = fcov.copy()
 
@@ -439,60 +1256,72 @@ def load_data(variant, indep=False, ddir=None,
 
 
     if 'act' in variant:
-        covmat = np.loadtxt(f'{ddir}/covmat_act.txt')
-        covmat1 = covmat[start:end,start:end]
-        cdiff = cov[:nbins_act,:nbins_act] - covmat1
-
-        if not(np.all(np.isclose(cdiff,0))): raise ValueError
+        # The check only depends on the files and the ACT bin range, so it
+        # runs once per process
+        check = ('act_cov',_file_id(store.path(files['cov'])),
+                 _file_id(store.path(files['act_cov_check'])),start,end,indep)
+        if check not in _validated:
+            covmat = store.loadtxt(files['act_cov_check'])
+            covmat1 = covmat[start:end,start:end]
+            cdiff = cov[:nbins_act,:nbins_act] - covmat1
+
+            if not(np.all(np.isclose(cdiff,0))): raise ValueError
+            _validated.add(check)
 
     if include_planck:
-        data_planck = np.loadtxt(f'{ddir}/clkk_bandpowers_planck.txt')
+        data_planck = store.loadtxt(files['planck_bandpowers'])
         d['data_binned_clkk'] = np.append(d['data_binned_clkk'],data_planck)
-        binmat = np.loadtxt(f'{ddir}/binning_matrix_planck.txt')
-        pells = np.arange(binmat.shape[1])
-        bcents = binmat@pells
-        ls = np.arange(binmat.shape[1])
-        d['binmat_planck'] = standardize(ls,binmat,trim_lmax,extra_dims="xy")
-        d['bcents_planck'] = bcents.copy()
 
     if include_spt or include_spt_no_planck:
 
-        spt_data = np.load(f'{ddir}/muse_likelihood.npz')
-        data_spt=spt_data['d_kk']
+        data_spt = store.npz(files['spt'],'d_kk')
         d['data_binned_clkk'] = np.append(d['data_binned_clkk'],data_spt)
-        binmat = spt_data['bpwf'][:,:]
-        pells = np.arange(binmat.shape[1])
-        bcents = binmat@pells
-        ls = np.arange(1, binmat.shape[1]+1)
-        d['binmat_spt'] = standardize(ls,binmat,3100,extra_dims="xy")
-        d['bcents_spt'] = bcents.copy()
     
 
 
     if like_corrections:
-        # Load matrices
-        cmat = np.load(f"{ddir}/like_corrs/norm_correction_matrix_Lmin0_Lmax4000.npy")
+        # Load matrices; standardize only uses the first trim_lmax+2 multipoles
+        nrows = trim_lmax+2
+        cmat = store.npy(files['dAL_dC'])
         ls = np.arange(cmat.shape[1])
         d['dAL_dC'] = standardize(ls,cmat,trim_lmax,extra_dims="xyy")
         if include_planck:
-            cmat = np.load(f"{ddir}/like_corrs/P18_norm_correction_matrix_Lmin0_Lmax3000.npy")
+            cmat = store.npy(files['dAL_dC_planck'])
             ls = np.arange(cmat.shape[1])
             d['dAL_dC_planck'] = standardize(ls,cmat,trim_lmax,extra_dims="xyy")
             
 
-        fAL_ls,fAL = np.loadtxt(f"{ddir}/like_corrs/n0mv_fiducial_lmin600_lmax3000_Lmin0_Lmax4000.txt")
+        fAL_ls,fAL = store.loadtxt(files['fAL'])
         d['fAL'] = standardize(fAL_ls,fAL,trim_lmax,extra_dims="y")
         if include_planck:
-            fAL_ls,fAL = np.loadtxt(f"{ddir}/like_corrs/PLANCK_n0mv_fiducial_lmin600_lmax3000_Lmin0_Lmax3000.txt")
+            fAL_ls,fAL = store.loadtxt(files['fAL_planck'])
             d['fAL_planck'] = standardize(fAL_ls,fAL,trim_lmax,extra_dims="y")
 
         for spec in ['kk','tt','ee','bb','te']:
-            n1mat = np.loadtxt(f"{ddir}/like_corrs/N1der_{spec.upper()}_lmin600_lmax3000_full.txt")
+            n1mat = store.loadtxt(files[f'dN1_{spec}'],max_rows=nrows)
             d[f'dN1_{spec}'] = standardize(fAL_ls,n1mat,trim_lmax,extra_dims="yy")
             if include_planck:
-                n1mat = np.loadtxt(f"{ddir}/like_corrs/N1_planck_der_{spec.upper()}_lmin100_lmax2048.txt")
+                n1mat = store.loadtxt(files[f'dN1_{spec}_planck'],max_rows=nrows)
                 d[f'dN1_{spec}_planck'] = standardize(fAL_ls,n1mat,trim_lmax,extra_dims="yy")
 
+        if binned_corrections:
+            # The SPT-only binning matrix is not on the same multipole grid
+            # as the correction matrices, so it keeps the unbinned path
+            if d['binmat_act'].shape[1]==d['dN1_kk'].shape[0]:
+                d.update(bin_correction_operators(d,d['binmat_act']))
+            if include_planck:
+                d.update(bin_correction_operators(d,d['binmat_planck'],'_planck'))
+
+    if mock:
+        # Noiseless mock bandpowers: the binned fiducial lensing spectrum (at
+        # which the likelihood corrections vanish)
+        m_ls, m_dd = store.loadtxt(files['mock_kk'],unpack=True,usecols=(0,5))
+        m_kk = m_dd * 2. * np.pi / 4.
+        zeros = np.zeros(trim_lmax+2)
+        d['data_binned_clkk'] = get_binned_theory(dict(d,likelihood_corrections=False),
+                                                  standardize(m_ls,m_kk,trim_lmax),
+                                                  standardize(m_ls,m_kk,3100),zeros,zeros,zeros,zeros)
+
     nbins = d['data_binned_clkk'].size
     nsims = min(nsims_act,nsims_planck) if include_planck else nsims_act
     hartlap_correction = (nsims-nbins-2.)/(nsims-1.)
@@ -505,141 +1334,518 @@ def load_data(variant, indep=False, ddir=None,
         warnings.warn(f"Covariance has been artificially scaled by: {scale_cov}")
         cov = cov * scale_cov
     d['cov'] = cov
+    d['hartlap_correction'] = hartlap_correction
+    d['nsims'] = nsims
+    # For the Hartlap correction of subsets of the bandpowers (see BinMaskScanner)
+    d['nsims_act'] = nsims_act
+    d['nsims_planck'] = nsims_planck
+    d['apply_hartlap'] = apply_hartlap
     cinv = np.linalg.inv(cov) * hartlap_correction
     d['cinv'] = cinv
+    # The likelihood is evaluated from the Cholesky factor L of the effective
+    # covariance cov / hartlap_correction (whose inverse is cinv), as the norm
+    # of the whitened residual L^-1 (data - theory)
+    d.update(whiten(cov / hartlap_correction, d['data_binned_clkk']))
+
+    # Binning only needs the multipoles that the windows support
+    add_bands(d)
+
+    if compress_tol is not None:
+        if not(like_corrections): raise ValueError("compress_tol requires the likelihood corrections.")
+        report = compress_corrections(d,compress_tol)
+        print("Compressed likelihood-correction matrices:\n"+compression_summary(report))
+
+    if dtype is not None:
+        set_operator_dtype(d,dtype)
 
-    if mock:
-        mclpp = np.loadtxt(f"{ddir}/cls_default_dr6_accuracy.txt",usecols=[5])
-        ls = np.arange(mclpp.size)
-        mclkk = mclpp * 2. * np.pi / 4.
-        self.clkk_data = self.binning_matrix @ mclkk[:self.kLmax]
-    
     return d
     
 
-def generic_lnlike(data_dict,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,trim_lmax=2998,
-                   return_theory=False,do_norm_corr=True,act_calib=False,no_actlike_cmb_corrections=False):
-
-    cl_kk_spt = standardize(ell_kk,cl_kk,3100)
-    cl_kk = standardize(ell_kk,cl_kk,trim_lmax)
-    cl_tt = standardize(ell_cmb,cl_tt,trim_lmax)
-    cl_ee = standardize(ell_cmb,cl_ee,trim_lmax)
-    cl_bb = standardize(ell_cmb,cl_bb,trim_lmax)
-    cl_te = standardize(ell_cmb,cl_te,trim_lmax)
-    
-    d = data_dict
-    cinv = d['cinv']
-    if d['only_spt']:
-        clkk_act = get_corrected_clkk(data_dict,cl_kk,cl_tt,cl_te,cl_ee,cl_bb,
-                                  do_norm_corr=do_norm_corr,act_calib=act_calib,
-                                  no_like_cmb_corrections=no_actlike_cmb_corrections) if d['likelihood_corrections'] else cl_kk_spt
-        bclkk = d['binmat_act'] @ clkk_act
+def whiten(cov,data):
+    """
+    Cholesky factorization of a covariance matrix cov for the likelihood of
+    the bandpowers data. Returns a dictionary with the lower-triangular
+    factor L (cov_chol, with L @ L.T = cov), its inverse (whitening, also
+    lower-triangular), the whitened data L^-1 data (whitened_data) and the
+    log-determinant of cov (logdet_cov), which load_data adds to the data
+    dictionary.
+    """
+    from scipy.linalg import cholesky, solve_triangular
+    chol = cholesky(cov,lower=True)
+    whitening = solve_triangular(chol,np.eye(chol.shape[0]),lower=True)
+    return {'cov_chol':chol,'whitening':whitening,
+            'whitened_data':whitening @ data,
+            'logdet_cov':float(2.*np.sum(np.log(np.diag(chol))))}
+
+def whitened_residual(data_dict,bclkk):
+    """
+    L^-1 (data - bclkk) for the binned theory bclkk, where L is the Cholesky
+    factor of the covariance, so that chi^2 is the squared norm of the
+    result. bclkk can be 1d or 2d (nsamples x nbins).
+    """
+    # Whitening the difference (rather than using whitened_data) avoids
+    # cancellation when the theory is close to the data
+    return (data_dict['data_binned_clkk'] - bclkk) @ data_dict['whitening'].T
 
+def get_binned_theory(data_dict,cl_kk,cl_kk_spt,cl_tt,cl_ee,cl_te,cl_bb,
+                      do_norm_corr=True,act_calib=False,no_actlike_cmb_corrections=False,cache=None,
+                      stats=None):
+    """
+    Binned (and, if enabled, likelihood-corrected) theory vector for
+    spectra that have already been standardized, i.e. cl_kk_spt up to
+    L=3100 and all others up to trim_lmax. The spectra can be 1d, or
+    2d (nsamples x nlen), in which case a (nsamples x nbins) array is
+    returned. cache is an optional CorrectionCache, and stats an
+    optional LikelihoodStats.
+    """
+    d = data_dict
+    stage = _stage_timer(stats)
+    if d['likelihood_corrections']:
+        bclkk = get_binned_corrected_clkk(data_dict,cl_kk,cl_tt,cl_te,cl_ee,cl_bb,
+                                          do_norm_corr=do_norm_corr,act_calib=act_calib,
+                                          no_like_cmb_corrections=no_actlike_cmb_corrections,
+                                          cache=cache,stats=stats)
     else:
-        clkk_act = get_corrected_clkk(data_dict,cl_kk,cl_tt,cl_te,cl_ee,cl_bb,
-                                  do_norm_corr=do_norm_corr,act_calib=act_calib,
-                                  no_like_cmb_corrections=no_actlike_cmb_corrections) if d['likelihood_corrections'] else cl_kk
-        bclkk = d['binmat_act'] @ clkk_act
+        with stage('binning'):
+            bclkk = banded_product(d,'binmat_act',cl_kk_spt if d['only_spt'] else cl_kk)
     if d['include_planck']:
-        clkk_planck = get_corrected_clkk(data_dict,cl_kk,cl_tt,cl_te,cl_ee,cl_bb,'_planck') if d['likelihood_corrections'] else cl_kk
-        bclkk = np.append(bclkk, d['binmat_planck'] @ clkk_planck)
+        if d['likelihood_corrections']:
+            bclkk_planck = get_binned_corrected_clkk(data_dict,cl_kk,cl_tt,cl_te,cl_ee,cl_bb,'_planck',
+                                                     cache=cache,stats=stats)
+        else:
+            with stage('binning'):
+                bclkk_planck = banded_product(d,'binmat_planck',cl_kk)
+        bclkk = np.append(bclkk, bclkk_planck, axis=-1)
     if d['include_spt'] or d['include_spt_no_planck']:
         clkk_spt = cl_kk_spt
-        bclkk = np.append(bclkk, d['binmat_spt'] @ clkk_spt)
+        with stage('binning'):
+            bclkk = np.append(bclkk, banded_product(d,'binmat_spt',clkk_spt), axis=-1)
+    if stats is not None: stats.add_bytes('binning',bclkk)
+    return bclkk
+
+def _corrected_vjp(data_dict,g,suff,cl_dict,do_norm_corr=True,act_calib=False,
+                   no_like_cmb_corrections=False):
+    # Gradients of g @ get_binned_corrected_clkk(...) with respect to the
+    # standardized spectra in cl_dict
+    d = data_dict
+    ops = _binned_operators(d,suff)
+    binmat = d['binmat_planck'] if 'planck' in suff else d['binmat_act']
+    grads = {'kk':g @ binmat + g @ ops[f'binned_dN1_kk{suff}']}
+    do_N1cmb_corr = not(no_like_cmb_corrections)
+    do_norm_corr = do_norm_corr and not(no_like_cmb_corrections)
+    if not(do_N1cmb_corr or do_norm_corr):
+        return grads
+    calibrate = act_calib and not('planck' in suff)
+    cal_fact = _calibration_factor(d,cl_dict['tt'],act_calib,suff)
+    gcal = 0.
+    for i,s in enumerate(['tt','ee','bb','te']):
+        op = 0.
+        if do_N1cmb_corr:
+            op = op + ops[f'binned_dN1_{s}{suff}']
+        if do_norm_corr:
+            op = op + ops[f'binned_dAL_dC{suff}'][i]
+        gdiff = g @ op
+        grads[s] = gdiff / cal_fact
+        if calibrate:
+            gcal = gcal - np.sum(gdiff*cl_dict[s],axis=-1,keepdims=True) / cal_fact**2
+    if calibrate:
+        # The calibration factor is the mean of cl_tt/fiducial_cl_tt over sel
+        fcl = d['fiducial_cl_tt']
+        sel = _calibration_selection(fcl.size)
+        gtt = np.zeros_like(grads['tt'])
+        gtt[...,sel] = gcal / (fcl[sel]*sel.sum())
+        grads['tt'] = grads['tt'] + gtt
+    return grads
+
+def _unstandardize(ls,grad,nell):
+    # Transpose of standardize: the gradient with respect to the nell input
+    # multipoles ls of a gradient with respect to the standardized spectrum
+    cstart = int(ls[0])
+    out = np.zeros(grad.shape[:-1]+(nell,))
+    n = max(min(nell,grad.shape[-1]-cstart),0)
+    out[...,:n] = grad[...,cstart:cstart+n]
+    return out
+
+def binned_theory_vjp(data_dict,g,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,trim_lmax=2998,
+                      do_norm_corr=True,act_calib=False,no_actlike_cmb_corrections=False):
+    """
+    Vector-Jacobian product of the binned theory vector of generic_lnlike
+    (as returned with return_theory=True) with respect to the input
+    spectra: for a vector g over the bandpowers, the gradient of
+    g @ bclkk with respect to cl_kk, cl_tt, cl_ee, cl_te and cl_bb, as a
+    dictionary with keys 'kk', 'tt', 'ee', 'te' and 'bb' of arrays shaped
+    like the corresponding inputs. The binned theory is linear in the
+    spectra, except through the act_calib factor, which is also
+    differentiated. g and the spectra can also be 2d (nsamples x nbins and
+    nsamples x nell), as for generic_lnlike_batch. The options are those
+    of generic_lnlike.
+    """
+    d = data_dict
+    extra_dims = "y" if np.ndim(cl_kk)==1 else "xy"
+    cl_dict = {'tt':cl_tt,'ee':cl_ee,'te':cl_te,'bb':cl_bb}
+    std = {s:standardize(ell_cmb,np.asarray(cl),trim_lmax,extra_dims=extra_dims) for s,cl in cl_dict.items()}
+    g = np.asarray(g,dtype=np.float64)
+    grads = {'kk':0.,'kk_spt':0.,'tt':0.,'ee':0.,'te':0.,'bb':0.}
+
+    def add(block):
+        for s,v in block.items():
+            grads[s] = grads[s] + v
+
+    nact = d['binmat_act'].shape[0]
+    if d['likelihood_corrections']:
+        add(_corrected_vjp(d,g[...,:nact],'',std,do_norm_corr=do_norm_corr,act_calib=act_calib,
+                           no_like_cmb_corrections=no_actlike_cmb_corrections))
+    else:
+        add({'kk_spt' if d['only_spt'] else 'kk':g[...,:nact] @ d['binmat_act']})
+    n = nact
+    if d['include_planck']:
+        gp = g[...,n:n+d['binmat_planck'].shape[0]]
+        n += d['binmat_planck'].shape[0]
+        if d['likelihood_corrections']:
+            add(_corrected_vjp(d,gp,'_planck',std))
+        else:
+            add({'kk':gp @ d['binmat_planck']})
+    if d['include_spt'] or d['include_spt_no_planck']:
+        add({'kk_spt':g[...,n:] @ d['binmat_spt']})
+
+    nkk = np.shape(cl_kk)[-1]
+    out = {'kk':np.zeros(np.shape(cl_kk))}
+    for key in ['kk','kk_spt']:
+        if not np.isscalar(grads[key]):
+            out['kk'] = out['kk'] + _unstandardize(ell_kk,grads[key],nkk)
+    for s,cl in cl_dict.items():
+        if np.isscalar(grads[s]):
+            out[s] = np.zeros(np.shape(cl))
+        else:
+            out[s] = _unstandardize(ell_cmb,grads[s],np.shape(cl)[-1])
+    return out
+
+def generic_lnlike(data_dict,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,trim_lmax=2998,
+                   return_theory=False,do_norm_corr=True,act_calib=False,no_actlike_cmb_corrections=False,
+                   cache=None,stats=None,return_gradient=False):
+    """
+    ln(Likelihood) for a data_dict returned by load_data. If a
+    CorrectionCache is passed as cache, likelihood-correction terms whose
+    input spectra are unchanged since the previous call are reused. If a
+    LikelihoodStats is passed as stats, the time spent in each stage of
+    the evaluation is accumulated in it.
+
+    If return_gradient is True, the gradient of ln(Likelihood) with
+    respect to the input spectra (see binned_theory_vjp) is also returned,
+    after the binned theory if return_theory is True.
+    """
+    if stats is not None:
+        t0 = time.perf_counter()
+        hits0, misses0 = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    stage = _stage_timer(stats)
+    spectra = (cl_kk,cl_tt,cl_ee,cl_te,cl_bb)
+
+    with stage('standardize'):
+        cl_kk_spt = standardize(ell_kk,cl_kk,3100)
+        cl_kk = standardize(ell_kk,cl_kk,trim_lmax)
+        cl_tt = standardize(ell_cmb,cl_tt,trim_lmax)
+        cl_ee = standardize(ell_cmb,cl_ee,trim_lmax)
+        cl_bb = standardize(ell_cmb,cl_bb,trim_lmax)
+        cl_te = standardize(ell_cmb,cl_te,trim_lmax)
+    
+    bclkk = get_binned_theory(data_dict,cl_kk,cl_kk_spt,cl_tt,cl_ee,cl_te,cl_bb,
+                              do_norm_corr=do_norm_corr,act_calib=act_calib,
+                              no_actlike_cmb_corrections=no_actlike_cmb_corrections,
+                              cache=cache,stats=stats)
 
-    delta = d['data_binned_clkk'] - bclkk
+    with stage('quadratic_form'):
+        r = whitened_residual(data_dict,bclkk)
+        lnlike = -0.5 * np.dot(r,r)
 
-    lnlike = -0.5 * np.dot(delta,np.dot(cinv,delta))
+    if stats is not None:
+        _finish_stats(stats,t0,cache,hits0,misses0,(cl_kk_spt,cl_kk,cl_tt,cl_ee,cl_bb,cl_te),r)
 
+    out = (lnlike,)
     if return_theory:
-        return lnlike, bclkk
-    else:
-        return lnlike
+        out = out + (bclkk,)
+    if return_gradient:
+        out = out + (_lnlike_gradient(data_dict,r,ell_kk,ell_cmb,spectra,trim_lmax,do_norm_corr,
+                                      act_calib,no_actlike_cmb_corrections),)
+    return out[0] if len(out)==1 else out
+
+def _lnlike_gradient(data_dict,r,ell_kk,ell_cmb,spectra,trim_lmax,do_norm_corr,act_calib,
+                     no_actlike_cmb_corrections):
+    # With lnlike = -0.5 |r|^2 and r = L^-1 (data - bclkk), the gradient
+    # with respect to bclkk is L^-T r
+    g = r @ data_dict['whitening']
+    return binned_theory_vjp(data_dict,g,ell_kk,spectra[0],ell_cmb,*spectra[1:],trim_lmax=trim_lmax,
+                             do_norm_corr=do_norm_corr,act_calib=act_calib,
+                             no_actlike_cmb_corrections=no_actlike_cmb_corrections)
+
+def _finish_stats(stats,t0,cache,hits0,misses0,standardized,delta,ncalls=1):
+    # Bookkeeping at the end of an instrumented likelihood evaluation
+    stats.record('total',time.perf_counter()-t0)
+    stats.ncalls += ncalls
+    stats.add_bytes('standardize',*standardized)
+    stats.add_bytes('quadratic_form',delta)
+    if cache is not None:
+        stats.cache_hits += cache.hits - hits0
+        stats.cache_misses += cache.misses - misses0
+
+def generic_lnlike_batch(data_dict,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,trim_lmax=2998,
+                         return_theory=False,do_norm_corr=True,act_calib=False,no_actlike_cmb_corrections=False,
+                         stats=None,return_gradient=False):
+    """
+    Batched version of generic_lnlike. The spectra cl_kk, cl_tt, cl_ee,
+    cl_te and cl_bb are 2d arrays of shape (nsamples x nell), all sharing
+    the multipoles ell_kk (for cl_kk) or ell_cmb (for the CMB spectra).
+    The corrections, binning and the quadratic form are evaluated as
+    matrix-matrix products over all samples at once.
+
+    Returns an array of nsamples ln(Likelihood) values and, if
+    return_theory is True, the (nsamples x nbins) binned theory, and if
+    return_gradient is True, the gradients of each ln(Likelihood) (as for
+    generic_lnlike). stats is an optional LikelihoodStats, as for
+    generic_lnlike.
+    """
+    if stats is not None:
+        t0 = time.perf_counter()
+    stage = _stage_timer(stats)
+    spectra = tuple(np.atleast_2d(cl) for cl in (cl_kk,cl_tt,cl_ee,cl_te,cl_bb))
+
+    with stage('standardize'):
+        cl_kk = np.atleast_2d(cl_kk)
+        cl_kk_spt = standardize(ell_kk,cl_kk,3100,extra_dims="xy")
+        cl_kk = standardize(ell_kk,cl_kk,trim_lmax,extra_dims="xy")
+        cl_tt = standardize(ell_cmb,np.atleast_2d(cl_tt),trim_lmax,extra_dims="xy")
+        cl_ee = standardize(ell_cmb,np.atleast_2d(cl_ee),trim_lmax,extra_dims="xy")
+        cl_bb = standardize(ell_cmb,np.atleast_2d(cl_bb),trim_lmax,extra_dims="xy")
+        cl_te = standardize(ell_cmb,np.atleast_2d(cl_te),trim_lmax,extra_dims="xy")
+
+    bclkk = get_binned_theory(data_dict,cl_kk,cl_kk_spt,cl_tt,cl_ee,cl_te,cl_bb,
+                              do_norm_corr=do_norm_corr,act_calib=act_calib,
+                              no_actlike_cmb_corrections=no_actlike_cmb_corrections,
+                              stats=stats)
+
+    with stage('quadratic_form'):
+        r = whitened_residual(data_dict,bclkk)
+        lnlike = -0.5 * np.einsum('ij,ij->i',r,r)
+
+    if stats is not None:
+        _finish_stats(stats,t0,None,0,0,(cl_kk_spt,cl_kk,cl_tt,cl_ee,cl_bb,cl_te),r,ncalls=lnlike.size)
+
+    out = (lnlike,)
+    if return_theory:
+        out = out + (bclkk,)
+    if return_gradient:
+        out = out + (_lnlike_gradient(data_dict,r,ell_kk,ell_cmb,spectra,trim_lmax,do_norm_corr,
+                                      act_calib,no_actlike_cmb_corrections),)
+    return out[0] if len(out)==1 else out
 
-    
-# =================            
-# Cobaya likelihood
-# =================
-
-
-class ACTDR6LensLike(InstallableLikelihood):
-
-    lmax: int = 5000
-    mock = False
-    nsims_act = 792. # Number of sims used for covmat; used in Hartlap correction
-    nsims_planck = 400. # Number of sims used for covmat; used in Hartlap correction
-    no_like_corrections = False
-    no_actlike_cmb_corrections = False
-    lens_only = False
-    # Any ells above this will be discarded; likelihood must at least request ells up to this
-    trim_lmax = 2998
-    variant = "act_baseline"
-    indep = False
-    apply_hartlap = True
-    # Limber integral parameters
-    limber = False
-    nz = 100
-    kmax = 10
-    zmax = None
-    scale_cov = None
-    varying_cmb_alens = False # Whether to divide the theory spectrum by Alens
-    version = None
-    act_cmb_rescale = False
-    act_calib = False
-
-    spt_start=0
-    spt_end=None
-
-    def initialize(self):
-        if self.lens_only: self.no_like_corrections = True
-        if self.lmax<self.trim_lmax: raise ValueError(f"An lmax of at least {self.trim_lmax} is required.")
-        self.data = load_data(variant=self.variant,indep=self.indep,lens_only=self.lens_only,
-                              like_corrections=not(self.no_like_corrections),apply_hartlap=self.apply_hartlap,
-                              mock=self.mock,nsims_act=self.nsims_act,nsims_planck=self.nsims_planck,
-                              trim_lmax=self.trim_lmax,scale_cov=self.scale_cov,version=self.version,
-                              act_cmb_rescale=self.act_cmb_rescale,act_calib=self.act_calib,spt_start=self.spt_start,spt_end=self.spt_end)
-        
-        if self.no_like_corrections:
-            self.requested_cls = ["pp"]
-        else:
-            self.requested_cls = ["tt", "te", "ee", "bb", "pp"]
 
-    def get_requirements(self):
-        if self.no_like_corrections:
-            ret = {'Cl': {'tt': self.lmax,'te': self.lmax,'ee': self.lmax,'pp':self.lmax}}
+def amplitude_lnlike(data_dict,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,trim_lmax=2998,
+                     mode='marginalize',prior=None,do_norm_corr=True,act_calib=False,
+                     no_actlike_cmb_corrections=False,cache=None,stats=None):
+    """
+    ln(Likelihood) of generic_lnlike with cl_kk replaced by A * cl_kk,
+    marginalized (mode='marginalize') or maximized (mode='profile') over
+    the lensing amplitude A. prior is None for a flat prior of unit
+    density, or (mean,sigma) for a Gaussian prior on A, whose log is
+    included in the profiled ln(Likelihood).
+
+    The binned theory, including the likelihood corrections, is affine in
+    cl_kk, so this is done analytically from the theory at A=0 and A=1.
+    Returns ln(Likelihood), the best-fit (or posterior mean) A and its
+    (posterior) standard deviation.
+    """
+    if mode not in ['marginalize','profile']:
+        raise ValueError(f"Unknown amplitude mode {mode}; expected 'marginalize' or 'profile'.")
+    # The theory at A=1 and A=0 in one pass, with the CMB corrections shared
+    cl_kk = np.stack([cl_kk,np.zeros_like(cl_kk)])
+    bclkk = get_binned_theory(data_dict,standardize(ell_kk,cl_kk,trim_lmax,extra_dims="xy"),
+                              standardize(ell_kk,cl_kk,3100,extra_dims="xy"),
+                              *[standardize(ell_cmb,cl,trim_lmax) for cl in (cl_tt,cl_ee,cl_te,cl_bb)],
+                              do_norm_corr=do_norm_corr,act_calib=act_calib,
+                              no_actlike_cmb_corrections=no_actlike_cmb_corrections,
+                              cache=cache,stats=stats)
+    # Whitened residual at A=0 and whitened response to A
+    r0 = whitened_residual(data_dict,bclkk[1])
+    m = (bclkk[0]-bclkk[1]) @ data_dict['whitening'].T
+    fisher = np.dot(m,m)
+    shift = np.dot(m,r0)
+    chi2 = np.dot(r0,r0)
+    if prior is not None:
+        mean, sigma = prior
+        fisher = fisher + 1./sigma**2
+        shift = shift + mean/sigma**2
+        chi2 = chi2 + (mean/sigma)**2
+    amp = shift / fisher
+    lnlike = -0.5 * (chi2 - fisher*amp**2)
+    if mode=='marginalize':
+        if prior is None:
+            lnlike = lnlike + 0.5*np.log(2.*np.pi/fisher)
         else:
-            ret = {'Cl': {'pp':self.lmax}}
+            lnlike = lnlike - 0.5*np.log(fisher*sigma**2)
+    return lnlike, amp, 1./np.sqrt(fisher)
 
-        if self.limber:
-            cobj = get_camb_lens_obj(self.nz,self.kmax,self.zmax)
-            ret.update(cobj)
-            
-        return ret
-
-    def logp(self, **params_values):
-        cl = self.provider.get_Cl(ell_factor=False, units='FIRASmuK2')
-        return self.loglike(cl, **params_values)
-
-    def get_limber_clkk(self,**params_values):
-        Pfunc = self.provider.get_Pk_interpolator(var_pair=("Weyl", "Weyl"), nonlinear=True, extrap_kmax=30.)
-        results = self.provider.get_CAMBdata()
-        return get_limber_clkk_flat_universe(results,Pfunc,self.trim_lmax,self.kmax,nz,zstar=None)
-
-    def loglike(self, cl, **params_values):
-        ell = cl['ell']
-        Alens = 1
-        if self.varying_cmb_alens:
-            Alens = self.provider.get_param('Alens')
-        clpp = cl['pp'] / Alens
-        if self.limber:
-            cl_kk = self.get_limber_clkk( **params_values)
+
+def _fill_standardized(out,ls,cls):
+    # Same layout as standardize, but writes into an existing buffer
+    cstart = int(ls[0])
+    if not(cstart<=2): raise ValueError("Multipoles start at value greater than 2")
+    if int(ls[-1])-cstart != ls.size-1: raise ValueError("Multipoles are not spaced by 1")
+    out[...,:cstart] = 0.
+    out[...,cstart:] = cls[...,:out.shape[-1]-cstart]
+
+
+class CompiledLikelihood(object):
+    """
+    Pre-compiled evaluator for generic_lnlike. With the likelihood
+    corrections linearised around the fiducial, the binned theory vector is
+    an affine function of the stacked (cl_kk, cl_tt, cl_ee, cl_bb, cl_te)
+    vector x,
+
+        bclkk = A @ x + offset
+
+    so after whitening with the Cholesky factor L of the (Hartlap-corrected)
+    covariance, ln(Likelihood) = -0.5 |L^-1 (data - offset) - L^-1 A @ x|^2
+    is a single matrix-vector product and a squared norm.
+
+    The act_calib rescaling is not linear in the CMB spectra; if it is
+    requested, lnlike falls back to generic_lnlike.
+
+    Use compile_likelihood(data_dict) to construct this.
+    """
+
+    def __init__(self,data_dict,trim_lmax=2998,do_norm_corr=True,act_calib=False,
+                 no_actlike_cmb_corrections=False):
+        d = data_dict
+        self.data = data_dict
+        self.trim_lmax = trim_lmax
+        self.do_norm_corr = do_norm_corr
+        self.act_calib = act_calib
+        self.no_actlike_cmb_corrections = no_actlike_cmb_corrections
+
+        nlen = trim_lmax + 2
+        # SPT bandpowers are applied to cl_kk standardized up to L=3100
+        use_spt = d['include_spt'] or d['include_spt_no_planck'] or (d['only_spt'] and not(d['likelihood_corrections']))
+        self.nlen = nlen
+        self.nlen_kk = 3100 + 2 if use_spt else nlen
+        # The CMB spectra only enter through the likelihood corrections
+        use_cmb = d['likelihood_corrections'] and (d['include_planck'] or not(no_actlike_cmb_corrections))
+        self.cmb_specs = ['tt','ee','bb','te'] if use_cmb else []
+        nx = self.nlen_kk + nlen*len(self.cmb_specs)
+
+        # Response matrix and offset for each block of bandpowers
+        if d['likelihood_corrections']:
+            blocks = [self._corrected_response(nx,'',do_norm_corr=do_norm_corr,
+                                               no_like_cmb_corrections=no_actlike_cmb_corrections)]
         else:
-            cl_kk = pp_to_kk(clpp,ell)
-            
-        
-        logp = generic_lnlike(self.data,ell,cl_kk,ell,cl['tt'],cl['ee'],cl['te'],cl['bb'],self.trim_lmax,
-                              do_norm_corr=not(self.act_cmb_rescale),act_calib=self.act_calib,
-                              no_actlike_cmb_corrections=self.no_actlike_cmb_corrections)
-        self.log.debug(
-            f"ACT-DR6-lensing-like lnLike value = {logp} (chisquare = {-2 * logp})")
-        return logp
+            blocks = [self._kk_response(nx,d['binmat_act'])]
+        if d['include_planck']:
+            if d['likelihood_corrections']:
+                blocks.append(self._corrected_response(nx,'_planck'))
+            else:
+                blocks.append(self._kk_response(nx,d['binmat_planck']))
+        if d['include_spt'] or d['include_spt_no_planck']:
+            blocks.append(self._kk_response(nx,d['binmat_spt']))
+        response = np.concatenate([r for r,o in blocks],axis=0)
+        self.offset = np.concatenate([o for r,o in blocks])
+
+        from scipy.linalg import solve_triangular
+        self.chol = d['cov_chol']
+        self.whitened_response = solve_triangular(self.chol,response,lower=True)
+        self.whitened_data = solve_triangular(self.chol,d['data_binned_clkk'] - self.offset,lower=True)
+
+    def _kk_response(self,nx,binmat):
+        r = np.zeros((binmat.shape[0],nx))
+        r[:,:binmat.shape[1]] = binmat
+        return r, np.zeros(binmat.shape[0])
+
+    def _corrected_response(self,nx,suff,do_norm_corr=True,no_like_cmb_corrections=False):
+        d = self.data
+        binmat = d['binmat_planck'] if 'planck' in suff else d['binmat_act']
+        ops = _binned_operators(d,suff)
+        nlen = self.nlen
+        r, _ = self._kk_response(nx,binmat)
+        r[:,:nlen] += ops[f'binned_dN1_kk{suff}']
+        offset = - ops[f'binned_dN1_kk{suff}'] @ d['fiducial_cl_kk']
+        if no_like_cmb_corrections:
+            return r, offset
+        for i,s in enumerate(self.cmb_specs):
+            op = ops[f'binned_dN1_{s}{suff}']
+            if do_norm_corr:
+                op = op + ops[f'binned_dAL_dC{suff}'][i]
+            start = self.nlen_kk + i*nlen
+            r[:,start:start+nlen] = op
+            offset = offset - op @ d[f'fiducial_cl_{s}']
+        return r, offset
+
+    def stack(self,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb):
+        """
+        Return the stacked (cl_kk, cl_tt, cl_ee, cl_bb, cl_te) vector that
+        the compiled response acts on (or a (nsamples x nx) array if the
+        spectra are 2d).
+        """
+        x = np.empty(np.shape(cl_kk)[:-1]+(self.whitened_response.shape[1],))
+        _fill_standardized(x[...,:self.nlen_kk],ell_kk,cl_kk)
+        cl_dict = {'tt':cl_tt,'te':cl_te,'ee':cl_ee,'bb':cl_bb}
+        for i,s in enumerate(self.cmb_specs):
+            start = self.nlen_kk + i*self.nlen
+            _fill_standardized(x[...,start:start+self.nlen],ell_cmb,cl_dict[s])
+        return x
+
+    def lnlike(self,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,return_theory=False):
+        """
+        Same as generic_lnlike(data_dict,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,...)
+        with the options given to compile_likelihood.
+        """
+        if self.act_calib:
+            return generic_lnlike(self.data,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,
+                                  self.trim_lmax,return_theory=return_theory,
+                                  do_norm_corr=self.do_norm_corr,act_calib=True,
+                                  no_actlike_cmb_corrections=self.no_actlike_cmb_corrections)
+        x = self.stack(ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb)
+        wtheory = self.whitened_response @ x
+        r = self.whitened_data - wtheory
+        lnlike = -0.5 * np.dot(r,r)
+        if return_theory:
+            return lnlike, self.chol @ wtheory + self.offset
+        else:
+            return lnlike
+
+    __call__ = lnlike
+
+    def lnlike_batch(self,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,return_theory=False):
+        """
+        Same as generic_lnlike_batch for (nsamples x nell) spectra.
+        """
+        if self.act_calib:
+            return generic_lnlike_batch(self.data,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,
+                                        self.trim_lmax,return_theory=return_theory,
+                                        do_norm_corr=self.do_norm_corr,act_calib=True,
+                                        no_actlike_cmb_corrections=self.no_actlike_cmb_corrections)
+        x = self.stack(ell_kk,np.atleast_2d(cl_kk),ell_cmb,cl_tt,cl_ee,cl_te,cl_bb)
+        wtheory = x @ self.whitened_response.T
+        r = self.whitened_data - wtheory
+        lnlike = -0.5 * np.einsum('ij,ij->i',r,r)
+        if return_theory:
+            return lnlike, wtheory @ self.chol.T + self.offset
+        else:
+            return lnlike
+
+
+def compile_likelihood(data_dict,trim_lmax=2998,do_norm_corr=True,act_calib=False,
+                       no_actlike_cmb_corrections=False):
+    """
+    Compile the likelihood for a data_dict returned by load_data into a
+    single pre-whitened linear response (see CompiledLikelihood). The
+    options are the same as those of generic_lnlike, e.g.
+
+    like = compile_likelihood(data_dict)
+    lnlike = like.lnlike(ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb)
+    """
+    return CompiledLikelihood(data_dict,trim_lmax=trim_lmax,do_norm_corr=do_norm_corr,
+                              act_calib=act_calib,no_actlike_cmb_corrections=no_actlike_cmb_corrections)
+
+def __getattr__(name):
+    # The Cobaya likelihood is only imported (with cobaya) when it is used
+    if name=='ACTDR6LensLike':
+        from .cobaya_likelihood import ACTDR6LensLike
+        return ACTDR6LensLike
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,137 @@
+"""
+On-disk warm-start cache for the processed data_dict returned by load_data.
+
+Each cache entry is a directory named after a hash of the load_data
+arguments, holding one .npy file per array in the data_dict and a
+manifest.json with the remaining (scalar) entries and a record of the
+source data files. An entry is only used if every source file still
+matches the checksum recorded when the entry was written; otherwise it
+is discarded and rebuilt.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Bump this whenever the layout of the data_dict produced by load_data changes
+cache_version = 6
+# Arrays smaller than this are always read into memory, even with mmap_mode
+mmap_min_bytes = 1<<20
+
+def cache_key(args):
+    """
+    Hash of the (JSON-serializable) load_data arguments and the cache version.
+    """
+    s = json.dumps({'cache_version':cache_version,'args':args},sort_keys=True,default=str)
+    return hashlib.sha256(s.encode()).hexdigest()[:32]
+
+def file_checksum(filename,blocksize=1<<22):
+    h = hashlib.sha256()
+    with open(filename,'rb') as f:
+        for block in iter(lambda: f.read(blocksize),b''):
+            h.update(block)
+    return h.hexdigest()
+
+def describe_sources(filenames):
+    out = {}
+    for f in filenames:
+        st = os.stat(f)
+        out[f] = {'size':st.st_size,'mtime_ns':st.st_mtime_ns,'sha256':file_checksum(f)}
+    return out
+
+def sources_unchanged(sources):
+    """
+    Check that the recorded source files are unchanged. The checksum is only
+    recomputed for files whose size or modification time differ from the
+    recorded ones, so a warm start does not need to re-read the data.
+    """
+    for f,rec in sources.items():
+        try:
+            st = os.stat(f)
+        except OSError:
+            return False
+        if st.st_size!=rec['size']: return False
+        if st.st_mtime_ns!=rec['mtime_ns'] and file_checksum(f)!=rec['sha256']: return False
+    return True
+
+def entry_path(cache_dir,key):
+    return os.path.join(os.path.abspath(os.path.expanduser(cache_dir)),key)
+
+@contextlib.contextmanager
+def entry_lock(cache_dir,key):
+    """
+    Exclusive lock on the cache entry for key, held while it is checked and
+    (re)built. Without fcntl (e.g. on Windows) this does nothing.
+    """
+    path = entry_path(cache_dir,key)
+    os.makedirs(os.path.dirname(path),exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock",'a') as f:
+        fcntl.flock(f,fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f,fcntl.LOCK_UN)
+
+def load_entry(cache_dir,key,mmap_mode=None):
+    """
+    Return the cached data_dict for key, or None if there is no valid entry.
+    Stale entries are removed. If mmap_mode is given (e.g. 'r'), arrays of
+    at least mmap_min_bytes are memory-mapped from the cache files rather
+    than read into memory.
+    """
+    path = entry_path(cache_dir,key)
+    try:
+        with open(os.path.join(path,'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError,ValueError):
+        return None
+    if manifest.get('cache_version')!=cache_version or not(sources_unchanged(manifest['sources'])):
+        shutil.rmtree(path,ignore_errors=True)
+        return None
+    d = dict(manifest['scalars'])
+    for k in manifest['arrays']:
+        fname = os.path.join(path,f'{k}.npy')
+        if mmap_mode is not None and os.path.getsize(fname)>=mmap_min_bytes:
+            d[k] = np.load(fname,mmap_mode=mmap_mode)
+        else:
+            d[k] = np.load(fname)
+    return d
+
+def save_entry(cache_dir,key,data_dict,args,sources):
+    """
+    Write data_dict as the cache entry for key. The entry is assembled in a
+    temporary directory and renamed into place, so concurrent writers (e.g.
+    several MPI ranks) never see a partial entry.
+    """
+    path = entry_path(cache_dir,key)
+    os.makedirs(os.path.dirname(path),exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp,ignore_errors=True)
+    os.makedirs(tmp)
+    arrays = []
+    scalars = {}
+    for k,v in data_dict.items():
+        if isinstance(v,np.ndarray):
+            np.save(os.path.join(tmp,f'{k}.npy'),v)
+            arrays.append(k)
+        else:
+            scalars[k] = v.item() if isinstance(v,np.generic) else v
+    manifest = {'cache_version':cache_version,'args':args,'sources':sources,
+                'arrays':arrays,'scalars':scalars}
+    with open(os.path.join(tmp,'manifest.json'),'w') as f:
+        json.dump(manifest,f,default=str)
+    try:
+        os.rename(tmp,path)
+    except OSError:
+        # Another process wrote the same entry first
+        shutil.rmtree(tmp,ignore_errors=True)
+    return path
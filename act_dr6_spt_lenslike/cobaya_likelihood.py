@@ -0,0 +1,204 @@
+"""
+The Cobaya likelihood, in its own module so that importing the package
+does not import cobaya; it is available as
+act_dr6_spt_lenslike.ACTDR6LensLike.
+"""
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+try:
+    from cobaya.likelihoods.base_classes import InstallableLikelihood
+except:
+    InstallableLikelihood = object
+from .act_dr6_spt_lenslike import (load_data, get_theory_requirements, file_theory_requirements,
+                                   generic_lnlike, amplitude_lnlike,
+                                   get_camb_lens_obj, get_limber_clkk_flat_universe, pp_to_kk,
+                                   CorrectionCache, LikelihoodStats, _pad_cl, _stage_timer)
+
+
+class ACTDR6LensLike(InstallableLikelihood):
+
+    # Maximum multipole that the likelihood may request from the theory code;
+    # the multipoles actually requested are derived from the data (see
+    # get_theory_requirements)
+    lmax: int = 5000
+    mock = False
+    nsims_act = 792. # Number of sims used for covmat; used in Hartlap correction
+    nsims_planck = 400. # Number of sims used for covmat; used in Hartlap correction
+    no_like_corrections = False
+    no_actlike_cmb_corrections = False
+    lens_only = False
+    # Any ells above this will be discarded; likelihood must at least request ells up to this
+    trim_lmax = 2998
+    variant = "act_baseline"
+    indep = False
+    apply_hartlap = True
+    # Limber integral parameters
+    limber = False
+    nz = 100
+    kmax = 10
+    zmax = None
+    # 'trapezoid' or 'gauss-legendre' (more accurate for a given nz)
+    limber_quadrature = 'trapezoid'
+    scale_cov = None
+    varying_cmb_alens = False # Whether to divide the theory spectrum by Alens
+    version = None
+    act_cmb_rescale = False
+    act_calib = False
+    # Apply the likelihood corrections in bandpower space (see load_data)
+    binned_corrections = True
+    # Directory for the warm-start cache of the processed data, and whether to
+    # memory-map the large arrays from it so that they are shared between
+    # processes (see load_data)
+    cache_dir = None
+    memmap = False
+    # Reuse the CMB-dependent likelihood corrections between calls in which
+    # only the lensing spectrum changes (see CorrectionCache)
+    cache_corrections = True
+    # Collect per-stage timings and counters (see LikelihoodStats), which are
+    # available as self.stats and logged when the run finishes
+    instrument = False
+    # Marginalize ('marginalize') or maximize ('profile') analytically over an
+    # amplitude multiplying the lensing spectrum, with a flat prior or a
+    # Gaussian one given as [mean,sigma] (see amplitude_lnlike); the best-fit
+    # amplitude is available as the derived parameter lens_amplitude_param
+    lens_amplitude = None
+    lens_amplitude_prior = None
+    lens_amplitude_param = "A_lens_kk"
+    # Load the likelihood-correction products on a background thread while the
+    # theory code initializes; the first likelihood call waits for them. The
+    # theory requirements are then read from the binning and correction files
+    # (see file_theory_requirements)
+    background_load = True
+
+    spt_start=0
+    spt_end=None
+
+    def initialize(self):
+        if self.lens_only: self.no_like_corrections = True
+        if self.lens_amplitude not in [None,False,'marginalize','profile']:
+            raise ValueError(f"Unknown lens_amplitude {self.lens_amplitude}; expected 'marginalize' or 'profile'.")
+        load = partial(load_data,variant=self.variant,indep=self.indep,lens_only=self.lens_only,
+                       like_corrections=not(self.no_like_corrections),apply_hartlap=self.apply_hartlap,
+                       mock=self.mock,nsims_act=self.nsims_act,nsims_planck=self.nsims_planck,
+                       trim_lmax=self.trim_lmax,scale_cov=self.scale_cov,version=self.version,
+                       act_cmb_rescale=self.act_cmb_rescale,act_calib=self.act_calib,spt_start=self.spt_start,spt_end=self.spt_end,
+                       binned_corrections=self.binned_corrections,cache_dir=self.cache_dir,
+                       memmap=self.memmap)
+        # Without the corrections, the data are small and quick to load
+        lmaxs = self._file_requirements() if self.background_load and not(self.no_like_corrections) else None
+        if lmaxs is not None:
+            executor = ThreadPoolExecutor(max_workers=1)
+            self._loading = executor.submit(load)
+            executor.shutdown(wait=False)
+        else:
+            self._loading = None
+            self._data = load()
+            lmaxs = self._exact_requirements(self._data)
+
+        self.theory_lmaxs = {('pp' if s=='kk' else s):lmax for s,lmax in lmaxs.items()}
+        self.theory_lmaxs['pp'] = self.theory_lmaxs.get('pp',2)
+        if max(self.theory_lmaxs.values())>self.lmax:
+            raise ValueError(f"An lmax of at least {max(self.theory_lmaxs.values())} is required.")
+        self.requested_cls = list(self.theory_lmaxs.keys())
+        # Length to which spectra are zero-padded before calling generic_lnlike
+        self.nell = max(self.trim_lmax,3100) + 2
+        self.log.info(f"Requesting Cls up to multipoles {self.theory_lmaxs}")
+        self.correction_cache = CorrectionCache() if self.cache_corrections else None
+        self.stats = LikelihoodStats() if self.instrument else None
+
+    def _exact_requirements(self,data):
+        return get_theory_requirements(data,do_norm_corr=not(self.act_cmb_rescale),act_calib=self.act_calib,
+                                       no_actlike_cmb_corrections=self.no_actlike_cmb_corrections)
+
+    def _file_requirements(self):
+        # The theory requirements without loading the data, or None if they
+        # cannot be read, in which case the data are loaded at once
+        try:
+            return file_theory_requirements(self.variant,version=self.version,lens_only=self.lens_only,
+                                            like_corrections=not(self.no_like_corrections),
+                                            trim_lmax=self.trim_lmax,act_cmb_rescale=self.act_cmb_rescale,
+                                            spt_start=self.spt_start,spt_end=self.spt_end,
+                                            do_norm_corr=not(self.act_cmb_rescale),act_calib=self.act_calib,
+                                            no_actlike_cmb_corrections=self.no_actlike_cmb_corrections)
+        except (OSError,ValueError,KeyError,IndexError) as e:
+            self.log.info(f"Could not read the theory requirements ({e!r}); loading the data now.")
+            return None
+
+    @property
+    def data(self):
+        if self._loading is not None:
+            # Re-raises any error from the background load
+            data = self._loading.result()
+            exact = self._exact_requirements(data)
+            for s,lmax in exact.items():
+                requested = self.theory_lmaxs.get('pp' if s=='kk' else s,-1)
+                if lmax>requested:
+                    raise ValueError(f"An lmax of at least {lmax} is required for Cl_{s}.")
+            self.log.debug(f"Cls used up to multipoles {exact}")
+            self._data = data
+            self._loading = None
+        return self._data
+
+    def get_requirements(self):
+        ret = {'Cl': dict(self.theory_lmaxs)}
+
+        if self.limber:
+            cobj = get_camb_lens_obj(self.nz,self.kmax,self.zmax)
+            ret.update(cobj)
+            
+        return ret
+
+    def get_can_provide_params(self):
+        return [self.lens_amplitude_param] if self.lens_amplitude else []
+
+    def logp(self, **params_values):
+        cl = self.provider.get_Cl(ell_factor=False, units='FIRASmuK2')
+        return self.loglike(cl, **params_values)
+
+    def get_limber_clkk(self,**params_values):
+        Pfunc = self.provider.get_Pk_interpolator(var_pair=("Weyl", "Weyl"), nonlinear=True, extrap_kmax=30.)
+        results = self.provider.get_CAMBdata()
+        return get_limber_clkk_flat_universe(results,Pfunc,self.theory_lmaxs['pp'],self.kmax,self.nz,zsrc=self.zmax,
+                                             quadrature=self.limber_quadrature)
+
+    def loglike(self, cl, _derived=None, **params_values):
+        with _stage_timer(self.stats)('inputs'):
+            ell = cl['ell']
+            Alens = 1
+            if self.varying_cmb_alens:
+                Alens = self.provider.get_param('Alens')
+            clpp = cl['pp'] / Alens
+            if self.limber:
+                cl_kk = self.get_limber_clkk( **params_values)
+                ell_kk = np.arange(cl_kk.size)
+            else:
+                cl_kk = pp_to_kk(clpp,ell)
+                ell_kk = ell
+            cl_kk = _pad_cl(ell_kk,cl_kk,self.nell)
+            ell_kk = np.arange(ell_kk[0],ell_kk[0]+cl_kk.size)
+            # Spectra that were not requested do not enter the likelihood
+            cl_cmb = {s:_pad_cl(ell,cl[s],self.nell) if s in self.requested_cls else np.zeros(self.nell-int(ell[0]))
+                      for s in ['tt','ee','te','bb']}
+            ell_cmb = np.arange(ell[0],ell[0]+cl_cmb['tt'].size)
+        
+        like_kwargs = dict(do_norm_corr=not(self.act_cmb_rescale),act_calib=self.act_calib,
+                           no_actlike_cmb_corrections=self.no_actlike_cmb_corrections,
+                           cache=self.correction_cache,stats=self.stats)
+        if self.lens_amplitude:
+            logp, amp, _ = amplitude_lnlike(self.data,ell_kk,cl_kk,ell_cmb,cl_cmb['tt'],cl_cmb['ee'],cl_cmb['te'],
+                                            cl_cmb['bb'],self.trim_lmax,mode=self.lens_amplitude,
+                                            prior=self.lens_amplitude_prior,**like_kwargs)
+            if _derived is not None:
+                _derived[self.lens_amplitude_param] = amp
+        else:
+            logp = generic_lnlike(self.data,ell_kk,cl_kk,ell_cmb,cl_cmb['tt'],cl_cmb['ee'],cl_cmb['te'],cl_cmb['bb'],
+                                  self.trim_lmax,**like_kwargs)
+        self.log.debug(
+            f"ACT-DR6-lensing-like lnLike value = {logp} (chisquare = {-2 * logp})")
+        return logp
+
+    def close(self, *args):
+        if getattr(self,'stats',None) is not None and self.stats.ncalls:
+            self.log.info("Timing summary:\n" + self.stats.summary())
+        super().close(*args)
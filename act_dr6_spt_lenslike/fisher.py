@@ -0,0 +1,98 @@
+"""
+Fisher-matrix forecasts from the linear response of the binned theory.
+
+Given the derivatives of the spectra with respect to the parameters,
+derivs = {'kk': dcl_kk (nparams x nell_kk), 'tt': dcl_tt (nparams x
+nell_cmb), ...} (spectra that are not given do not vary), and fiducial
+spectra, e.g.
+
+F = fisher_matrix(data_dict,derivs,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb)
+
+is the (nparams x nparams) Fisher matrix R P R^T, where R is the
+derivative of the binned (and likelihood-corrected) theory vector with
+respect to the parameters and P the Hartlap-corrected inverse covariance
+(cinv). R is the Jacobian of the binned theory at the fiducial spectra
+(see binned_theory_vjp), including the likelihood corrections and the
+act_calib factor, applied to derivs.
+
+For scale cuts, masks (as for BinMaskScanner) give a Fisher matrix for
+each subset of the bandpowers, and fisher_matrices evaluates several
+variants at once from the data of a MultiVariantLike.
+"""
+import numpy as np
+from .act_dr6_spt_lenslike import binned_theory_vjp
+from .scalecuts import BinMaskScanner
+
+spectra_names = ['kk','tt','ee','te','bb']
+
+def binned_response(data_dict,derivs,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,trim_lmax=2998,
+                    do_norm_corr=True,act_calib=False,no_actlike_cmb_corrections=False):
+    """
+    Derivatives of the binned theory vector of generic_lnlike with respect
+    to the parameters, as an (nparams x nbins) array, for the spectrum
+    derivatives derivs (see the module documentation) at the fiducial
+    spectra. The options are those of generic_lnlike.
+    """
+    unknown = set(derivs) - set(spectra_names)
+    if unknown: raise ValueError(f"Unknown spectra {sorted(unknown)}; expected some of {spectra_names}.")
+    derivs = {s:np.atleast_2d(v) for s,v in derivs.items()}
+    nparams = {v.shape[0] for v in derivs.values()}
+    if len(nparams)!=1: raise ValueError("The derivatives must be given for the same number of parameters.")
+
+    # The Jacobian, one row per bandpower, from the vector-Jacobian
+    # products with the unit vectors
+    nbins = data_dict['data_binned_clkk'].size
+    fid = dict(zip(spectra_names,[np.asarray(cl,dtype=np.float64) for cl in (cl_kk,cl_tt,cl_ee,cl_te,cl_bb)]))
+    tiled = {s:np.broadcast_to(cl,(nbins,cl.size)) for s,cl in fid.items()}
+    jac = binned_theory_vjp(data_dict,np.eye(nbins),ell_kk,tiled['kk'],ell_cmb,tiled['tt'],tiled['ee'],
+                            tiled['te'],tiled['bb'],trim_lmax=trim_lmax,do_norm_corr=do_norm_corr,
+                            act_calib=act_calib,no_actlike_cmb_corrections=no_actlike_cmb_corrections)
+    response = 0.
+    for s,v in derivs.items():
+        if v.shape[1]!=fid[s].size:
+            raise ValueError(f"The derivatives of cl_{s} have {v.shape[1]} multipoles instead of {fid[s].size}.")
+        response = response + v @ jac[s].T
+    return response
+
+def _fisher(response,precision):
+    return np.matmul(np.matmul(response,precision),response.T)
+
+def fisher_matrix(data_dict,derivs,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,masks=None,trim_lmax=2998,
+                  do_norm_corr=True,act_calib=False,no_actlike_cmb_corrections=False):
+    """
+    (nparams x nparams) Fisher matrix for data_dict (see the module
+    documentation), or, if masks are given, an (nmasks x nparams x
+    nparams) array with one for each subset of the bandpowers (see
+    BinMaskScanner).
+    """
+    response = binned_response(data_dict,derivs,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,
+                               trim_lmax=trim_lmax,do_norm_corr=do_norm_corr,act_calib=act_calib,
+                               no_actlike_cmb_corrections=no_actlike_cmb_corrections)
+    if masks is None:
+        return _fisher(response,data_dict['cinv'])
+    return _fisher(response,BinMaskScanner(data_dict,masks).precisions)
+
+def fisher_matrices(multi_like,derivs,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,masks=None,
+                    do_norm_corr=True,act_calib=False,no_actlike_cmb_corrections=False):
+    """
+    Fisher matrices of all the variants of a MultiVariantLike, as a
+    dictionary. The response is computed once from its shared data. masks
+    can be given as a dictionary of masks (for the data_dict of each
+    variant in multi_like.variant_data) for some of the variants, whose
+    entries are then (nmasks x nparams x nparams) arrays.
+    """
+    ml = multi_like
+    response = binned_response(ml.data,derivs,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,
+                               trim_lmax=ml.trim_lmax,do_norm_corr=do_norm_corr,act_calib=act_calib,
+                               no_actlike_cmb_corrections=no_actlike_cmb_corrections)
+    masks = {} if masks is None else masks
+    unknown = set(masks) - set(ml.variant_data)
+    if unknown: raise ValueError(f"Masks were given for variants {sorted(unknown)} that are not loaded.")
+    out = {}
+    for variant,d in ml.variant_data.items():
+        r = response[:,ml.indices[variant]]
+        if variant in masks:
+            out[variant] = _fisher(r,BinMaskScanner(d,masks[variant]).precisions)
+        else:
+            out[variant] = _fisher(r,d['cinv'])
+    return out
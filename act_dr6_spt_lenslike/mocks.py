@@ -0,0 +1,64 @@
+"""
+Gaussian realizations of the bandpowers, for PTE and bias studies.
+
+The mocks are drawn from the covariance of the data dictionary (including
+any scale_cov, but without the Hartlap correction) around a binned
+theory, e.g. from generic_lnlike(...,return_theory=True):
+
+lnlike, bclkk = generic_lnlike(data_dict,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,return_theory=True)
+p, chi2 = pte(data_dict,bclkk,nmocks=100000)
+
+They are generated and evaluated in chunks of chunk_size, so that the
+memory used does not grow with the number of mocks.
+"""
+import numpy as np
+from .act_dr6_spt_lenslike import whitened_residual
+
+def mock_cholesky(data_dict):
+    """
+    Lower-triangular factor L of the covariance of the mocks, with
+    L @ L.T = data_dict['cov'].
+    """
+    # cov_chol is the factor of cov / hartlap_correction
+    return data_dict['cov_chol'] * np.sqrt(data_dict['hartlap_correction'])
+
+def iter_mocks(data_dict,bclkk,nmocks,chunk_size=10000,seed=None):
+    """
+    Iterate over nmocks realizations of the bandpowers centred on the
+    binned theory bclkk, in (nchunk x nbins) chunks of at most chunk_size.
+    For a given seed, the realizations only depend on chunk_size through
+    rounding.
+    """
+    rng = np.random.default_rng(seed)
+    chol = mock_cholesky(data_dict)
+    for start in range(0,nmocks,chunk_size):
+        z = rng.standard_normal((min(chunk_size,nmocks-start),chol.shape[0]))
+        yield bclkk + z @ chol.T
+
+def _chi2(data_dict,mocks,theory):
+    # chi^2 of each row of mocks for the binned theory
+    r = (mocks - theory) @ data_dict['whitening'].T
+    return np.einsum('ij,ij->i',r,r)
+
+def mock_chi2(data_dict,bclkk,nmocks,theory=None,chunk_size=10000,seed=None):
+    """
+    chi^2 of nmocks realizations centred on the binned theory bclkk (see
+    iter_mocks), evaluated at the binned theory vector theory (default:
+    bclkk), as an array of nmocks values.
+    """
+    if theory is None: theory = bclkk
+    return np.concatenate([_chi2(data_dict,mocks,theory)
+                           for mocks in iter_mocks(data_dict,bclkk,nmocks,chunk_size,seed)])
+
+def pte(data_dict,bclkk,nmocks=10000,chunk_size=10000,seed=None):
+    """
+    Empirical probability to exceed the chi^2 of the data for the binned
+    theory bclkk, from nmocks realizations centred on it (see iter_mocks),
+    counted chunk by chunk. Returns the PTE and the chi^2 of the data.
+    """
+    r = whitened_residual(data_dict,bclkk)
+    chi2 = float(np.dot(r,r))
+    nexceed = 0
+    for mocks in iter_mocks(data_dict,bclkk,nmocks,chunk_size,seed):
+        nexceed += int(np.sum(_chi2(data_dict,mocks,bclkk)>=chi2))
+    return nexceed / nmocks, chi2
@@ -0,0 +1,184 @@
+"""
+ln(Likelihood) of the same theory under several variants at once, e.g. for
+model-comparison tables.
+
+ml = MultiVariantLike(lens_only=True)
+lnlikes = ml.lnlike(ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb)
+# {'act_baseline': ..., 'act_extended': ..., ...}
+
+The variants only differ in which bandpowers they keep and in their
+covariances. The binning and likelihood-correction products are therefore
+loaded once, for the union of the bandpowers of all the variants (all the
+ACT bins, and Planck and SPT if any variant includes them), and the
+(corrected) binned theory is computed once per call for that union. Each
+variant then only holds its data vector, covariance and their whitening,
+and takes its bandpowers from the union theory vector.
+"""
+import hashlib
+import warnings
+import numpy as np
+from .act_dr6_spt_lenslike import (variants as all_variants, parse_variant, data_manifest,
+                                   standardize, get_binned_theory, whitened_residual,
+                                   DataStore, _data_dir, _load_data, load_data)
+from .scalecuts import bin_segments
+
+def default_variants(lens_only=False):
+    """
+    The variants that are available with this lens_only mode (see
+    data_manifest).
+    """
+    out = []
+    for variant in all_variants:
+        try:
+            data_manifest(variant,lens_only=lens_only,like_corrections=not(lens_only))
+        except ValueError:
+            continue
+        out.append(variant)
+    return out
+
+def _union_variant(variants):
+    # The smallest variant whose bandpowers contain those of all the variants
+    flags = [parse_variant(v) for v in variants]
+    planck = any(f[2] for f in flags)
+    spt = any(f[3] or f[4] or f[5] for f in flags)
+    return {(False,False):'act_baseline',(True,False):'actplanck_baseline',
+            (False,True):'actspt3g_baseline',(True,True):'actplanckspt3g_baseline'}[(planck,spt)]
+
+def _binmat_rows(d):
+    # The (standardized) binning matrix of each part of the data vector
+    segments = bin_segments(d)
+    rows = {}
+    for name in segments:
+        rows[name] = d['binmat_planck'] if name=='planck' else \
+            d['binmat_spt'] if name=='spt' and 'binmat_spt' in d else d['binmat_act']
+    return segments, rows
+
+def share_arrays(dicts):
+    """
+    Replace arrays with identical contents in the dictionaries dicts (in
+    place) by a single copy, and return the number of bytes freed.
+    """
+    seen = {}
+    freed = 0
+    for d in dicts:
+        for k,v in d.items():
+            if not isinstance(v,np.ndarray) or v.size==0: continue
+            h = (v.shape,v.dtype.str,hashlib.sha1(np.ascontiguousarray(v).data).hexdigest())
+            if h in seen:
+                if seen[h] is not v and np.array_equal(seen[h],v):
+                    freed += v.nbytes
+                    d[k] = seen[h]
+            else:
+                seen[h] = v
+    return freed
+
+class MultiVariantLike(object):
+    """
+    ln(Likelihood) for several variants (default: all those available with
+    this lens_only mode, see default_variants) from shared data products.
+
+    The remaining keyword arguments are passed to load_data for each
+    variant (e.g. apply_hartlap, scale_cov, indep, spt_start, spt_end) and
+    should be the same as for separate load_data calls. cache_dir is only
+    used for the shared products, which dominate the loading time.
+
+    data holds the shared data dictionary (for all the bandpowers, as
+    returned by load_data), and variant_data the per-variant ones, which
+    only hold the data vectors, covariances and binning matrices, and
+    share identical arrays with each other.
+    """
+    def __init__(self,variants=None,lens_only=False,ddir=None,version=None,trim_lmax=2998,
+                 binned_corrections=True,cache_dir=None,memmap=False,**kwargs):
+        ddir, version = _data_dir(ddir,version)
+        if variants is None:
+            variants = default_variants(lens_only)
+        self.variants = [v.lower().strip() for v in variants]
+        if not self.variants: raise ValueError("No variants were given.")
+        self.lens_only = lens_only
+        self.trim_lmax = trim_lmax
+        like_corrections = not(lens_only)
+        spt_start = kwargs.get('spt_start',0)
+        spt_end = kwargs.get('spt_end',None)
+
+        store = DataStore(ddir)
+        try:
+            self.data = load_data(_union_variant(self.variants),ddir=ddir,version=version,
+                                  lens_only=lens_only,like_corrections=like_corrections,
+                                  trim_lmax=trim_lmax,binned_corrections=binned_corrections,
+                                  act_bins=(0,None),cache_dir=cache_dir,memmap=memmap,
+                                  dtype=kwargs.get('dtype'))
+            self.variant_data = {}
+            with warnings.catch_warnings():
+                # The corrections are applied to the shared theory instead
+                warnings.filterwarnings('ignore',message='Neither using CMB-marginalized')
+                for variant in self.variants:
+                    self.variant_data[variant] = _load_data(variant,ddir=ddir,version=version,
+                                                            lens_only=lens_only,like_corrections=False,
+                                                            trim_lmax=trim_lmax,store=store,**kwargs)
+        finally:
+            store.close()
+        share_arrays([self.data]+list(self.variant_data.values()))
+
+        # Position of the bandpowers of each variant in the shared theory vector
+        union_segments, union_rows = _binmat_rows(self.data)
+        self.indices = {}
+        for variant,d in self.variant_data.items():
+            segments, rows = _binmat_rows(d)
+            idx = []
+            for name,seg in segments.items():
+                useg = union_segments[name]
+                if name=='act':
+                    sub = np.arange(d['act_bin_start'],d['act_bin_end'])
+                elif name=='spt' and d['only_spt']:
+                    sub = np.arange(union_segments['spt'].stop-union_segments['spt'].start)[spt_start:spt_end]
+                else:
+                    sub = np.arange(seg.stop-seg.start)
+                sub = sub + useg.start
+                urows = union_rows[name][sub-useg.start]
+                if urows.shape!=rows[name].shape or not np.array_equal(urows,rows[name]):
+                    raise ValueError(f"The {name} binning of {variant} does not match the shared one.")
+                idx.append(sub)
+            self.indices[variant] = np.concatenate(idx)
+
+    def nbytes(self):
+        """
+        Memory held by the arrays of all the data dictionaries, counting
+        shared arrays once.
+        """
+        seen = {}
+        for d in [self.data]+list(self.variant_data.values()):
+            for v in d.values():
+                if isinstance(v,np.ndarray): seen[id(v)] = v.nbytes
+        return sum(seen.values())
+
+    def lnlike(self,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,return_theory=False,
+               do_norm_corr=True,act_calib=False,no_actlike_cmb_corrections=False,cache=None):
+        """
+        ln(Likelihood) of every variant, as a dictionary, with the same
+        arguments as generic_lnlike. The spectra can also be 2d (nsamples
+        x nell), in which case each entry is an array of nsamples values.
+        If return_theory is True, a dictionary of the binned theory vectors
+        is also returned.
+        """
+        trim_lmax = self.trim_lmax
+        extra_dims = "y" if np.ndim(cl_kk)==1 else "xy"
+        cl_kk_spt = standardize(ell_kk,cl_kk,3100,extra_dims=extra_dims)
+        cl_kk = standardize(ell_kk,cl_kk,trim_lmax,extra_dims=extra_dims)
+        cl_tt = standardize(ell_cmb,cl_tt,trim_lmax,extra_dims=extra_dims)
+        cl_ee = standardize(ell_cmb,cl_ee,trim_lmax,extra_dims=extra_dims)
+        cl_bb = standardize(ell_cmb,cl_bb,trim_lmax,extra_dims=extra_dims)
+        cl_te = standardize(ell_cmb,cl_te,trim_lmax,extra_dims=extra_dims)
+        bclkk = get_binned_theory(self.data,cl_kk,cl_kk_spt,cl_tt,cl_ee,cl_te,cl_bb,
+                                  do_norm_corr=do_norm_corr,act_calib=act_calib,
+                                  no_actlike_cmb_corrections=no_actlike_cmb_corrections,
+                                  cache=cache)
+        lnlikes = {}
+        theories = {}
+        for variant,d in self.variant_data.items():
+            theories[variant] = bclkk[...,self.indices[variant]]
+            r = whitened_residual(d,theories[variant])
+            lnlikes[variant] = -0.5 * np.sum(r*r,axis=-1)
+        if return_theory:
+            return lnlikes, theories
+        else:
+            return lnlikes
@@ -0,0 +1,206 @@
+"""
+Evaluate the ACT DR6 (+SPT) lensing likelihood for every sample of an
+existing chain, e.g. to importance-reweight Planck-only chains.
+
+The theory spectra of the samples are streamed from disk in chunks, in
+one of these formats:
+- a .npy stack of shape (nsamples x nell) holding cl_kk, or (nsamples x
+  nspec x nell) holding cl_kk, cl_tt, cl_ee, cl_te and cl_bb (the first
+  nspec of them), starting at multipole --lmin. The file is memory-mapped,
+  so it can be larger than the available memory.
+- a .npz file with (nsamples x nell) arrays cl_kk (or cl_pp, the lensing
+  potential spectrum) and optionally cl_tt, cl_ee, cl_te and cl_bb, and
+  optionally their multipoles ell (default: starting at --lmin). These
+  arrays are read into memory, so use .npy stacks for very large chains.
+- a directory of text files (one per sample, in sorted order) with the
+  columns ell, cl_kk and optionally cl_tt, cl_ee, cl_te and cl_bb.
+All spectra are C_ell without ell or 2pi factors, with the CMB spectra in
+muK^2, as for generic_lnlike. Missing CMB spectra are taken to be zero,
+which is only appropriate with --lens-only.
+
+Each chunk is evaluated with generic_lnlike_batch, either in this process
+or, with --nproc, in a pool of worker processes. The workers inherit the
+loaded data (when processes are forked) or load it themselves once (use
+--cache-dir to share it through memory maps); only the spectra of each
+chunk and its results are sent between processes.
+
+The output is a text table written (and flushed) chunk by chunk, with
+columns index, lnlike and chi2 and, with --theory, the binned theory
+vector. Importance weights are proportional to exp(lnlike - max(lnlike)).
+
+Usage:
+    act-dr6-reweight chain_cls.npy -o lnlike.txt --variant actplanck_baseline --nproc 4
+"""
+import argparse
+import collections
+import os
+import sys
+import time
+import multiprocessing as mp
+import numpy as np
+from .act_dr6_spt_lenslike import load_data, generic_lnlike_batch, pp_to_kk, variants
+
+spectra_names = ['kk','tt','ee','te','bb']
+
+def _chunk_spectra(specs,nsamples,nell):
+    # Fill in missing spectra with zeros
+    return {s:(np.asarray(specs[s],dtype=np.float64) if s in specs else np.zeros((nsamples,nell)))
+            for s in spectra_names}
+
+def iter_chunks(path,chunk_size=256,lmin=0):
+    """
+    Iterate over the samples of theory spectra stored in path (see the
+    module documentation for the formats) in chunks of chunk_size. Yields
+    (start,ell,specs) with the index of the first sample of the chunk, the
+    multipoles and a dictionary of (nchunk x nell) spectra for 'kk', 'tt',
+    'ee', 'te' and 'bb'.
+    """
+    if os.path.isdir(path):
+        files = sorted(f for f in os.listdir(path) if not f.startswith('.'))
+        for start in range(0,len(files),chunk_size):
+            tables = [np.loadtxt(os.path.join(path,f),ndmin=2) for f in files[start:start+chunk_size]]
+            nell = min(t.shape[0] for t in tables)
+            ell = tables[0][:nell,0]
+            specs = {s:np.stack([t[:nell,i+1] for t in tables]) for i,s in enumerate(spectra_names)
+                     if i+1<tables[0].shape[1]}
+            yield start, ell, _chunk_spectra(specs,len(tables),nell)
+    elif path.endswith('.npy'):
+        stack = np.load(path,mmap_mode='r')
+        if stack.ndim==2:
+            stack = stack[:,None,:]
+        nsamples, nspec, nell = stack.shape
+        ell = np.arange(lmin,lmin+nell)
+        for start in range(0,nsamples,chunk_size):
+            chunk = np.asarray(stack[start:start+chunk_size])
+            specs = {s:chunk[:,i] for i,s in enumerate(spectra_names[:nspec])}
+            yield start, ell, _chunk_spectra(specs,chunk.shape[0],nell)
+    elif path.endswith('.npz'):
+        with np.load(path) as f:
+            if 'cl_kk' in f:
+                cl_kk = f['cl_kk']
+            else:
+                cl_kk = None
+            ell = f['ell'] if 'ell' in f else None
+            if ell is None:
+                nell = (cl_kk if cl_kk is not None else f['cl_pp']).shape[-1]
+                ell = np.arange(lmin,lmin+nell)
+            if cl_kk is None:
+                cl_kk = pp_to_kk(f['cl_pp'],ell)
+            nsamples = cl_kk.shape[0]
+            cmb = {s:f[f'cl_{s}'] for s in spectra_names[1:] if f'cl_{s}' in f}
+            for start in range(0,nsamples,chunk_size):
+                sel = slice(start,start+chunk_size)
+                specs = dict({s:v[sel] for s,v in cmb.items()},kk=cl_kk[sel])
+                yield start, ell, _chunk_spectra(specs,specs['kk'].shape[0],ell.size)
+    else:
+        raise ValueError(f"Unrecognized input {path}: expected a .npy or .npz file or a directory.")
+
+def _pad(ell,specs,lmax):
+    # Zero-pad the spectra up to multipole lmax, as needed by standardize
+    nell = lmax + 1 - int(ell[0])
+    if ell.size>=nell:
+        return ell, specs
+    ell = np.arange(ell[0],ell[0]+nell)
+    return ell, {s:np.pad(v,((0,0),(0,nell-v.shape[1]))) for s,v in specs.items()}
+
+# The data dictionary and options of the evaluating process
+_worker = {}
+
+def _init_worker(load_kwargs,like_kwargs):
+    # Forked workers inherit the data of the parent; others load it once
+    if _worker.get('load_kwargs')!=load_kwargs:
+        _worker.update(data=load_data(**load_kwargs),load_kwargs=load_kwargs)
+    _worker['like_kwargs'] = like_kwargs
+
+def _evaluate(chunk):
+    start, ell, specs = chunk
+    ell, specs = _pad(ell,specs,max(_worker['like_kwargs']['trim_lmax'],3100)+1)
+    lnlike, bclkk = generic_lnlike_batch(_worker['data'],ell,specs['kk'],ell,specs['tt'],specs['ee'],
+                                         specs['te'],specs['bb'],return_theory=True,
+                                         **_worker['like_kwargs'])
+    return start, lnlike, bclkk
+
+def _bounded_imap(pool,func,iterable,maxpending):
+    # Like pool.imap, but without reading ahead more than maxpending items
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func,(item,)))
+        if len(pending)>=maxpending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def reweight(path,output,variant='act_baseline',lens_only=False,chunk_size=256,nproc=1,
+             theory=False,lmin=0,dtype=None,trim_lmax=2998,verbose=True,**load_kwargs):
+    """
+    Evaluate the likelihood for every sample in path (see iter_chunks) and
+    write the results to the text file output as they are computed (see the
+    module documentation). At most 2*nproc chunks are in memory at a time.
+    dtype (e.g. np.float32) and the remaining keyword arguments are passed
+    to load_data. Returns the number of samples evaluated.
+    """
+    load_kwargs = dict(load_kwargs,variant=variant,lens_only=lens_only,trim_lmax=trim_lmax,
+                       like_corrections=not(lens_only),dtype=dtype)
+    like_kwargs = {'trim_lmax':trim_lmax}
+    _init_worker(load_kwargs,like_kwargs)
+    nbins = _worker['data']['data_binned_clkk'].size
+    chunks = iter_chunks(path,chunk_size,lmin)
+
+    pool = None
+    if nproc>1:
+        # With fork the workers share the data already loaded here
+        method = 'fork' if 'fork' in mp.get_all_start_methods() else None
+        pool = mp.get_context(method).Pool(nproc,initializer=_init_worker,
+                                           initargs=(load_kwargs,like_kwargs))
+        results = _bounded_imap(pool,_evaluate,chunks,2*nproc)
+    else:
+        results = map(_evaluate,chunks)
+
+    header = 'index lnlike chi2' + (''.join(f' bclkk_{i}' for i in range(nbins)) if theory else '')
+    nsamples = 0
+    t0 = time.time()
+    try:
+        with open(output,'w') as f:
+            f.write(f'# {header}\n')
+            for start, lnlike, bclkk in results:
+                cols = [np.arange(start,start+lnlike.size),lnlike,-2*lnlike]
+                table = np.column_stack(cols + ([bclkk] if theory else []))
+                np.savetxt(f,table,fmt=['%d']+['%.15g']*(table.shape[1]-1))
+                f.flush()
+                nsamples += lnlike.size
+                if verbose:
+                    print(f"{nsamples} samples ({nsamples/(time.time()-t0):.1f}/s)",flush=True)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return nsamples
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input',help='.npy or .npz file or directory of theory spectra.')
+    parser.add_argument('-o','--output',required=True,help='Output text file.')
+    parser.add_argument('--variant',default='act_baseline',choices=variants)
+    parser.add_argument('--lens-only',action='store_true',help='Use the CMB-marginalized likelihood.')
+    parser.add_argument('--ddir',default=None,help='Data directory (default: the bundled data).')
+    parser.add_argument('--cache-dir',default=None,help='Pass a cache_dir to load_data (memory-mapped).')
+    parser.add_argument('--chunk-size',type=int,default=256,help='Samples per batched evaluation.')
+    parser.add_argument('--nproc',type=int,default=1,help='Number of worker processes.')
+    parser.add_argument('--theory',action='store_true',help='Also write the binned theory.')
+    parser.add_argument('--lmin',type=int,default=0,help='First multipole of .npy/.npz spectra without ell.')
+    parser.add_argument('--trim-lmax',type=int,default=2998)
+    parser.add_argument('--float32',action='store_true',help='Evaluate the operators in single precision.')
+    parser.add_argument('-q','--quiet',action='store_true')
+    args = parser.parse_args(argv)
+
+    load_kwargs = {'ddir':args.ddir}
+    if args.cache_dir is not None:
+        load_kwargs.update(cache_dir=args.cache_dir,memmap=True)
+    n = reweight(args.input,args.output,variant=args.variant,lens_only=args.lens_only,
+                 chunk_size=args.chunk_size,nproc=args.nproc,theory=args.theory,lmin=args.lmin,
+                 dtype=np.float32 if args.float32 else None,trim_lmax=args.trim_lmax,
+                 verbose=not(args.quiet),**load_kwargs)
+    print(f"Wrote {n} samples to {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
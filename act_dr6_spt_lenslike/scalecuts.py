@@ -0,0 +1,186 @@
+"""
+Chi-square of theory spectra for many subsets of the bandpowers at once,
+for scale-cut and consistency tests.
+
+The data are loaded once with all the bandpowers of interest, e.g.
+
+d = load_data('actplanckspt3g_baseline',act_bins=(0,None))
+masks = [bin_mask(d,act=act_baseline_bins),bin_mask(d,act=(2,-3),planck=False),...]
+scanner = BinMaskScanner(d,masks)
+lnlikes = scanner.lnlike(ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb)
+
+and the inverse of the covariance of each subset is obtained from the
+inverse of the full covariance (through a Schur complement) instead of
+loading and inverting the data again. The theory is binned once for all
+the bandpowers, and the chi-square of every subset is then a single
+batched product.
+"""
+import numpy as np
+from .act_dr6_spt_lenslike import standardize, get_binned_theory
+
+def bin_segments(data_dict):
+    """
+    The position of the bandpowers of each experiment in the data vector of
+    data_dict, as a dictionary mapping 'act', 'planck' and 'spt' to slices
+    (for those included). For the SPT-only variant, the data vector is 'spt'.
+    """
+    d = data_dict
+    n = d['binmat_act'].shape[0]
+    segments = {('spt' if d['only_spt'] else 'act'): slice(0,n)}
+    if d['include_planck']:
+        segments['planck'] = slice(n,n+d['binmat_planck'].shape[0])
+        n = segments['planck'].stop
+    if d['include_spt'] or d['include_spt_no_planck']:
+        segments['spt'] = slice(n,n+d['binmat_spt'].shape[0])
+    return segments
+
+def _select(n,sel):
+    sub = np.zeros(n,dtype=bool)
+    if sel is None or sel is True:
+        sub[:] = True
+    elif sel is False:
+        pass
+    elif isinstance(sel,tuple):
+        sub[slice(*sel)] = True
+    else:
+        sub[sel] = True
+    return sub
+
+def bin_mask(data_dict,**selections):
+    """
+    Boolean mask over the data vector of data_dict. Each keyword (act,
+    planck or spt, see bin_segments) selects the bins of that experiment
+    to keep: True or None for all of them, False for none, or a (start,end)
+    tuple, slice, or array of indices or booleans. The ACT bins are counted
+    among all the ACT bandpowers (as for act_baseline_bins), the others
+    among those in data_dict. Experiments that are not given are kept in
+    full, e.g. bin_mask(d,act=act_baseline_bins,spt=False).
+    """
+    d = data_dict
+    mask = np.zeros(d['data_binned_clkk'].size,dtype=bool)
+    for name,seg in bin_segments(d).items():
+        sel = selections.pop(name,None)
+        if name=='act':
+            full = _select(d['full_data_binned_clkk_act'].size,sel)
+            start, end = d['act_bin_start'], d['act_bin_end']
+            if full[:start].any() or full[end:].any():
+                raise ValueError(f"ACT bins outside of the loaded range {start}:{end} were selected; "
+                                 "load the data with a wider act_bins.")
+            mask[seg] = full[start:end]
+        else:
+            mask[seg] = _select(seg.stop-seg.start,sel)
+    if selections:
+        raise ValueError(f"Unknown experiments {list(selections)}; the data vector has {list(bin_segments(d))}.")
+    return mask
+
+class BinMaskScanner(object):
+    """
+    Chi-square of binned theory vectors for many subsets (masks) of the
+    bandpowers of a data_dict. masks is a (nmasks x nbins) boolean array,
+    or a list of masks as returned by bin_mask.
+
+    For each mask S, the inverse of the covariance block C_SS is obtained
+    from the inverse P of the full covariance as P_SS - P_SD P_DD^-1 P_DS,
+    where D are the dropped bins, or directly when fewer bins are kept than
+    dropped. A Hartlap correction for the number of bins in each mask is
+    applied if the data_dict had it enabled, with the number of simulations
+    of the experiments whose bins it keeps. If indep is True, the
+    covariance between the SPT bandpowers and the others is set to zero
+    (as with load_data(...,indep=True)).
+
+    The inverse covariances are stored as a (nmasks x nbins x nbins) array
+    in precisions, and the log-determinants of the (Hartlap-corrected)
+    covariances of the masks in logdets.
+    """
+    def __init__(self,data_dict,masks,indep=False):
+        d = data_dict
+        self.data = d
+        self.masks = np.atleast_2d(np.asarray(masks,dtype=bool))
+        nmasks, nbins = self.masks.shape
+        if nbins!=d['data_binned_clkk'].size:
+            raise ValueError(f"Masks have {nbins} bins but the data vector has {d['data_binned_clkk'].size}.")
+
+        from scipy.linalg import cholesky, cho_factor, cho_solve, solve_triangular
+        cov = np.array(d['cov'],dtype=np.float64)
+        if indep:
+            segments = bin_segments(d)
+            if 'spt' in segments and len(segments)>1:
+                spt = np.zeros(nbins,dtype=bool)
+                spt[segments['spt']] = True
+                cov[np.ix_(spt,~spt)] = 0
+                cov[np.ix_(~spt,spt)] = 0
+
+        self.nbins = self.masks.sum(axis=1)
+        if d['apply_hartlap']:
+            # As in load_data, the Planck simulations only limit the number
+            # of simulations for the masks that keep Planck bins
+            nsims = np.full(nmasks,float(d['nsims_act']))
+            segments = bin_segments(d)
+            if 'planck' in segments:
+                with_planck = self.masks[:,segments['planck']].any(axis=1)
+                nsims[with_planck] = min(d['nsims_act'],d['nsims_planck'])
+            self.hartlap = (nsims-self.nbins-2.)/(nsims-1.)
+        else:
+            self.hartlap = np.ones(nmasks)
+
+        chol = cholesky(cov,lower=True)
+        whitening = solve_triangular(chol,np.eye(nbins),lower=True)
+        prec = whitening.T @ whitening
+        logdet = 2.*np.sum(np.log(np.diag(chol)))
+
+        self.precisions = np.zeros((nmasks,nbins,nbins))
+        self.logdets = np.zeros(nmasks)
+        for i,mask in enumerate(self.masks):
+            s = np.nonzero(mask)[0]
+            r = np.nonzero(~mask)[0]
+            if s.size==0:
+                continue
+            if r.size==0:
+                p = prec
+                ld = logdet
+            elif r.size<=s.size:
+                # Schur complement; det(C_SS) = det(C) det(P_DD)
+                cf = cho_factor(prec[np.ix_(r,r)],lower=True)
+                p = prec[np.ix_(s,s)] - prec[np.ix_(s,r)] @ cho_solve(cf,prec[np.ix_(r,s)])
+                ld = logdet + 2.*np.sum(np.log(np.diag(cf[0])))
+            else:
+                c = cholesky(cov[np.ix_(s,s)],lower=True)
+                w = solve_triangular(c,np.eye(s.size),lower=True)
+                p = w.T @ w
+                ld = 2.*np.sum(np.log(np.diag(c)))
+            self.precisions[i][np.ix_(s,s)] = p * self.hartlap[i]
+            self.logdets[i] = ld - s.size*np.log(self.hartlap[i])
+
+    def chisq(self,bclkk):
+        """
+        chi^2 of the binned theory bclkk (for the full data vector, 1d or
+        nsamples x nbins) for every mask. Returns an array of shape (nmasks,)
+        or (nmasks x nsamples).
+        """
+        delta = self.data['data_binned_clkk'] - np.asarray(bclkk)
+        return np.sum(np.matmul(delta,self.precisions) * delta,axis=-1)
+
+    def lnlike(self,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,trim_lmax=2998,
+               return_theory=False,do_norm_corr=True,act_calib=False,no_actlike_cmb_corrections=False):
+        """
+        ln(Likelihood) for every mask, with the same arguments as
+        generic_lnlike. The spectra can also be 2d (nsamples x nell), as
+        for generic_lnlike_batch. Returns an array of shape (nmasks,) or
+        (nmasks x nsamples) and, if return_theory is True, the binned
+        theory for the full data vector.
+        """
+        extra_dims = "y" if np.ndim(cl_kk)==1 else "xy"
+        cl_kk_spt = standardize(ell_kk,cl_kk,3100,extra_dims=extra_dims)
+        cl_kk = standardize(ell_kk,cl_kk,trim_lmax,extra_dims=extra_dims)
+        cl_tt = standardize(ell_cmb,cl_tt,trim_lmax,extra_dims=extra_dims)
+        cl_ee = standardize(ell_cmb,cl_ee,trim_lmax,extra_dims=extra_dims)
+        cl_bb = standardize(ell_cmb,cl_bb,trim_lmax,extra_dims=extra_dims)
+        cl_te = standardize(ell_cmb,cl_te,trim_lmax,extra_dims=extra_dims)
+        bclkk = get_binned_theory(self.data,cl_kk,cl_kk_spt,cl_tt,cl_ee,cl_te,cl_bb,
+                                  do_norm_corr=do_norm_corr,act_calib=act_calib,
+                                  no_actlike_cmb_corrections=no_actlike_cmb_corrections)
+        lnlike = -0.5 * self.chisq(bclkk)
+        if return_theory:
+            return lnlike, bclkk
+        else:
+            return lnlike
@@ -0,0 +1,442 @@
+"""
+A long-lived process that loads the likelihood data of one or more
+variants once and evaluates the likelihood for many clients, e.g.
+emulator training scripts, notebooks or post-processing jobs that would
+otherwise each pay the loading time and memory.
+
+Start a server on a Unix-domain socket (or a local TCP port, --port):
+    act-dr6-server --variant act_baseline --variant actplanck_baseline --socket /tmp/apslike.sock
+
+and evaluate the likelihood from any number of processes with
+    client = LikelihoodClient('/tmp/apslike.sock')
+    lnlike = client.generic_lnlike('act_baseline',ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb)
+    lnlikes = client.generic_lnlike_batch('act_baseline',ell_kk,cl_kks,ell_cmb,cl_tts,...)
+which take the same arguments as generic_lnlike and generic_lnlike_batch,
+with the variant in place of the data dictionary.
+
+Requests from all the connections are put in a single queue. The
+evaluating thread takes all the requests that are waiting (up to
+max_batch samples), and evaluates those for the same variant, options
+and multipoles with a single generic_lnlike_batch call, so that the
+throughput grows with the number of concurrent clients.
+
+Each message is a 4-byte (big-endian) length, a JSON header of that
+length, and the raw bytes of the arrays described in the header (as
+[dtype,shape] pairs, in C order). Only float64, float32 and int64 arrays
+of at most max_ndim dimensions and max_message_bytes in total are
+accepted; a connection that sends anything else is closed.
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from .act_dr6_spt_lenslike import load_data, generic_lnlike_batch, variants as all_variants
+
+spectra_names = ['ell_kk','cl_kk','ell_cmb','cl_tt','cl_ee','cl_te','cl_bb']
+cl_names = ['cl_kk','cl_tt','cl_ee','cl_te','cl_bb']
+# Options of generic_lnlike that clients may set
+like_options = ['trim_lmax','do_norm_corr','act_calib','no_actlike_cmb_corrections']
+# Limits on the messages that are accepted (see recv_message)
+array_dtypes = [np.dtype(np.float64),np.dtype(np.float32),np.dtype(np.int64)]
+max_ndim = 3
+max_header_bytes = 1<<20
+max_message_bytes = 1<<30
+
+class MessageError(ValueError):
+    """
+    A message that does not follow the protocol; the connection it came
+    from can no longer be used.
+    """
+
+def _parse_address(address):
+    # (host,port) tuples and 'host:port' strings are TCP addresses, others socket paths
+    if isinstance(address,(tuple,list)):
+        return socket.AF_INET, (address[0],int(address[1]))
+    host, sep, port = str(address).rpartition(':')
+    if sep and port.isdigit() and os.sep not in address:
+        return socket.AF_INET, (host or 'localhost',int(port))
+    return socket.AF_UNIX, str(address)
+
+def _recv_exact(sock,buf):
+    view = memoryview(buf).cast('B')
+    while view.nbytes:
+        n = sock.recv_into(view)
+        if n==0: raise ConnectionError("Connection closed.")
+        view = view[n:]
+
+def send_message(sock,header,arrays=()):
+    """
+    Send header (a JSON-serializable dict) and a list of arrays through
+    sock.
+    """
+    arrays = [np.asarray(a,order='C') for a in arrays]
+    header = dict(header,arrays=[[a.dtype.str,a.shape] for a in arrays])
+    hbytes = json.dumps(header).encode()
+    sock.sendall(struct.pack('!I',len(hbytes)) + hbytes)
+    for a in arrays:
+        if a.nbytes: sock.sendall(memoryview(a).cast('B'))
+
+def recv_message(sock):
+    """
+    Receive a message sent by send_message. Returns the header and the
+    list of arrays.
+    """
+    size = bytearray(4)
+    _recv_exact(sock,size)
+    hsize = struct.unpack('!I',size)[0]
+    if hsize>max_header_bytes: raise MessageError(f"Header of {hsize} bytes is too long.")
+    hbytes = bytearray(hsize)
+    _recv_exact(sock,hbytes)
+    try:
+        header = json.loads(hbytes.decode())
+    except ValueError as e:
+        raise MessageError(f"Invalid header: {e}") from None
+    if not isinstance(header,dict): raise MessageError("The header must be a JSON object.")
+    specs = _array_specs(header.pop('arrays',None))
+    arrays = []
+    for dtype,shape in specs:
+        a = np.empty(shape,dtype=dtype)
+        if a.nbytes: _recv_exact(sock,a)
+        arrays.append(a)
+    return header, arrays
+
+def _array_specs(specs):
+    # Validate the [dtype,shape] pairs of a header before anything is allocated
+    if not isinstance(specs,list): raise MessageError("The header must list the arrays.")
+    out = []
+    nbytes = 0
+    for spec in specs:
+        try:
+            dtype, shape = spec
+            dtype = np.dtype(dtype)
+        except (TypeError,ValueError):
+            raise MessageError(f"Invalid array description {spec!r}.") from None
+        if dtype not in array_dtypes: raise MessageError(f"Arrays of dtype {dtype} are not accepted.")
+        if not isinstance(shape,list) or len(shape)>max_ndim or \
+           not all(isinstance(n,int) and not isinstance(n,bool) and n>=0 for n in shape):
+            raise MessageError(f"Invalid array shape {shape!r}.")
+        nbytes += dtype.itemsize * int(np.prod(shape,dtype=object))
+        if nbytes>max_message_bytes: raise MessageError(f"Message of more than {max_message_bytes} bytes.")
+        out.append((dtype,tuple(shape)))
+    return out
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    # One thread per connection, serving its requests in order
+
+    def handle(self):
+        server = self.server.likelihood_server
+        if self.request.family!=socket.AF_UNIX:
+            self.request.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+        while True:
+            try:
+                header, arrays = recv_message(self.request)
+            except (ConnectionError,OSError):
+                return
+            except MessageError as e:
+                # The rest of the stream cannot be parsed; report and close
+                try:
+                    send_message(self.request,{'error':f"{type(e).__name__}: {e}"})
+                except OSError:
+                    pass
+                return
+            try:
+                out, arrays = server.handle_request(header,arrays)
+            except Exception as e:
+                out, arrays = {'error':f"{type(e).__name__}: {e}"}, []
+            send_message(self.request,out,arrays)
+
+
+class LikelihoodServer(object):
+    """
+    Serve the likelihood of the given variants on address, a socket path
+    or a (host,port) pair (see the module documentation). The remaining
+    keyword arguments are passed to load_data for each variant (use
+    cache_dir to make restarts fast).
+
+    max_batch is the largest number of samples evaluated in one call, and
+    max_wait the time (in seconds) for which a request waits for others to
+    batch with it (by default it only batches with the requests already
+    waiting). Call serve_forever, or start to serve from a background
+    thread, and shutdown when done.
+    """
+    def __init__(self,variants,address,lens_only=False,max_batch=512,max_wait=0.,verbose=True,
+                 **load_kwargs):
+        self.variants = [v.lower().strip() for v in variants]
+        if not self.variants: raise ValueError("No variants were given.")
+        self.lens_only = lens_only
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.verbose = verbose
+        self.data = {}
+        for variant in self.variants:
+            self.data[variant] = load_data(variant,lens_only=lens_only,like_corrections=not(lens_only),
+                                           **load_kwargs)
+        # Numbers of requests and of batched evaluations, e.g. to monitor the batching
+        self.nrequests = 0
+        self.nbatches = 0
+        self._queue = queue.Queue()
+
+        family, self.address = _parse_address(address)
+        if family==socket.AF_UNIX:
+            if os.path.exists(self.address) and stat.S_ISSOCK(os.stat(self.address).st_mode):
+                # Left over by a server that did not shut down cleanly
+                os.unlink(self.address)
+            self._server = socketserver.ThreadingUnixStreamServer(self.address,_Handler)
+        else:
+            self._server = socketserver.ThreadingTCPServer(self.address,_Handler,bind_and_activate=False)
+            self._server.allow_reuse_address = True
+            self._server.server_bind()
+            self._server.server_activate()
+            self.address = self._server.server_address
+        self._server.daemon_threads = True
+        self._server.likelihood_server = self
+        self._family = family
+        self._closed = False
+        self._threads = [threading.Thread(target=self._evaluate_loop,daemon=True)]
+        self._threads[0].start()
+
+    def info(self):
+        return {'lens_only':self.lens_only,
+                'variants':{v:{'nbins':int(d['data_binned_clkk'].size)} for v,d in self.data.items()}}
+
+    def handle_request(self,header,arrays):
+        """
+        Evaluate one request (a decoded message), waiting for its batch.
+        Returns the header and arrays of the reply.
+        """
+        method = header.get('method')
+        if method=='info':
+            return self.info(), []
+        if method not in ['lnlike','lnlike_batch']:
+            raise ValueError(f"Unknown method {method}.")
+        variant = header.get('variant')
+        if variant not in self.data:
+            raise ValueError(f"Variant {variant} is not served; available: {self.variants}.")
+        options = header.get('options',{})
+        for k in options:
+            if k not in like_options: raise ValueError(f"Unknown option {k}.")
+        if len(arrays)!=len(spectra_names):
+            raise ValueError(f"Expected the arrays {spectra_names}.")
+        spec = dict(zip(spectra_names,arrays))
+        for name in ['ell_kk','ell_cmb']:
+            ls = spec[name]
+            if ls.ndim!=1 or ls.size<2 or not(np.all(np.isclose(np.diff(ls),1.))):
+                raise ValueError(f"{name} must be consecutive multipoles.")
+        ndim = 1 if method=='lnlike' else 2
+        cls = {}
+        for name in cl_names:
+            cls[name] = np.atleast_2d(spec[name])
+            if spec[name].ndim!=ndim: raise ValueError(f"{name} must be {ndim}d for {method}.")
+        nrows = cls['cl_kk'].shape[0]
+        if any(cl.shape[0]!=nrows for cl in cls.values()):
+            raise ValueError("The spectra must have the same number of samples.")
+        if cls['cl_kk'].shape[1]!=spec['ell_kk'].size or \
+           any(cls[s].shape[1]!=spec['ell_cmb'].size for s in cl_names[1:]):
+            raise ValueError("The spectra must have the same length as their multipoles.")
+
+        # Requests with the same key are evaluated together
+        key = (variant,tuple(sorted(options.items())),spec['ell_kk'][0],spec['ell_kk'].size,
+               spec['ell_cmb'][0],spec['ell_cmb'].size)
+        future = Future()
+        self._queue.put((key,spec['ell_kk'],spec['ell_cmb'],cls,nrows,future))
+        lnlike, bclkk = future.result()
+        if ndim==1:
+            lnlike, bclkk = lnlike[0], bclkk[0]
+        arrays = [np.asarray(lnlike)] + ([bclkk] if header.get('return_theory') else [])
+        return {}, arrays
+
+    def _next_requests(self):
+        # Block for one request, then take those that are (or become, within
+        # max_wait) available, up to max_batch samples
+        items = [self._queue.get()]
+        if items[0] is None:
+            return None
+        nrows = items[0][4]
+        deadline = time.monotonic() + self.max_wait
+        while nrows<self.max_batch:
+            try:
+                wait = deadline - time.monotonic()
+                item = self._queue.get(timeout=wait) if wait>0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            items.append(item)
+            nrows += item[4]
+        return items
+
+    def _evaluate_loop(self):
+        while True:
+            items = self._next_requests()
+            if items is None:
+                return
+            groups = {}
+            for item in items:
+                groups.setdefault(item[0],[]).append(item)
+            for key,group in groups.items():
+                self._evaluate(key,group)
+
+    def _evaluate(self,key,group):
+        variant, options = key[0], dict(key[1])
+        cls = [np.concatenate([item[3][s] for item in group]) for s in cl_names]
+        try:
+            lnlike, bclkk = generic_lnlike_batch(self.data[variant],group[0][1],cls[0],group[0][2],*cls[1:],
+                                                 return_theory=True,**options)
+        except Exception as e:
+            for item in group:
+                item[5].set_exception(e)
+            return
+        self.nrequests += len(group)
+        self.nbatches += 1
+        start = 0
+        for item in group:
+            item[5].set_result((lnlike[start:start+item[4]],bclkk[start:start+item[4]]))
+            start += item[4]
+
+    def serve_forever(self):
+        if self.verbose:
+            print(f"Serving {self.variants} on {self.address}",flush=True)
+        self._server.serve_forever()
+
+    def start(self):
+        """
+        Serve from a background thread.
+        """
+        thread = threading.Thread(target=self._server.serve_forever,daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def shutdown(self):
+        self._server.shutdown()
+        self._close()
+
+    def _close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._threads[0].is_alive():
+            self._queue.put(None)
+            self._threads[0].join()
+        self._server.server_close()
+        if self._family==socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.shutdown()
+
+
+class LikelihoodClient(object):
+    """
+    Connection to a LikelihoodServer at address (a socket path or a
+    (host,port) pair), with the same likelihood functions as the module,
+    taking a variant in place of the data dictionary. A client can be
+    shared between threads, but its requests are then made one at a time;
+    use one client per thread to have them batched.
+    """
+    def __init__(self,address,timeout=None):
+        family, address = _parse_address(address)
+        self.sock = socket.socket(family,socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        if family!=socket.AF_UNIX:
+            self.sock.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+        self._lock = threading.Lock()
+
+    def _call(self,header,arrays=()):
+        with self._lock:
+            send_message(self.sock,header,arrays)
+            out, arrays = recv_message(self.sock)
+        if 'error' in out:
+            raise RuntimeError(f"Likelihood server error: {out['error']}")
+        return out, arrays
+
+    def info(self):
+        """
+        The variants served (with their numbers of bandpowers) and lens_only.
+        """
+        return self._call({'method':'info'})[0]
+
+    def _lnlike(self,method,variant,spectra,trim_lmax,return_theory,**options):
+        arrays = [np.asarray(a,dtype=np.float64) for a in spectra]
+        header = {'method':method,'variant':variant,'return_theory':return_theory,
+                  'options':dict(options,trim_lmax=trim_lmax)}
+        _, out = self._call(header,arrays)
+        lnlike = out[0][()] if method=='lnlike' else out[0]
+        return (lnlike, out[1]) if return_theory else lnlike
+
+    def generic_lnlike(self,variant,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,trim_lmax=2998,
+                       return_theory=False,do_norm_corr=True,act_calib=False,no_actlike_cmb_corrections=False):
+        """
+        ln(Likelihood) of variant, as for generic_lnlike.
+        """
+        return self._lnlike('lnlike',variant,(ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb),trim_lmax,
+                            return_theory,do_norm_corr=do_norm_corr,act_calib=act_calib,
+                            no_actlike_cmb_corrections=no_actlike_cmb_corrections)
+
+    def generic_lnlike_batch(self,variant,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,trim_lmax=2998,
+                             return_theory=False,do_norm_corr=True,act_calib=False,
+                             no_actlike_cmb_corrections=False):
+        """
+        Array of ln(Likelihood) of variant for (nsamples x nell) spectra, as
+        for generic_lnlike_batch.
+        """
+        spectra = [ell_kk,np.atleast_2d(cl_kk),ell_cmb] + [np.atleast_2d(cl) for cl in (cl_tt,cl_ee,cl_te,cl_bb)]
+        return self._lnlike('lnlike_batch',variant,spectra,trim_lmax,return_theory,do_norm_corr=do_norm_corr,
+                            act_calib=act_calib,no_actlike_cmb_corrections=no_actlike_cmb_corrections)
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--variant',action='append',choices=all_variants,required=True,
+                        help='Variant to serve (can be repeated).')
+    parser.add_argument('--lens-only',action='store_true',help='Use the CMB-marginalized likelihood.')
+    parser.add_argument('--socket',default=None,help='Path of the Unix-domain socket to listen on.')
+    parser.add_argument('--port',type=int,default=None,help='Local TCP port to listen on instead.')
+    parser.add_argument('--host',default='localhost')
+    parser.add_argument('--ddir',default=None,help='Data directory (default: the bundled data).')
+    parser.add_argument('--cache-dir',default=None,help='Pass a cache_dir to load_data.')
+    parser.add_argument('--max-batch',type=int,default=512,help='Largest number of samples per evaluation.')
+    parser.add_argument('--max-wait',type=float,default=0.,help='Seconds a request waits for others to batch with.')
+    parser.add_argument('--float32',action='store_true',help='Evaluate the operators in single precision.')
+    args = parser.parse_args(argv)
+    if (args.socket is None)==(args.port is None):
+        parser.error("Give exactly one of --socket and --port.")
+
+    address = args.socket if args.port is None else (args.host,args.port)
+    server = LikelihoodServer(args.variant,address,lens_only=args.lens_only,max_batch=args.max_batch,
+                              max_wait=args.max_wait,ddir=args.ddir,cache_dir=args.cache_dir,
+                              dtype=np.float32 if args.float32 else None)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
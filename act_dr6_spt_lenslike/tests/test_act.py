@@ -7,6 +7,29 @@ version = apslike.default_version
 data_dir = f"{file_dir}/../data/{version}/"
 
 
+def fiducial_spectra():
+    # (ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb) of the fiducial cosmology
+    try:
+        ell, cl_tt, cl_ee, cl_bb, cl_te = np.loadtxt(data_dir+'like_corrs/cosmo2017_10K_acc3_lensedCls.dat', unpack=True)
+        ellp, _, _, _, _, cl_pp, _, _= np.loadtxt(data_dir+'like_corrs/cosmo2017_10K_acc3_lenspotentialCls.dat', unpack=True)
+    except OSError:
+        print('Required data file not found at {}'.format(data_dir))
+        print('Please obtain it and place it correctly.')
+        print('The script get-act-data.sh will download and place it.')
+        raise
+
+    prefac = 2*np.pi/ell/(ell+1.)
+    cl_kk=cl_pp/4*2*np.pi
+    cl_bb = cl_bb*prefac
+    cl_tt = cl_tt*prefac
+    cl_ee = cl_ee*prefac
+    cl_te = cl_te*prefac
+    return ellp,cl_kk,ell,cl_tt,cl_ee,cl_te,cl_bb
+
+def load(variant,lens_only,**kwargs):
+    return apslike.load_data(variant,lens_only=lens_only,like_corrections=not(lens_only),version=version,**kwargs)
+
+
 class ACTLikeTest(unittest.TestCase):
 
     def generic_call(self,variant,lens_only,exp_chisq=None,return_theory=False):
@@ -36,6 +59,133 @@ class ACTLikeTest(unittest.TestCase):
             chisq=-2*apslike.generic_lnlike(data_dict,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb,trim_lmax = 2998)
             self.assertAlmostEqual(chisq,  exp_chisq, 1)
 
+    def reference(self,variant,lens_only,exp_chisq=None):
+        # Shared setup of the checks below: the data_dict and the fiducial
+        # spectra, at which chi^2 is checked against exp_chisq if given
+        args = fiducial_spectra()
+        data_dict = load(variant,lens_only)
+        if exp_chisq is not None:
+            self.assertAlmostEqual(-2*apslike.generic_lnlike(data_dict,*args,trim_lmax = 2998),  exp_chisq, 1)
+        return data_dict, args
+
+    def check_batched(self,data_dict,args):
+        ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb = args
+        scales = np.array([0.9,1.0,1.1])[:,None]
+        args = (ell_kk,cl_kk*scales,ell_cmb,cl_tt*scales,cl_ee*scales,cl_te*scales,cl_bb*scales)
+        lnlikes = apslike.generic_lnlike_batch(data_dict,*args,trim_lmax = 2998)
+        for i in range(scales.size):
+            ref = apslike.generic_lnlike(data_dict,*[a[i] if a.ndim==2 else a for a in args],trim_lmax = 2998)
+            self.assertAlmostEqual(lnlikes[i],  ref, 8)
+
+    def check_cached(self,data_dict,args):
+        ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb = args
+        cache = apslike.CorrectionCache()
+        ref = apslike.generic_lnlike(data_dict,*args,trim_lmax = 2998)
+        self.assertAlmostEqual(apslike.generic_lnlike(data_dict,*args,trim_lmax = 2998,cache=cache),  ref, 10)
+        # Only the lensing spectrum changes, then only the CMB spectra
+        for alens in [1.1,0.9]:
+            args = (ell_kk,cl_kk*alens,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb)
+            ref = apslike.generic_lnlike(data_dict,*args,trim_lmax = 2998)
+            self.assertAlmostEqual(apslike.generic_lnlike(data_dict,*args,trim_lmax = 2998,cache=cache),  ref, 10)
+        args = (ell_kk,cl_kk*0.9,ell_cmb,cl_tt*1.01,cl_ee,cl_te,cl_bb)
+        ref = apslike.generic_lnlike(data_dict,*args,trim_lmax = 2998)
+        self.assertAlmostEqual(apslike.generic_lnlike(data_dict,*args,trim_lmax = 2998,cache=cache),  ref, 10)
+        if data_dict['likelihood_corrections']:
+            self.assertGreater(cache.hits,0)
+
+    def check_instrumented(self,data_dict,args):
+        ref = -2*apslike.generic_lnlike(data_dict,*args,trim_lmax = 2998)
+        stats = apslike.LikelihoodStats()
+        for i in range(3):
+            chisq=-2*apslike.generic_lnlike(data_dict,*args,trim_lmax = 2998,stats=stats)
+        self.assertEqual(chisq,ref)
+        self.assertEqual(stats.ncalls,3)
+        for name in ['standardize','binning','quadratic_form','total']:
+            self.assertEqual(stats.counts[name] % 3,0)
+            self.assertGreater(stats.times[name],0)
+        self.assertEqual('corrections' in stats.times,data_dict['likelihood_corrections'])
+        self.assertLessEqual(sum(t for n,t in stats.times.items() if n!='total'),stats.times['total'])
+
+    def check_compiled(self,data_dict,args):
+        like = apslike.compile_likelihood(data_dict,trim_lmax = 2998)
+        ref = -2*apslike.generic_lnlike(data_dict,*args,trim_lmax = 2998)
+        self.assertAlmostEqual(-2*like.lnlike(*args),  ref, 8)
+
+    def check_float32(self,data_dict,args,d32):
+        ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb = args
+        self.assertEqual(d32['binmat_act'].dtype,np.float32)
+        self.assertEqual(d32['cov'].dtype,np.float64)
+        for scale in [0.9,1.0,1.1]:
+            args = (ell_kk,cl_kk*scale,ell_cmb,cl_tt,cl_ee*scale,cl_te,cl_bb)
+            chisq=-2*apslike.generic_lnlike(d32,*args,trim_lmax = 2998)
+            ref = -2*apslike.generic_lnlike(data_dict,*args,trim_lmax = 2998)
+            self.assertLess(abs(chisq-ref),1e-2)
+
+    def check_compressed(self,data_dict,args,cdict,tol):
+        ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb = args
+        self.assertNotIn('dN1_kk',cdict)
+        report = cdict['compression']
+        self.assertLessEqual(sum(r['error'] for r in report.values()),tol)
+        for r in report.values():
+            self.assertLessEqual(r['error'],tol/len(report))
+            self.assertTrue(r['rank'] is None or 0<=r['rank']<cdict['fiducial_cl_kk'].size//2)
+        args = (ell_kk,cl_kk*1.1,ell_cmb,cl_tt*1.05,cl_ee,cl_te,cl_bb*0.9)
+        chisq=-2*apslike.generic_lnlike(cdict,*args,trim_lmax = 2998)
+        ref = -2*apslike.generic_lnlike(data_dict,*args,trim_lmax = 2998)
+        self.assertLessEqual(abs(chisq-ref),2*np.sqrt(ref)*tol+tol**2)
+
+    def check_mock(self,d_mock,args):
+        # The noiseless mock data are the binned fiducial spectrum
+        self.assertAlmostEqual(apslike.generic_lnlike(d_mock,*args,trim_lmax = 2998),0.,8)
+
+    def check_fisher(self,data_dict,args):
+        # Against the Hessian of -lnlike, which is linear in these parameters
+        from act_dr6_spt_lenslike.fisher import fisher_matrix
+        ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb = args
+        derivs = {'kk':np.stack([cl_kk,cl_kk*0.]),'tt':np.stack([cl_tt*0.,cl_tt*0.1]),'ee':np.stack([cl_ee*0.1,cl_ee*0.])}
+        F = fisher_matrix(data_dict,derivs,ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb)
+        def lnlike(theta):
+            return apslike.generic_lnlike(data_dict,ell_kk,cl_kk+theta@derivs['kk'],ell_cmb,cl_tt+theta@derivs['tt'],
+                                          cl_ee+theta@derivs['ee'],cl_te,cl_bb)
+        h = 1e-2
+        e = np.eye(2)*h
+        for i in range(2):
+            for j in range(2):
+                hess = -(lnlike(e[i]+e[j])-lnlike(e[i]-e[j])-lnlike(e[j]-e[i])+lnlike(-e[i]-e[j]))/(4*h*h)
+                self.assertLess(abs(hess-F[i,j]),1e-6*np.max(np.abs(F)))
+
+    def check_gradient(self,data_dict,args,**kwargs):
+        # Against central finite differences along random directions, which are
+        # exact up to rounding for the (quadratic) likelihood without act_calib
+        lnlike, grads = apslike.generic_lnlike(data_dict,*args,trim_lmax = 2998,return_gradient=True,**kwargs)
+        rng = np.random.default_rng(3)
+        for s,i in zip(['kk','tt','ee','te','bb'],[1,3,4,5,6]):
+            step = args[i]*rng.standard_normal(args[i].size)*1e-3
+            lnl = []
+            for sign in [1,-1]:
+                shifted = list(args)
+                shifted[i] = args[i] + sign*step
+                lnl.append(apslike.generic_lnlike(data_dict,*shifted,trim_lmax = 2998,**kwargs))
+            fd = (lnl[0]-lnl[1])/2.
+            self.assertLess(abs(fd-grads[s] @ step),1e-6*max(abs(fd),1e-4),s)
+
+    def check_amplitude(self,data_dict,args,**kwargs):
+        # Against the brute-force maximum and integral over a grid of amplitudes
+        for prior in [None,(1.,0.05)]:
+            lnlike, amp, sigma = apslike.amplitude_lnlike(data_dict,*args,mode='profile',prior=prior,**kwargs)
+            lnmarg, amp_marg, _ = apslike.amplitude_lnlike(data_dict,*args,prior=prior,**kwargs)
+            self.assertEqual(amp_marg,amp)
+            amps = np.linspace(amp-8*sigma,amp+8*sigma,801)
+            lnlikes = np.array([apslike.generic_lnlike(data_dict,args[0],a*args[1],*args[2:],**kwargs)
+                                for a in amps])
+            # Unnormalized log-prior, and its normalization
+            lnprior = 0. if prior is None else -0.5*((amps-prior[0])/prior[1])**2
+            lnnorm = 0. if prior is None else -0.5*np.log(2.*np.pi*prior[1]**2)
+            peak = np.max(lnlikes+lnprior)
+            self.assertAlmostEqual(amps[np.argmax(lnlikes+lnprior)],amp,places=3)
+            self.assertAlmostEqual(lnlike,peak,places=6)
+            self.assertAlmostEqual(lnmarg,np.log(np.trapz(np.exp(lnlikes+lnprior-peak),amps))+peak+lnnorm,places=6)
+
     def test_act_baseline_lensonly(self):
         self.generic_call('act_baseline',True,14.06)
     def test_act_baseline(self):
@@ -78,6 +228,187 @@ class ACTLikeTest(unittest.TestCase):
         self.generic_call('actplanckspt3g_baseline',True,38.17)
     def test_actplanck_spt3g_extended_lensonly(self):
         self.generic_call('actplanckspt3g_extended',True,41.27)
+    def test_actplanck_baseline_compressed(self):
+        data_dict, args = self.reference('actplanck_baseline',False,21.46)
+        cdict = load('actplanck_baseline',False,binned_corrections=False,compress_tol=0.05)
+        self.check_compressed(data_dict,args,cdict,0.05)
+    def test_actplanck_baseline_gradient(self):
+        data_dict, (ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb) = self.reference('actplanck_baseline',False,21.46)
+        args = [ell_kk,cl_kk*1.02,ell_cmb,cl_tt*0.98,cl_ee*1.01,cl_te,cl_bb*1.03]
+        for act_calib in [False,True]:
+            self.check_gradient(data_dict,args,act_calib=act_calib)
+    def test_actplanck_baseline_fisher(self):
+        self.check_fisher(*self.reference('actplanck_baseline',False,21.46))
+    def test_actplanckspt3g_baseline_mock(self):
+        _, args = self.reference('actplanckspt3g_baseline',False,38.67)
+        self.check_mock(load('actplanckspt3g_baseline',False,mock=True),args)
+    def test_spt3g_lensonly_mock(self):
+        _, args = self.reference('spt3g',True,19.69)
+        self.check_mock(load('spt3g',True,mock=True),args)
+    def test_actplanck_baseline_amplitude(self):
+        data_dict, args = self.reference('actplanck_baseline',False,21.46)
+        self.check_amplitude(data_dict,list(args),act_calib=True)
+    def test_float32(self):
+        # Every variant, with and without the likelihood corrections
+        for variant in apslike.variants:
+            for lens_only in [True,False]:
+                try:
+                    apslike.data_manifest(variant,lens_only=lens_only,like_corrections=not(lens_only))
+                except ValueError:
+                    continue
+                with self.subTest(variant=variant,lens_only=lens_only):
+                    data_dict, args = self.reference(variant,lens_only)
+                    self.check_float32(data_dict,args,load(variant,lens_only,dtype=np.float32))
+    def test_act_baseline_compiled(self):
+        self.check_compiled(*self.reference('act_baseline',False,14.13))
+    def test_act_baseline_lensonly_compiled(self):
+        self.check_compiled(*self.reference('act_baseline',True,14.06))
+    def test_actplanck_extended_compiled(self):
+        self.check_compiled(*self.reference('actplanck_extended',False,24.75))
+    def test_spt3g_lensonly_compiled(self):
+        self.check_compiled(*self.reference('spt3g',True,19.69))
+    def test_actplanck_spt3g_baseline_compiled(self):
+        self.check_compiled(*self.reference('actplanckspt3g_baseline',False,38.67))
+    def test_actplanck_spt3g_extended_lensonly_compiled(self):
+        self.check_compiled(*self.reference('actplanckspt3g_extended',True,41.27))
+    def test_act_baseline_batch(self):
+        self.check_batched(*self.reference('act_baseline',False,14.13))
+    def test_actplanck_spt3g_extended_batch(self):
+        self.check_batched(*self.reference('actplanckspt3g_extended',False,41.73))
+    def test_spt3g_lensonly_batch(self):
+        self.check_batched(*self.reference('spt3g',True,19.69))
+    def test_whitening(self):
+        # Only needs the bundled data
+        data_dict = apslike.load_data('actplanckspt3g_extended',lens_only=True,like_corrections=False,version=version)
+        cov = data_dict['cov'] / data_dict['hartlap_correction']
+        L = data_dict['cov_chol']
+        self.assertTrue(np.allclose(L @ L.T,cov,rtol=0,atol=1e-12*np.abs(cov).max()))
+        self.assertAlmostEqual(data_dict['logdet_cov'],np.linalg.slogdet(cov)[1],8)
+        ell = np.arange(2,4000)
+        cl_kk = 2e-7/(1.+(ell/60.)**1.6)
+        zeros = cl_kk*0.
+        lnlike,bclkk = apslike.generic_lnlike(data_dict,ell,cl_kk,ell,zeros,zeros,zeros,zeros,return_theory=True)
+        delta = data_dict['data_binned_clkk'] - bclkk
+        self.assertAlmostEqual(lnlike/(-0.5*delta @ data_dict['cinv'] @ delta),1.,12)
+    def test_gradient_lensonly(self):
+        # Only needs the bundled data
+        ell = np.arange(2,4000)
+        cl_kk = 2e-7/(1.+(ell/60.)**1.6)*(1.+0.1*np.sin(ell/200.))
+        zeros = cl_kk*0.
+        for variant in ['actplanckspt3g_baseline','spt3g']:
+            data_dict = apslike.load_data(variant,lens_only=True,like_corrections=False,version=version)
+            self.check_gradient(data_dict,[ell,cl_kk,ell,zeros,zeros,zeros,zeros])
+            # Batched gradients agree with single ones
+            scales = np.array([0.9,1.1])[:,None]
+            _, grads = apslike.generic_lnlike_batch(data_dict,ell,cl_kk*scales,ell,zeros,zeros,zeros,zeros,
+                                                     return_gradient=True)
+            _, grad = apslike.generic_lnlike(data_dict,ell,cl_kk*1.1,ell,zeros,zeros,zeros,zeros,return_gradient=True)
+            self.assertTrue(np.allclose(grads['kk'][1],grad['kk'],rtol=1e-12,atol=0))
+    def test_amplitude_lensonly(self):
+        # Only needs the bundled data
+        ell = np.arange(2,4000)
+        cl_kk = 2e-7/(1.+(ell/60.)**1.6)
+        zeros = cl_kk*0.
+        data_dict = apslike.load_data('actplanckspt3g_baseline',lens_only=True,like_corrections=False,version=version)
+        self.check_amplitude(data_dict,[ell,cl_kk,ell,zeros,zeros,zeros,zeros])
+        with self.assertRaises(ValueError):
+            apslike.amplitude_lnlike(data_dict,ell,cl_kk,ell,zeros,zeros,zeros,zeros,mode='fit')
+    def test_bands(self):
+        # Only needs the bundled data
+        data_dict = apslike.load_data('actplanckspt3g_extended',lens_only=True,like_corrections=False,version=version)
+        x = np.random.default_rng(2).standard_normal((3,3102))
+        for name in ['binmat_act','binmat_planck','binmat_spt']:
+            binmat = data_dict[name]
+            bins = apslike.bin_ranges(binmat)
+            for row,(start,stop) in zip(binmat,bins):
+                self.assertTrue(np.all(row[:start]==0) and np.all(row[stop:]==0))
+                self.assertTrue(row[start]!=0 and row[stop-1]!=0)
+            lo, hi = data_dict[f'{name}_band']
+            self.assertEqual((lo,hi),(bins[:,0].min(),bins[:,1].max()))
+            self.assertNotIn(f'{name}_bins',data_dict)
+            xs = x[:,:binmat.shape[1]]
+            self.assertTrue(np.allclose(apslike.banded_product(data_dict,name,xs),xs @ binmat.T,rtol=1e-13,atol=0))
+    def test_file_theory_requirements(self):
+        # The requirements read from the files, without loading the data, are
+        # those of the loaded data; the corrections need the full data
+        lens_only = [True] + ([False] if os.path.exists(data_dir+'like_corrs') else [])
+        for variant in apslike.act_dr6_spt_lenslike.variants:
+            for lo in lens_only:
+                kwargs = dict(version=version,lens_only=lo,like_corrections=not(lo))
+                try:
+                    data_dict = load(variant,lo)
+                except ValueError:
+                    # Also for variants that are not available
+                    with self.assertRaises(ValueError):
+                        apslike.file_theory_requirements(variant,**kwargs)
+                    continue
+                for act_calib in [False,True]:
+                    self.assertEqual(apslike.file_theory_requirements(variant,act_calib=act_calib,**kwargs),
+                                     apslike.get_theory_requirements(data_dict,act_calib=act_calib))
+    def test_low_rank_factors(self):
+        # Smooth kernel of numerical rank ~10; no data needed
+        x = np.linspace(0,1,500)
+        mat = np.exp(-(x[:,None]-x[None,:])**2/0.1)
+        ref = np.random.default_rng(1).standard_normal((500,4))
+        error = lambda u,vt: np.abs(mat @ ref - u @ (vt @ ref)).max()
+        u, vt = apslike.low_rank_factors(mat,error,1e-8)
+        self.assertLess(u.shape[1],40)
+        self.assertLessEqual(error(u,vt),1e-8)
+        self.assertTrue(np.allclose(u.T @ u,np.eye(u.shape[1])))
+        self.assertEqual(apslike.low_rank_factors(np.eye(500),error,1e-8),(None,None))
+    def test_compression_report(self):
+        # Smooth synthetic corrections; no data needed
+        n, nbins, tol = 300, 6, 1e-3
+        ls = np.arange(n)
+        kernel = np.exp(-(ls[:,None]-ls[None,:])**2/2000.)/n
+        edges = np.linspace(20,n-20,nbins+1).astype(int)
+        binmat = np.array([(ls>=lo)&(ls<hi) for lo,hi in zip(edges[:-1],edges[1:])])/np.diff(edges)[:,None]
+        d = {'binmat_act':binmat,'include_planck':False,'fAL':1.+ls/n,'whitening':np.eye(nbins)*1e3,
+             'dAL_dC':np.stack([kernel*(k+1) for k in range(4)])}
+        for k,s in enumerate(['kk','tt','ee','bb','te']):
+            d[f'dN1_{s}'] = kernel*(k+1)
+            d[f'fiducial_cl_{s}'] = 1./(ls+10.)**(1+k/4)
+        full = {k:v.copy() for k,v in d.items() if k.startswith(('dN1_','dAL_dC'))}
+        report = apslike.compress_corrections(d,tol)
+        self.assertIs(d['compression'],report)
+        self.assertEqual(len(report),9)
+        shapes = np.cos(np.pi*np.arange(8)[:,None]*ls/(n-2.))
+        for key,r in report.items():
+            self.assertLessEqual(r['error'],tol/len(report))
+            name, i = key.split('[')[0], (int(key[-2]) if key.endswith(']') else None)
+            u, vt = d[f'{name}_u'], d[f'{name}_vt']
+            if i is None:
+                s, left, mat = name[4:], binmat, full[name]
+            else:
+                # The binning of the normalization correction (the multipoles
+                # below 2 are not binned)
+                s, left, mat = ['tt','ee','bb','te'][i], -2*binmat*d['fiducial_cl_kk']/d['fAL'], full[name][i]
+                u, vt = u[i], vt[i]
+            # The factors beyond the reported rank (padding) are zero
+            self.assertTrue(0<r['rank']<n//2 and np.all(u[:,r['rank']:]==0))
+            ref = (shapes * d[f'fiducial_cl_{s}']).T
+            diff = d['whitening'] @ left @ ((mat - u @ vt) @ ref)
+            self.assertAlmostEqual(np.linalg.norm(diff,axis=0).max(),r['error'],12)
+    def test_act_baseline_instrumented(self):
+        self.check_instrumented(*self.reference('act_baseline',False,14.13))
+    def test_actplanck_spt3g_baseline_lensonly_instrumented(self):
+        self.check_instrumented(*self.reference('actplanckspt3g_baseline',True,38.17))
+    def test_act_baseline_cached(self):
+        self.check_cached(*self.reference('act_baseline',False,14.13))
+    def test_actplanck_spt3g_extended_cached(self):
+        self.check_cached(*self.reference('actplanckspt3g_extended',False,41.73))
+    def test_act_baseline_cached_data_dicts(self):
+        # The corrections cached for one data_dict are not used for another
+        # one, with different corrections, evaluated at the same spectra
+        data_dict, args = self.reference('act_baseline',False,14.13)
+        other = {k:v for k,v in data_dict.items() if k!='cache_token'}
+        for k in ['binned_dN1_kk','binned_dN1_tt']:
+            other[k] = other[k]*2.
+        cache = apslike.CorrectionCache()
+        for d in [data_dict,other,data_dict]:
+            ref = apslike.generic_lnlike(d,*args,trim_lmax = 2998)
+            self.assertAlmostEqual(apslike.generic_lnlike(d,*args,trim_lmax = 2998,cache=cache),  ref, 10)
+        self.assertNotEqual(other['cache_token'],data_dict['cache_token'])
 ## It's really odd lens true false have the same values
 if __name__ == '__main__':
     ACTLikeTest().test_act_baseline_lensonly()
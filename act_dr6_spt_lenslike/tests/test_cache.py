@@ -0,0 +1,73 @@
+import unittest
+import act_dr6_spt_lenslike as apslike
+import numpy as np
+import os
+import shutil
+import tempfile
+file_dir = os.path.abspath(os.path.dirname(__file__))
+version = apslike.default_version
+data_dir = f"{file_dir}/../data/{version}/"
+
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        # Work on a copy of the bundled data so that it can be modified
+        self.ddir = os.path.join(self.tmp,'data')
+        shutil.copytree(data_dir,self.ddir)
+        self.cache_dir = os.path.join(self.tmp,'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp,ignore_errors=True)
+
+    def load(self,variant='actspt3g_baseline',**kwargs):
+        return apslike.load_data(variant,ddir=self.ddir,lens_only=True,like_corrections=False,
+                                 cache_dir=self.cache_dir,**kwargs)
+
+    def entries(self):
+        return [f for f in os.listdir(self.cache_dir) if os.path.isdir(os.path.join(self.cache_dir,f))]
+
+    def assertDictsEqual(self,d1,d2):
+        self.assertEqual(set(d1.keys()),set(d2.keys()))
+        for k in d1:
+            self.assertEqual(type(d1[k]),type(d2[k]))
+            self.assertTrue(np.array_equal(d1[k],d2[k]),k)
+
+    def test_roundtrip(self):
+        d1 = self.load()
+        self.assertEqual(len(self.entries()),1)
+        d2 = self.load()
+        self.assertDictsEqual(d1,d2)
+        ref = apslike.load_data('actspt3g_baseline',ddir=self.ddir,lens_only=True,like_corrections=False)
+        self.assertDictsEqual(ref,d2)
+
+    def test_arguments_change_key(self):
+        self.load()
+        self.load(scale_cov=2.)
+        self.load('spt3g')
+        self.assertEqual(len(self.entries()),3)
+
+    def test_invalidation(self):
+        d1 = self.load()
+        fname = os.path.join(self.ddir,'clkk_bandpowers_act.txt')
+        y = np.loadtxt(fname)
+        np.savetxt(fname,y*2.)
+        d2 = self.load()
+        self.assertTrue(np.allclose(d2['data_binned_clkk'][:5],2.*d1['data_binned_clkk'][:5]))
+        self.assertEqual(len(self.entries()),1)
+
+    def test_memmap(self):
+        d1 = self.load()
+        d2 = self.load(memmap=True)
+        self.assertDictsEqual(d1,d2)
+        ell = np.arange(2,4000)
+        cl_kk = 1e-7/(1.+(ell/60.)**1.5)
+        cls = [ell,cl_kk,ell] + [cl_kk*0.]*4
+        self.assertEqual(apslike.generic_lnlike(d1,*cls),apslike.generic_lnlike(d2,*cls))
+        with self.assertRaises(ValueError):
+            apslike.load_data('actspt3g_baseline',ddir=self.ddir,lens_only=True,
+                              like_corrections=False,memmap=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -111,6 +111,34 @@ class ACTLikeTest(unittest.TestCase):
     def test_actplanck_spt3g_extended_lensonly(self):
         self.generic_call('actplanckspt3g_extended',True,41.46)
 
+    def test_actplanck_spt3g_baseline_lensonly_amplitude(self):
+        # Profiling over the lensing amplitude can only improve the fit
+        info['likelihood'] = {'ACTDR6LensLike' : {'external' : ACTDR6LensLike,
+                                                  'variant' : 'actplanckspt3g_baseline',
+                                                  'lens_only' : True,
+                                                  'lens_amplitude' : 'profile'}}
+        params = dict(info['params'],A_lens_kk={'derived':True})
+        model = get_model(dict(info,params=params))
+        loglikes, derived = model.loglikes()
+        self.assertAlmostEqual(-2 * loglikes[0], 37.09, 1)
+        self.assertAlmostEqual(derived[0], 0.983, 3)
+
+    def test_background_load(self):
+        # Loading the data in the background requests the same multipoles
+        for variant, lens_only in [('act_baseline',True),('actspt3g_baseline',False)]:
+            lmaxs, chisqs = [], []
+            for background_load in [True,False]:
+                info['likelihood'] = {'ACTDR6LensLike' : {'external' : ACTDR6LensLike,
+                                                          'variant' : variant,
+                                                          'lens_only' : lens_only,
+                                                          'background_load' : background_load}}
+                model = get_model(info)
+                lmaxs.append(model.likelihood['ACTDR6LensLike'].theory_lmaxs)
+                loglikes, derived = model.loglikes()
+                chisqs.append(-2 * loglikes[0])
+            self.assertEqual(lmaxs[0], lmaxs[1])
+            self.assertAlmostEqual(chisqs[0], chisqs[1], 8)
+
 if __name__ == '__main__':
     ACTLikeTest().test_act_baseline_lensonly()
     ACTLikeTest().test_act_baseline()
@@ -0,0 +1,74 @@
+import unittest
+import warnings
+import act_dr6_spt_lenslike as apslike
+from act_dr6_spt_lenslike import fisher
+import numpy as np
+import os
+file_dir = os.path.abspath(os.path.dirname(__file__))
+version = apslike.default_version
+data_dir = f"{file_dir}/../data/{version}/"
+
+ell = np.arange(2,4000)
+cl_kk = 2.1e-7/(1.+(ell/60.)**1.6)
+zeros = cl_kk*0.
+fiducial = (ell,cl_kk,ell,zeros,zeros,zeros,zeros)
+# An amplitude and a tilt of the lensing spectrum
+derivs = {'kk':np.stack([cl_kk,cl_kk*np.log(ell/100.)])}
+
+def hessian(data_dict,h=1e-2):
+    # Of -lnlike, by central differences (exact for a theory linear in the parameters)
+    def lnlike(theta):
+        return apslike.generic_lnlike(data_dict,ell,cl_kk+theta@derivs['kk'],*fiducial[2:])
+    e = np.eye(2)*h
+    return np.array([[-(lnlike(e[i]+e[j])-lnlike(e[i]-e[j])-lnlike(e[j]-e[i])+lnlike(-e[i]-e[j]))/(4*h*h)
+                      for j in range(2)] for i in range(2)])
+
+
+class FisherTest(unittest.TestCase):
+
+    def test_fisher_matrix(self):
+        for variant in ['actplanckspt3g_baseline','spt3g']:
+            d = apslike.load_data(variant,lens_only=True,like_corrections=False,ddir=data_dir)
+            F = fisher.fisher_matrix(d,derivs,*fiducial)
+            self.assertTrue(np.allclose(F,hessian(d),rtol=1e-8,atol=0))
+            self.assertTrue(np.allclose(F,F.T,rtol=1e-14,atol=0))
+        with self.assertRaises(ValueError):
+            fisher.fisher_matrix(d,{'pp':derivs['kk']},*fiducial)
+        with self.assertRaises(ValueError):
+            fisher.fisher_matrix(d,{'kk':derivs['kk'][:,:100]},*fiducial)
+
+    def test_masks(self):
+        d = apslike.load_data('actplanckspt3g_baseline',lens_only=True,like_corrections=False,ddir=data_dir,
+                              act_bins=(0,None))
+        masks = [apslike.bin_mask(d),apslike.bin_mask(d,act=apslike.act_baseline_bins,spt=False)]
+        F = fisher.fisher_matrix(d,derivs,*fiducial,masks=masks)
+        self.assertEqual(F.shape,(2,2,2))
+        self.assertTrue(np.allclose(F[0],fisher.fisher_matrix(d,derivs,*fiducial),rtol=1e-10,atol=0))
+        # Dropping bandpowers loses information
+        self.assertTrue(np.all(np.linalg.eigvalsh(F[0]-F[1])>0))
+
+    def test_masks_variant(self):
+        # An ACT-only mask of the ACT+Planck data is the act_baseline Fisher matrix
+        d = apslike.load_data('actplanck_baseline',lens_only=True,like_corrections=False,ddir=data_dir,
+                              act_bins=(0,None))
+        F = fisher.fisher_matrix(d,derivs,*fiducial,masks=[apslike.bin_mask(d,act=apslike.act_baseline_bins,planck=False)])
+        act = apslike.load_data('act_baseline',lens_only=True,like_corrections=False,ddir=data_dir)
+        self.assertTrue(np.allclose(F[0],fisher.fisher_matrix(act,derivs,*fiducial),rtol=1e-10,atol=0))
+
+    def test_fisher_matrices(self):
+        variants = ['act_baseline','actplanck_baseline','actplanckspt3g_baseline']
+        ml = apslike.MultiVariantLike(variants,lens_only=True,ddir=data_dir)
+        vd = ml.variant_data['actplanckspt3g_baseline']
+        masks = {'actplanckspt3g_baseline':[apslike.bin_mask(vd,act=apslike.act_baseline_bins,spt=False)]}
+        Fs = fisher.fisher_matrices(ml,derivs,*fiducial,masks=masks)
+        for variant in variants:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                d = apslike.load_data(variant,lens_only=True,like_corrections=False,ddir=data_dir)
+            F = Fs[variant][0] if variant in masks else Fs[variant]
+            expected = fisher.fisher_matrix(d,derivs,*fiducial,masks=masks.get(variant))
+            if variant in masks: expected = expected[0]
+            self.assertTrue(np.allclose(F,expected,rtol=1e-10,atol=0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import json
+import os
+import subprocess
+import sys
+file_dir = os.path.abspath(os.path.dirname(__file__))
+
+# Modules that are only imported where they are used
+heavy_modules = ['scipy','cobaya','camb','healpy','requests','tqdm','act_dr6_spt_lenslike.cobaya_likelihood']
+# Limit on the import time of the package beyond numpy: whichever is larger of
+# an absolute time, in seconds, and a multiple of the time it took to import
+# numpy in the same interpreter, which scales with the speed and load of the
+# machine. APSLIKE_IMPORT_BUDGET overrides it with a time in seconds.
+import_budget = 0.5
+numpy_multiple = 2.
+import_budget_override = os.environ.get('APSLIKE_IMPORT_BUDGET')
+
+script = f"""
+import json, sys, time
+t0 = time.perf_counter()
+import numpy
+t1 = time.perf_counter()
+import act_dr6_spt_lenslike
+t2 = time.perf_counter()
+print(json.dumps({{'time':t2-t1,'numpy_time':t1-t0,'modules':[m for m in {heavy_modules!r} if m in sys.modules]}}))
+"""
+
+
+class ImportTest(unittest.TestCase):
+
+    def test_import(self):
+        # In a fresh interpreter, so that nothing is imported already
+        env = dict(os.environ,PYTHONPATH=os.pathsep.join([os.path.dirname(os.path.dirname(file_dir))]+
+                                                         [p for p in [os.environ.get('PYTHONPATH')] if p]))
+        out = subprocess.run([sys.executable,'-c',script],capture_output=True,text=True,env=env,check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        self.assertEqual(result['modules'],[])
+        if import_budget_override is not None:
+            budget = float(import_budget_override)
+        else:
+            budget = max(import_budget,numpy_multiple*result['numpy_time'])
+        self.assertLess(result['time'],budget)
+
+    def test_lazy_attributes(self):
+        import act_dr6_spt_lenslike as apslike
+        from act_dr6_spt_lenslike import cobaya_likelihood
+        self.assertIs(apslike.ACTDR6LensLike,cobaya_likelihood.ACTDR6LensLike)
+        self.assertIs(apslike.act_dr6_spt_lenslike.ACTDR6LensLike,cobaya_likelihood.ACTDR6LensLike)
+        with self.assertRaises(AttributeError):
+            apslike.not_an_attribute
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import act_dr6_spt_lenslike as apslike
+import numpy as np
+
+
+class Background(object):
+    # Minimal stand-in for CAMBdata with chi proportional to z
+    tau_maxvis = 280.
+    def conformal_time(self,z):
+        return 14200.
+    def comoving_radial_distance(self,z):
+        return 3000.*z
+    def redshift_at_comoving_radial_distance(self,chi):
+        return chi/3000.
+
+class WeylPower(object):
+    # Smooth analytic stand-in for the Weyl power spectrum interpolator
+    def P(self,z,k,grid=True):
+        return 1e-3*k/(1.+(k/0.02)**2.5)/(1.+z)**0.5
+
+def limber_loop(results,Pfunc,lmax,kmax,nz,zsrc=None):
+    # Reference per-ell implementation
+    chistar = results.conformal_time(0)- results.tau_maxvis
+    chis = np.linspace(0,chistar,nz)
+    zs=results.redshift_at_comoving_radial_distance(chis)
+    dchis = (chis[2:]-chis[:-2])/2
+    chis = chis[1:-1]
+    zs = zs[1:-1]
+    win = ((chistar-chis)/(chis**2*chistar))**2
+    ls = np.arange(0,lmax+2, dtype=np.float64)
+    cl_kappa=np.zeros(ls.shape)
+    w = np.ones(chis.shape)
+    for i, l in enumerate(ls[2:]):
+        k=(l+0.5)/chis
+        w[:]=1
+        w[k<1e-4]=0
+        w[k>=kmax]=0
+        cl_kappa[i+2] = np.dot(dchis, w*Pfunc.P(zs, k, grid=False)*win/k**4)
+    cl_kappa*= (ls*(ls+1))**2
+    return cl_kappa
+
+
+class LimberTest(unittest.TestCase):
+
+    def test_matches_loop(self):
+        for kmax in [10.,0.5]:
+            ref = limber_loop(Background(),WeylPower(),2998,kmax,100)
+            cl = apslike.get_limber_clkk_flat_universe(Background(),WeylPower(),2998,kmax,100)
+            self.assertTrue(np.allclose(cl,ref,rtol=1e-12,atol=0))
+
+    def test_gauss_legendre(self):
+        converged = apslike.get_limber_clkk_flat_universe(Background(),WeylPower(),2998,10.,4000)
+        gl = apslike.get_limber_clkk_flat_universe(Background(),WeylPower(),2998,10.,50,quadrature='gauss-legendre')
+        trap = apslike.get_limber_clkk_flat_universe(Background(),WeylPower(),2998,10.,50)
+        ls = slice(2,None)
+        gl_err = np.abs(gl[ls]/converged[ls]-1).max()
+        trap_err = np.abs(trap[ls]/converged[ls]-1).max()
+        self.assertLess(gl_err,trap_err)
+        self.assertLess(gl_err,1e-3)
+
+if __name__ == '__main__':
+    unittest.main()
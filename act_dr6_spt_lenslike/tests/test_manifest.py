@@ -0,0 +1,43 @@
+import unittest
+import act_dr6_spt_lenslike as apslike
+import numpy as np
+import os
+import shutil
+import tempfile
+file_dir = os.path.abspath(os.path.dirname(__file__))
+version = apslike.default_version
+data_dir = f"{file_dir}/../data/{version}/"
+
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp,ignore_errors=True)
+
+    def test_manifest_is_complete(self):
+        # Every lens_only variant loads from a directory holding only its manifest files
+        for variant in apslike.variants:
+            ddir = os.path.join(self.tmp,variant)
+            os.makedirs(ddir)
+            for fname in set(apslike.data_manifest(variant,lens_only=True,like_corrections=False).values()):
+                shutil.copy(os.path.join(data_dir,fname),ddir)
+            d1 = apslike.load_data(variant,ddir=ddir,lens_only=True,like_corrections=False)
+            d2 = apslike.load_data(variant,ddir=data_dir,lens_only=True,like_corrections=False)
+            self.assertEqual(set(d1.keys()),set(d2.keys()))
+            for k in d1:
+                self.assertTrue(np.array_equal(d1[k],d2[k]),(variant,k))
+
+    def test_spt3g_manifest(self):
+        files = set(apslike.data_manifest('spt3g',lens_only=True,like_corrections=False).values())
+        self.assertEqual(files,{'muse_likelihood.npz'})
+        files = apslike.data_manifest('act_baseline',lens_only=False,like_corrections=True)
+        self.assertIn('like_corrs/N1der_TT_lmin600_lmax3000_full.txt',files.values())
+        self.assertNotIn('planck_binmat',files)
+        with self.assertRaises(ValueError):
+            apslike.data_manifest('act_polonly',lens_only=False)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import act_dr6_spt_lenslike as apslike
+from act_dr6_spt_lenslike import mocks
+from scipy import stats
+import numpy as np
+import os
+file_dir = os.path.abspath(os.path.dirname(__file__))
+version = apslike.default_version
+data_dir = f"{file_dir}/../data/{version}/"
+
+
+class MocksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.d = apslike.load_data('actplanckspt3g_baseline',lens_only=True,like_corrections=False,ddir=data_dir)
+        # A theory whose chi^2 for the data is close to the expected one
+        nbins = self.d['data_binned_clkk'].size
+        u = np.random.default_rng(0).standard_normal(nbins)
+        u *= np.sqrt(nbins * self.d['hartlap_correction']) / np.linalg.norm(u)
+        self.bclkk = self.d['data_binned_clkk'] - self.d['cov_chol'] @ u
+
+    def test_pte(self):
+        d = self.d
+        nbins = self.bclkk.size
+        h = d['hartlap_correction']
+        nmocks = 50000
+        p, chi2 = mocks.pte(d,self.bclkk,nmocks=nmocks,chunk_size=7000,seed=1)
+        self.assertAlmostEqual(chi2,nbins*h,8)
+        # The chi^2 of the mocks are distributed as h chi^2_nbins
+        expected = stats.chi2.sf(chi2/h,nbins)
+        self.assertLess(abs(p-expected),5*np.sqrt(expected*(1-expected)/nmocks))
+        chi2s = mocks.mock_chi2(d,self.bclkk,nmocks,chunk_size=7000,seed=1)
+        self.assertEqual(np.mean(chi2s>=chi2),p)
+        self.assertLess(abs(np.mean(chi2s)/h-nbins),5*np.sqrt(2*nbins/nmocks))
+
+    def test_chunks(self):
+        ref = np.concatenate(list(mocks.iter_mocks(self.d,self.bclkk,1000,seed=2)))
+        chunked = list(mocks.iter_mocks(self.d,self.bclkk,1000,chunk_size=300,seed=2))
+        self.assertEqual([m.shape[0] for m in chunked],[300,300,300,100])
+        self.assertTrue(np.allclose(np.concatenate(chunked),ref,rtol=1e-12,atol=0))
+        # The covariance of the mocks is that of the data
+        chol = mocks.mock_cholesky(self.d)
+        scale = np.max(np.abs(self.d['cov']))
+        self.assertTrue(np.allclose(chol @ chol.T,self.d['cov'],rtol=0,atol=1e-12*scale))
+
+if __name__ == '__main__':
+    unittest.main()
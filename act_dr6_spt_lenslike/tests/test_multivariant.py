@@ -0,0 +1,50 @@
+import unittest
+import warnings
+import act_dr6_spt_lenslike as apslike
+import numpy as np
+import os
+file_dir = os.path.abspath(os.path.dirname(__file__))
+version = apslike.default_version
+data_dir = f"{file_dir}/../data/{version}/"
+
+
+def spectra(nsamples=None):
+    ell = np.arange(2,4000)
+    cl_kk = 2.1e-7/(1.+(ell/60.)**1.6)
+    if nsamples is not None:
+        cl_kk = cl_kk * np.linspace(0.9,1.1,nsamples)[:,None]
+    zeros = cl_kk*0.
+    return ell,cl_kk,ell,zeros,zeros,zeros,zeros
+
+
+class MultiVariantTest(unittest.TestCase):
+
+    def test_all_variants(self):
+        ml = apslike.MultiVariantLike(lens_only=True,ddir=data_dir)
+        self.assertEqual(ml.variants,apslike.variants)
+        lnlikes = ml.lnlike(*spectra())
+        batch = ml.lnlike(*spectra(3))
+        nbytes = 0
+        for variant in apslike.variants:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                d = apslike.load_data(variant,ddir=data_dir,lens_only=True,like_corrections=False)
+            nbytes += sum(v.nbytes for v in d.values() if isinstance(v,np.ndarray))
+            self.assertAlmostEqual(lnlikes[variant]/apslike.generic_lnlike(d,*spectra()),1.,12)
+            expected = apslike.generic_lnlike_batch(d,*spectra(3))
+            self.assertTrue(np.allclose(batch[variant],expected,rtol=1e-12,atol=0))
+        self.assertLess(ml.nbytes(),nbytes/2)
+
+    def test_subset(self):
+        ml = apslike.MultiVariantLike(['act_baseline','spt3g'],lens_only=True,ddir=data_dir,spt_start=2,spt_end=10)
+        self.assertNotIn('binmat_planck',ml.data)
+        lnlikes = ml.lnlike(*spectra())
+        d = apslike.load_data('spt3g',ddir=data_dir,lens_only=True,like_corrections=False,spt_start=2,spt_end=10)
+        self.assertAlmostEqual(lnlikes['spt3g']/apslike.generic_lnlike(d,*spectra()),1.,12)
+
+    def test_default_variants(self):
+        self.assertEqual(apslike.default_variants(lens_only=True),apslike.variants)
+        self.assertNotIn('act_polonly',apslike.default_variants(lens_only=False))
+
+if __name__ == '__main__':
+    unittest.main()
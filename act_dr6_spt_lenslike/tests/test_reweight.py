@@ -0,0 +1,59 @@
+import unittest
+import act_dr6_spt_lenslike as apslike
+from act_dr6_spt_lenslike import reweight
+import numpy as np
+import os
+import shutil
+import tempfile
+file_dir = os.path.abspath(os.path.dirname(__file__))
+version = apslike.default_version
+data_dir = f"{file_dir}/../data/{version}/"
+
+
+class ReweightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.ell = np.arange(0,3200)
+        cl_kk = 2.1e-7/(1.+((self.ell+1.)/60.)**1.6)
+        cl_kk[:2] = 0
+        self.cl_kk = cl_kk * np.linspace(0.8,1.2,25)[:,None]
+        d = apslike.load_data('actplanckspt3g_baseline',ddir=data_dir,lens_only=True,like_corrections=False)
+        zeros = self.cl_kk*0.
+        self.expected, self.theory = apslike.generic_lnlike_batch(d,self.ell,self.cl_kk,self.ell,zeros,zeros,
+                                                                  zeros,zeros,return_theory=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp,ignore_errors=True)
+
+    def check(self,path,**kwargs):
+        out = os.path.join(self.tmp,'out.txt')
+        n = reweight.reweight(path,out,variant='actplanckspt3g_baseline',lens_only=True,ddir=data_dir,
+                              chunk_size=7,verbose=False,**kwargs)
+        self.assertEqual(n,self.cl_kk.shape[0])
+        table = np.loadtxt(out)
+        self.assertTrue(np.array_equal(table[:,0],np.arange(n)))
+        self.assertTrue(np.allclose(table[:,1],self.expected,rtol=1e-13,atol=0))
+        self.assertTrue(np.allclose(table[:,2],-2*self.expected,rtol=1e-13,atol=0))
+        return table
+
+    def test_npy(self):
+        path = os.path.join(self.tmp,'cls.npy')
+        np.save(path,self.cl_kk)
+        table = self.check(path,theory=True)
+        self.assertTrue(np.allclose(table[:,3:],self.theory,rtol=1e-13,atol=0))
+
+    def test_npz_pool(self):
+        path = os.path.join(self.tmp,'cls.npz')
+        np.savez(path,ell=self.ell,cl_kk=self.cl_kk)
+        self.check(path,nproc=2)
+
+    def test_directory(self):
+        path = os.path.join(self.tmp,'cls')
+        os.makedirs(path)
+        for i,cl in enumerate(self.cl_kk):
+            np.savetxt(os.path.join(path,f'sample_{i:03d}.txt'),np.column_stack([self.ell,cl]))
+        self.check(path)
+
+if __name__ == '__main__':
+    unittest.main()
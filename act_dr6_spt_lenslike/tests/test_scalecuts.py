@@ -0,0 +1,80 @@
+import unittest
+import act_dr6_spt_lenslike as apslike
+import numpy as np
+import os
+file_dir = os.path.abspath(os.path.dirname(__file__))
+version = apslike.default_version
+data_dir = f"{file_dir}/../data/{version}/"
+
+
+def load(variant,**kwargs):
+    return apslike.load_data(variant,ddir=data_dir,lens_only=True,like_corrections=False,**kwargs)
+
+def spectra(nsamples=None):
+    ell = np.arange(2,4000)
+    cl_kk = 2.1e-7/(1.+(ell/60.)**1.6)
+    if nsamples is not None:
+        cl_kk = cl_kk * np.linspace(0.9,1.1,nsamples)[:,None]
+    zeros = cl_kk*0.
+    return ell,cl_kk,ell,zeros,zeros,zeros,zeros
+
+
+class ScaleCutTest(unittest.TestCase):
+
+    def test_variants(self):
+        # Masks of the full data reproduce the baseline and extended variants
+        full = load('actplanckspt3g_baseline',act_bins=(0,None))
+        masks = [apslike.bin_mask(full,act=apslike.act_baseline_bins),
+                 apslike.bin_mask(full,act=apslike.act_extended_bins)]
+        lnlikes = apslike.BinMaskScanner(full,masks).lnlike(*spectra())
+        for lnlike,variant in zip(lnlikes,['actplanckspt3g_baseline','actplanckspt3g_extended']):
+            self.assertAlmostEqual(lnlike/apslike.generic_lnlike(load(variant),*spectra()),1.,12)
+        lnlike = apslike.BinMaskScanner(full,masks[:1],indep=True).lnlike(*spectra())[0]
+        self.assertAlmostEqual(lnlike/apslike.generic_lnlike(load('actplanckspt3g_baseline',indep=True),*spectra()),1.,12)
+
+    def test_hartlap(self):
+        # Masks without Planck bins use the number of ACT simulations, as the
+        # equivalent variants do
+        for union,variant,sel in [('actplanck_baseline','act_baseline',dict(planck=False)),
+                                  ('actplanckspt3g_baseline','actspt3g_baseline',dict(planck=False)),
+                                  ('actplanckspt3g_baseline','actplanck_baseline',dict(spt=False))]:
+            full = load(union,act_bins=(0,None))
+            mask = apslike.bin_mask(full,act=apslike.act_baseline_bins,**sel)
+            scanner = apslike.BinMaskScanner(full,[mask])
+            d = load(variant)
+            self.assertAlmostEqual(scanner.hartlap[0],d['hartlap_correction'],14)
+            self.assertAlmostEqual(scanner.lnlike(*spectra())[0]/apslike.generic_lnlike(d,*spectra()),1.,12)
+
+    def test_spt_range(self):
+        full = load('spt3g')
+        lnlike = apslike.BinMaskScanner(full,[apslike.bin_mask(full,spt=(2,10))]).lnlike(*spectra())[0]
+        self.assertAlmostEqual(lnlike/apslike.generic_lnlike(load('spt3g',spt_start=2,spt_end=10),*spectra()),1.,12)
+
+    def test_random_masks(self):
+        full = load('actplanck_baseline',act_bins=(0,None))
+        rng = np.random.default_rng(0)
+        nbins = full['data_binned_clkk'].size
+        masks = rng.random((50,nbins)) < rng.random((50,1))
+        masks[:,0] = True
+        scanner = apslike.BinMaskScanner(full,masks)
+        lnlikes, bclkk = scanner.lnlike(*spectra(3),return_theory=True)
+        self.assertEqual(lnlikes.shape,(50,3))
+        planck = apslike.bin_segments(full)['planck']
+        for i,mask in enumerate(masks):
+            nsims = full['nsims'] if mask[planck].any() else full['nsims_act']
+            hartlap = (nsims-mask.sum()-2.)/(nsims-1.)
+            cov = full['cov'][np.ix_(mask,mask)] / hartlap
+            delta = (full['data_binned_clkk'] - bclkk)[:,mask]
+            expected = -0.5*np.einsum('ni,ij,nj->n',delta,np.linalg.inv(cov),delta)
+            self.assertTrue(np.allclose(lnlikes[i],expected,rtol=1e-10,atol=0))
+            self.assertAlmostEqual(scanner.logdets[i],np.linalg.slogdet(cov)[1],8)
+
+    def test_mask_range(self):
+        d = load('act_baseline')
+        with self.assertRaises(ValueError):
+            apslike.bin_mask(d,act=(0,None))
+        with self.assertRaises(ValueError):
+            apslike.bin_mask(d,planck=True)
+
+if __name__ == '__main__':
+    unittest.main()
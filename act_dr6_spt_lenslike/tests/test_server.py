@@ -0,0 +1,100 @@
+import unittest
+import act_dr6_spt_lenslike as apslike
+from act_dr6_spt_lenslike.server import LikelihoodServer, LikelihoodClient, recv_message
+import numpy as np
+import json
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+file_dir = os.path.abspath(os.path.dirname(__file__))
+version = apslike.default_version
+data_dir = f"{file_dir}/../data/{version}/"
+variants = ['actplanckspt3g_baseline','spt3g']
+
+
+def spectra(nsamples=None):
+    ell = np.arange(2,4000)
+    cl_kk = 2.1e-7/(1.+(ell/60.)**1.6)
+    if nsamples is not None:
+        cl_kk = cl_kk * np.linspace(0.9,1.1,nsamples)[:,None]
+    zeros = cl_kk*0.
+    return ell,cl_kk,ell,zeros,zeros,zeros,zeros
+
+
+class ServerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.data = {v:apslike.load_data(v,lens_only=True,like_corrections=False,ddir=data_dir) for v in variants}
+        # Long enough for all the concurrent requests below to be batched together
+        cls.server = LikelihoodServer(variants,os.path.join(cls.tmp,'apslike.sock'),lens_only=True,
+                                      ddir=data_dir,max_wait=0.5,verbose=False).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        shutil.rmtree(cls.tmp,ignore_errors=True)
+
+    def test_lnlike(self):
+        with LikelihoodClient(self.server.address) as client:
+            info = client.info()
+            self.assertEqual(sorted(info['variants']),sorted(variants))
+            for variant in variants:
+                d = self.data[variant]
+                lnlike, bclkk = client.generic_lnlike(variant,*spectra(),return_theory=True)
+                elnlike, ebclkk = apslike.generic_lnlike(d,*spectra(),return_theory=True)
+                self.assertAlmostEqual(lnlike,elnlike,places=10)
+                self.assertTrue(np.allclose(bclkk,ebclkk,rtol=1e-12,atol=0))
+                lnlikes = client.generic_lnlike_batch(variant,*spectra(5))
+                self.assertTrue(np.allclose(lnlikes,apslike.generic_lnlike_batch(d,*spectra(5)),rtol=1e-12,atol=0))
+            with self.assertRaises(RuntimeError):
+                client.generic_lnlike('act_baseline',*spectra())
+            # The connection is still usable after an error
+            self.assertEqual(len(client.info()['variants']),len(variants))
+
+    def test_batching(self):
+        nclients = 6
+        lnlikes = [None]*nclients
+        barrier = threading.Barrier(nclients)
+        def run(i):
+            with LikelihoodClient(self.server.address) as client:
+                ell,cl_kk,*cmb = spectra()
+                barrier.wait()
+                lnlikes[i] = client.generic_lnlike(variants[0],ell,cl_kk*(1.+0.02*i),*cmb)
+        nbatches = self.server.nbatches
+        threads = [threading.Thread(target=run,args=(i,)) for i in range(nclients)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        ell,cl_kk,*cmb = spectra()
+        for i in range(nclients):
+            expected = apslike.generic_lnlike(self.data[variants[0]],ell,cl_kk*(1.+0.02*i),*cmb)
+            self.assertAlmostEqual(lnlikes[i],expected,places=10)
+        self.assertLess(self.server.nbatches-nbatches,nclients)
+
+    def test_malformed_header(self):
+        headers = [{'method':'info','arrays':[['|O',[4]]]},
+                   {'method':'info','arrays':[['<f8',[1<<40]]]},
+                   {'method':'info','arrays':[['<f8',[1]*8]]},
+                   {'method':'info','arrays':[['<f8',[-1]]]},
+                   {'method':'info','arrays':'<f8'},
+                   [1,2]]
+        for header in headers+[b'{not json']:
+            hbytes = header if isinstance(header,bytes) else json.dumps(header).encode()
+            with socket.socket(socket.AF_UNIX,socket.SOCK_STREAM) as sock:
+                sock.settimeout(10)
+                sock.connect(self.server.address)
+                sock.sendall(struct.pack('!I',len(hbytes)) + hbytes)
+                out, arrays = recv_message(sock)
+                self.assertIn('MessageError',out['error'])
+                # The server closes the connection
+                self.assertEqual(sock.recv(1<<16),b'')
+        # and keeps serving the others
+        with LikelihoodClient(self.server.address) as client:
+            self.assertEqual(len(client.info()['variants']),len(variants))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,242 @@
+"""
+Benchmarks for the ACT DR6 (+SPT) lensing likelihood.
+
+For every entry of act_dr6_spt_lenslike.variants, with lens_only both True
+and False, this measures
+- the wall time of load_data,
+- the peak resident memory of the process and the memory held by each
+  entry of the returned data_dict,
+- the latency percentiles and throughput of generic_lnlike (single calls)
+  and of generic_lnlike_batch (batches of theory spectra).
+
+Each case runs in a fresh process, so that the peak memory of one variant
+does not contaminate the next. Cases that cannot run with the available
+data (e.g. lens_only=False without the like_corrs files, or combinations
+that load_data does not support) are recorded as skipped.
+
+Usage:
+    python benchmarks/bench_lenslike.py -o results.json
+    python benchmarks/bench_lenslike.py -o new.json --compare results.json
+
+With --compare, the new results are checked against an earlier results
+file and the script exits with status 1 if any metric regressed by more
+than --tolerance (as a fraction).
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import platform
+import subprocess
+import sys
+import time
+import traceback
+import numpy as np
+# Allow running from a checkout without installing the package
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Metrics compared by --compare; all are "lower is better"
+compare_metrics = ['load_time','peak_rss','data_nbytes','single.p50','single.p90','batch.p50_per_sample']
+
+def _peak_rss():
+    # Peak resident set size of this process, in bytes
+    import resource
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform=='darwin' else maxrss*1024
+
+def _nbytes(v):
+    return int(v.nbytes) if isinstance(v,np.ndarray) else 0
+
+def _percentiles(times):
+    times = np.asarray(times)
+    return {'mean':float(times.mean()),'p50':float(np.percentile(times,50)),
+            'p90':float(np.percentile(times,90)),'p99':float(np.percentile(times,99)),
+            'min':float(times.min())}
+
+def theory_spectra(ddir,lmax=5000):
+    """
+    Theory spectra (ell_kk,cl_kk,ell_cmb,cl_tt,cl_ee,cl_te,cl_bb) to evaluate
+    the likelihood at: the fiducial spectra if the like_corrs files are
+    available, and otherwise smooth analytic approximations.
+    """
+    fcmb = f"{ddir}/like_corrs/cosmo2017_10K_acc3_lensedCls.dat"
+    fkk = f"{ddir}/like_corrs/cosmo2017_10K_acc3_lenspotentialCls.dat"
+    if os.path.exists(fcmb) and os.path.exists(fkk):
+        ell, tt, ee, bb, te = np.loadtxt(fcmb,unpack=True,max_rows=lmax-1)
+        ellp, dd = np.loadtxt(fkk,unpack=True,usecols=[0,5],max_rows=lmax-1)
+        prefac = 2*np.pi/ell/(ell+1.)
+        return ellp, dd*2*np.pi/4., ell, tt*prefac, ee*prefac, te*prefac, bb*prefac
+    ell = np.arange(2,lmax+1,dtype=np.float64)
+    cl_kk = 2e-7/(1.+(ell/60.)**1.6)
+    damp = np.exp(-(ell/1500.)**1.3)
+    cl_tt = 2e3/(ell*(ell+1.))*2*np.pi*damp*(1.+0.3*np.cos(ell/45.))
+    cl_ee = 0.05*cl_tt*(1.+0.5*np.sin(ell/45.))
+    cl_te = 0.2*cl_tt*np.cos(ell/45.)
+    cl_bb = 1e-3*cl_ee
+    return ell, cl_kk, ell, cl_tt, cl_ee, cl_te, cl_bb
+
+def run_case(variant,lens_only,ddir=None,nrepeat=200,batch_size=64,nbatch=10,cache_dir=None,seed=0):
+    """
+    Benchmark a single (variant,lens_only) case in the current process and
+    return a dictionary of results.
+    """
+    import act_dr6_spt_lenslike as apslike
+    out = {'variant':variant,'lens_only':lens_only}
+    ddir, _ = apslike.act_dr6_spt_lenslike._data_dir(ddir)
+    rss0 = _peak_rss()
+    t0 = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            d = apslike.load_data(variant,ddir=ddir,lens_only=lens_only,
+                                  like_corrections=not(lens_only),cache_dir=cache_dir)
+    except (ValueError,OSError) as e:
+        out['status'] = 'skipped'
+        out['reason'] = f"{type(e).__name__}: {e}"
+        return out
+    out['load_time'] = time.perf_counter()-t0
+    out['peak_rss_before_load'] = rss0
+    out['peak_rss_after_load'] = _peak_rss()
+    out['data_nbytes_per_key'] = {k:_nbytes(v) for k,v in d.items() if isinstance(v,np.ndarray)}
+    out['data_nbytes'] = int(sum(out['data_nbytes_per_key'].values()))
+    out['nbins'] = int(d['data_binned_clkk'].size)
+
+    ell_kk, cl_kk, ell_cmb, cl_tt, cl_ee, cl_te, cl_bb = theory_spectra(ddir)
+    rng = np.random.default_rng(seed)
+    # Perturb the amplitudes from call to call so that nothing can be reused
+    amps = 1.+0.05*rng.standard_normal((nrepeat,5))
+    for a in amps[:min(5,nrepeat)]:
+        apslike.generic_lnlike(d,ell_kk,cl_kk*a[0],ell_cmb,cl_tt*a[1],cl_ee*a[2],cl_te*a[3],cl_bb*a[4])
+    times = []
+    for a in amps:
+        t0 = time.perf_counter()
+        apslike.generic_lnlike(d,ell_kk,cl_kk*a[0],ell_cmb,cl_tt*a[1],cl_ee*a[2],cl_te*a[3],cl_bb*a[4])
+        times.append(time.perf_counter()-t0)
+    out['single'] = _percentiles(times)
+    out['single']['throughput'] = len(times)/float(np.sum(times))
+
+    bamps = 1.+0.05*rng.standard_normal((nbatch,5,batch_size,1))
+    times = []
+    for a in bamps:
+        args = (ell_kk,cl_kk*a[0],ell_cmb,cl_tt*a[1],cl_ee*a[2],cl_te*a[3],cl_bb*a[4])
+        t0 = time.perf_counter()
+        apslike.generic_lnlike_batch(d,*args)
+        times.append(time.perf_counter()-t0)
+    out['batch'] = _percentiles(times)
+    out['batch']['batch_size'] = batch_size
+    out['batch']['p50_per_sample'] = out['batch']['p50']/batch_size
+    out['batch']['throughput'] = batch_size*len(times)/float(np.sum(times))
+
+    out['peak_rss'] = _peak_rss()
+    out['status'] = 'ok'
+    return out
+
+def _run_case_safely(kwargs):
+    try:
+        return run_case(**kwargs)
+    except Exception:
+        return {'variant':kwargs['variant'],'lens_only':kwargs['lens_only'],
+                'status':'error','reason':traceback.format_exc()}
+
+def run_all(variants=None,lens_only_modes=(True,False),**kwargs):
+    """
+    Run every (variant,lens_only) case, each in a fresh (spawned) process.
+    """
+    import act_dr6_spt_lenslike as apslike
+    if variants is None:
+        variants = apslike.variants
+    ctx = mp.get_context('spawn')
+    results = []
+    for variant in variants:
+        for lens_only in lens_only_modes:
+            with ctx.Pool(1) as pool:
+                r = pool.apply(_run_case_safely,(dict(kwargs,variant=variant,lens_only=lens_only),))
+            results.append(r)
+            print(summary_line(r),flush=True)
+    return results
+
+def metadata():
+    import act_dr6_spt_lenslike as apslike
+    import scipy
+    try:
+        repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        commit = subprocess.run(['git','-C',repo,'rev-parse','HEAD'],capture_output=True,
+                                text=True,check=True).stdout.strip()
+    except (OSError,subprocess.CalledProcessError):
+        commit = None
+    return {'time':time.strftime('%Y-%m-%dT%H:%M:%S%z'),'commit':commit,
+            'python':platform.python_version(),'numpy':np.__version__,'scipy':scipy.__version__,
+            'platform':platform.platform(),'machine':platform.machine(),'cpu_count':os.cpu_count(),
+            'data_version':apslike.default_version}
+
+def case_name(r):
+    return f"{r['variant']}{' lens_only' if r['lens_only'] else ''}"
+
+def summary_line(r):
+    name = case_name(r)
+    if r['status']!='ok':
+        reason = r['reason'].strip().splitlines()[-1]
+        return f"{name:36s} {r['status']}: {reason}"
+    return (f"{name:36s} load {r['load_time']:7.3f} s  rss {r['peak_rss']/2**20:8.1f} MB  "
+            f"data {r['data_nbytes']/2**20:8.1f} MB  single p50 {r['single']['p50']*1e3:7.3f} ms  "
+            f"batch {r['batch']['throughput']:9.1f} /s")
+
+def _get(r,metric):
+    for k in metric.split('.'):
+        r = r[k]
+    return r
+
+def compare(results,reference,tolerance=0.2):
+    """
+    Compare results against reference results (both lists of case results)
+    and return a list of (case,metric,old,new) for every metric that is
+    more than a fraction tolerance worse than in the reference.
+    """
+    ref = {(r['variant'],r['lens_only']):r for r in reference if r['status']=='ok'}
+    regressions = []
+    for r in results:
+        old = ref.get((r['variant'],r['lens_only']))
+        if old is None or r['status']!='ok': continue
+        for m in compare_metrics:
+            try:
+                o, n = _get(old,m), _get(r,m)
+            except KeyError:
+                continue
+            flag = n>o*(1.+tolerance)
+            print(f"{case_name(r):36s} {m:22s} {o:12.5g} -> {n:12.5g} ({n/o-1.:+7.1%}){'  REGRESSION' if flag else ''}")
+            if flag: regressions.append((case_name(r),m,o,n))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-o','--output',default='bench_results.json',help='Output JSON file.')
+    parser.add_argument('--ddir',default=None,help='Data directory (default: the bundled data).')
+    parser.add_argument('--variants',nargs='+',default=None,help='Variants to run (default: all).')
+    parser.add_argument('--lens-only',choices=['both','true','false'],default='both')
+    parser.add_argument('--nrepeat',type=int,default=200,help='Number of timed single calls.')
+    parser.add_argument('--batch-size',type=int,default=64)
+    parser.add_argument('--nbatch',type=int,default=10,help='Number of timed batched calls.')
+    parser.add_argument('--cache-dir',default=None,help='Pass a cache_dir to load_data.')
+    parser.add_argument('--compare',default=None,help='Earlier results file to compare against.')
+    parser.add_argument('--tolerance',type=float,default=0.2,help='Allowed fractional slowdown with --compare.')
+    args = parser.parse_args(argv)
+
+    modes = {'both':(True,False),'true':(True,),'false':(False,)}[args.lens_only]
+    results = run_all(args.variants,modes,ddir=args.ddir,nrepeat=args.nrepeat,
+                      batch_size=args.batch_size,nbatch=args.nbatch,cache_dir=args.cache_dir)
+    with open(args.output,'w') as f:
+        json.dump({'metadata':metadata(),'results':results},f,indent=1)
+    print(f"Wrote {args.output}")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            reference = json.load(f)['results']
+        regressions = compare(results,reference,args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())